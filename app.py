@@ -1,6 +1,9 @@
 import os
-from flask import Flask, render_template, request, session, redirect, url_for
-from search_google import search_google
+from flask import Flask, Response, abort, render_template, request, session, redirect, url_for, jsonify
+from jobs import JobQueue, JOB_WORKERS
+from async_pipeline import search_async, extract_listing
+import thumbs
+from listing import to_dicts
 
 app = Flask(__name__)
 # Cần secret key để dùng session (đặt biến môi trường khi deploy)
@@ -10,13 +13,26 @@ app.secret_key = os.getenv("FLASK_SECRET_KEY", "dev-secret")
 BATCH_SIZE = 10
 MAX_BATCHES = 3  # 10 x 3 = 30 tin tối đa
 
-def _slice_results(batch_index: int):
+# Crawl chạy nền: route chỉ submit job rồi trả về ngay (JOB_WORKERS=0 -> chạy worker ở process riêng: python jobs.py)
+QUEUE = JobQueue()
+QUEUE.start(JOB_WORKERS)
+
+@app.template_filter("thumb")
+def _thumb_filter(url: str) -> str:
+    """Ảnh gốc -> URL proxy thumbnail (đã ký) để template không hotlink ảnh full-size."""
+    return thumbs.thumb_url(url, route=url_for("image_proxy"))
+
+def _slice_results(job: dict | None, batch_index: int):
     """Trả về (list kết quả đã cắt theo batch, còn_more: bool)."""
-    results = session.get("results_store", [])
+    results = (job or {}).get("results") or []
     n = min(batch_index * BATCH_SIZE, len(results))
     has_more = batch_index < MAX_BATCHES and n < len(results)
     return results[:n], has_more
 
+def _current_job():
+    job_id = session.get("job_id")
+    return QUEUE.get(job_id) if job_id else None
+
 @app.route("/", methods=["GET", "POST"])
 def index():
     if request.method == "POST":
@@ -24,41 +40,82 @@ def index():
         query = (request.form.get("query") or "").strip()
         if not query:
             # không nhập gì -> hiển thị rỗng
-            return render_template("index.html", query="", results=[], has_more=False)
+            return render_template("index.html", query="", results=[], has_more=False, job=None)
 
-        # Lấy tối đa 30 tin trước (để bấm thêm 2 lần nữa)
-        try:
-            all_results = search_google(query, target_total=BATCH_SIZE * MAX_BATCHES)
-        except TypeError:
-            # nếu search_google(query) cũ không nhận target_total thì fallback
-            all_results = search_google(query)
+        # Lấy tối đa 30 tin trước (để bấm thêm 2 lần nữa) — chạy nền, không giữ worker web
+        job_id = QUEUE.submit(query, target_total=BATCH_SIZE * MAX_BATCHES)
 
-        # Lưu trạng thái vào session
+        # Session chỉ giữ job_id (kết quả nằm trong JOBS_DB, cookie không phình)
         session["current_query"] = query
-        session["results_store"] = all_results or []
+        session["job_id"] = job_id
         session["batch_index"] = 1  # hiển thị 10 tin đầu
+        return redirect(url_for("index"))
 
-        sliced, has_more = _slice_results(session["batch_index"])
-        return render_template("index.html", query=query, results=sliced, has_more=has_more)
-
-    # GET: nếu đã có session thì giữ nguyên kết quả hiện tại
+    # GET: nếu đã có session thì giữ nguyên kết quả hiện tại / hiển thị tiến độ job
     query = session.get("current_query", "")
     batch_index = session.get("batch_index", 0)
-    results, has_more = _slice_results(batch_index) if batch_index else ([], False)
-    return render_template("index.html", query=query, results=results, has_more=has_more)
+    job = _current_job()
+    results, has_more = _slice_results(job, batch_index) if batch_index else ([], False)
+    return render_template("index.html", query=query, results=results, has_more=has_more, job=job)
 
 @app.route("/crawl_more", methods=["POST"])
 def crawl_more():
     # Không có state thì quay về trang chính
-    if "results_store" not in session:
+    if "job_id" not in session:
         return redirect(url_for("index"))
 
     # Tăng batch, giới hạn tối đa
     session["batch_index"] = min(session.get("batch_index", 1) + 1, MAX_BATCHES)
+    return redirect(url_for("index"))
 
-    query = session.get("current_query", "")
-    results, has_more = _slice_results(session["batch_index"])
-    return render_template("index.html", query=query, results=results, has_more=has_more)
+@app.route("/jobs/<job_id>")
+def job_status(job_id: str):
+    """Tiến độ job (JSON) để poll: status, done/total; có results khi status=done."""
+    job = QUEUE.get(job_id)
+    if not job:
+        return jsonify({"error": "not found"}), 404
+    if job["status"] != "done":
+        job.pop("results", None)
+    return jsonify(job)
+
+@app.route("/img")
+def image_proxy():
+    """Thumbnail từ cache đĩa (tải + resize lần đầu). Chỉ phục vụ URL đã ký bởi filter `thumb`."""
+    url = request.args.get("u", "")
+    if not thumbs.verify(url, request.args.get("s", "")):
+        abort(403)
+    try:
+        data, mime = thumbs.get_thumb(url)
+    except Exception:
+        return redirect(url)  # không tải/resize được -> để trình duyệt tự lấy ảnh gốc
+    resp = Response(data, mimetype=mime)
+    resp.headers["Cache-Control"] = "public, max-age=604800, immutable"
+    return resp
+
+# ===== JSON API (async view: cần `pip install "flask[async]"`) =====
+@app.route("/api/search")
+async def api_search():
+    """GET /api/search?q=...&n=30 -> {"query", "count", "results": [...]}"""
+    query = (request.args.get("q") or "").strip()
+    if not query:
+        return jsonify({"error": "missing q"}), 400
+    try:
+        n = max(1, min(int(request.args.get("n", BATCH_SIZE * MAX_BATCHES)), 100))
+    except ValueError:
+        return jsonify({"error": "invalid n"}), 400
+    try:
+        results = await search_async(query, target_total=n)
+    except RuntimeError as e:  # thiếu API key / lỗi Google API
+        return jsonify({"error": str(e)}), 502
+    return jsonify({"query": query, "count": len(results), "results": to_dicts(results)})
+
+@app.route("/api/listing")
+async def api_listing():
+    """GET /api/listing?url=<link chi tiết> -> dict tin rao"""
+    url = (request.args.get("url") or "").strip()
+    if not url.startswith(("http://", "https://")):
+        return jsonify({"error": "missing or invalid url"}), 400
+    return jsonify((await extract_listing(url)).to_dict())
 
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", 5000))
@@ -0,0 +1,59 @@
+# async_pipeline.py
+# Bản asyncio của search_google cho API JSON (Flask async view / ASGI).
+# Không có stack gom link / tải riêng: link chi tiết lấy từ search_aggregator.iter_detail_links, mỗi tin trích xuất
+# bằng crawler.extract_info_generic (qua search_google._extract_one: trang lỗi mà có card tóm tắt thì dùng card)
+# -> cùng throttle, circuit breaker, single-flight, hedge, Google Cache fallback với bản đồng bộ.
+# Các hàm đồng bộ chạy trong thread (asyncio.to_thread copy contextvars -> deadline đi theo); event loop chỉ
+# điều phối: link nào về là trích xuất ngay, tối đa ASYNC_CONCURRENCY tin cùng lúc.
+from __future__ import annotations
+import asyncio
+import os
+from typing import List
+
+import deadline as dl
+from listing import Listing
+from search_aggregator import iter_detail_links, query_filters
+from search_google import FETCH_DETAILS, SEARCH_TIME_BUDGET, _extract_one
+
+ASYNC_CONCURRENCY = int(os.getenv("ASYNC_CONCURRENCY", "16") or "16")   # số tin trích xuất song song / search
+
+
+async def extract_listing(link: str) -> Listing:
+    """Trích xuất 1 tin (crawler.extract_info_generic) mà không chặn event loop."""
+    return await asyncio.to_thread(_extract_one, link, None, True)
+
+
+async def search_async(query: str, target_total: int = 30,
+                       time_budget: float = SEARCH_TIME_BUDGET) -> List[Listing]:
+    """
+    Bản async của search_google.search_google: link chi tiết từ iter_detail_links (mọi site đã đăng ký, ghép theo
+    priority/quota), trích xuất tối đa ASYNC_CONCURRENCY tin cùng lúc, lọc theo bộ lọc tách từ câu tìm kiếm.
+    time_budget: deadline cho mọi request bên dưới (deadline.py; task asyncio / to_thread đều kế thừa).
+    """
+    with dl.deadline(time_budget):
+        return await _search_async(query, target_total)
+
+
+async def _search_async(query: str, target_total: int) -> List[Listing]:
+    target_total = int(target_total or 30)
+    sq = query_filters(query)
+    cards: dict = {}   # link chi tiết -> card tóm tắt (điền bởi iter_detail_links)
+    links = iter_detail_links(query, target_total, cards=cards, sq=sq)
+    sem = asyncio.Semaphore(ASYNC_CONCURRENCY)
+    tasks: List[asyncio.Task] = []
+
+    async def _one(link: str) -> Listing:
+        async with sem:
+            return await asyncio.to_thread(_extract_one, link, cards.get(link), FETCH_DETAILS)
+
+    try:
+        while True:
+            # generator đồng bộ (chờ producer / CSE) -> lấy từng link trong thread
+            link = await asyncio.to_thread(next, links, None)
+            if link is None:
+                break
+            tasks.append(asyncio.create_task(_one(link)))
+    finally:
+        await asyncio.to_thread(links.close)   # báo producer của search_aggregator dừng
+    results = await asyncio.gather(*tasks)
+    return [r for r in results if sq is None or sq.listing_ok(r)]
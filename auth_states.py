@@ -0,0 +1,219 @@
+# auth_states.py
+# Pool storage_state Playwright (cookie + localStorage đã qua CAPTCHA) theo domain.
+# - Mỗi domain nhiều state: <AUTH_STATE_DIR>/<domain>/<tên>.json, cộng file cũ SiteSpec.storage_state
+#   (vd. auth_alonhadat.json) nếu có. Tạo bằng tay: python save_auth.py <url>.
+# - acquire(): các context chạy song song được chia đều ra các state (ít người dùng nhất, block rate thấp
+#   nhất, mới nhất) thay vì cùng dùng 1 cookie -> site không thấy 1 phiên mở hàng chục tab cùng lúc.
+# - release(): theo dõi kết quả từng state (cửa sổ AUTH_WINDOW lượt gần nhất). Bị chặn nhiều -> state bị
+#   "cách ly" AUTH_COOLDOWN giây rồi mới thử lại; quá AUTH_MAX_AGE giây không được làm mới -> bỏ
+#   (trừ file SiteSpec.storage_state: vẫn dùng như trước khi có pool, chỉ bị cách ly khi bị chặn nhiều).
+# - Lượt tải thành công -> ghi lại state từ chính context đó (cookie được gia hạn, cf_clearance mới...),
+#   tối đa 1 lần / AUTH_REFRESH_EVERY giây cho mỗi state. Domain có khai báo storage_state mà pool chưa đủ
+#   AUTH_STATES_PER_DOMAIN state thì phiên thành công được lưu thành state mới.
+from __future__ import annotations
+import glob
+import json
+import os
+import re
+import threading
+import time
+import weakref
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+
+AUTH_STATE_DIR = os.getenv("AUTH_STATE_DIR", "auth_states")
+AUTH_STATES_PER_DOMAIN = int(os.getenv("AUTH_STATES_PER_DOMAIN", "4") or "4")
+AUTH_MAX_AGE = int(os.getenv("AUTH_MAX_AGE", str(3 * 24 * 3600)) or "0")    # giây; 0 = không giới hạn
+AUTH_REFRESH_EVERY = int(os.getenv("AUTH_REFRESH_EVERY", "600") or "600")   # giây giữa 2 lần ghi lại 1 state
+AUTH_WINDOW = int(os.getenv("AUTH_WINDOW", "10") or "10")                   # số lượt gần nhất tính block rate
+AUTH_MAX_BLOCK_RATE = float(os.getenv("AUTH_MAX_BLOCK_RATE", "0.5") or "0.5")
+AUTH_MIN_SAMPLES = int(os.getenv("AUTH_MIN_SAMPLES", "3") or "3")
+AUTH_COOLDOWN = int(os.getenv("AUTH_COOLDOWN", "1800") or "1800")           # giây cách ly state bị chặn nhiều
+_RESCAN_EVERY = 30.0                                                         # giây giữa 2 lần quét thư mục
+
+
+class AuthState:
+    """1 file storage_state + thống kê dùng trong process."""
+
+    def __init__(self, domain: str, path: str, legacy: bool = False):
+        self.domain = domain
+        self.path = path
+        self.legacy = legacy   # file SiteSpec.storage_state: không áp AUTH_MAX_AGE
+        self.in_use = 0
+        self.outcomes: Deque[bool] = deque(maxlen=max(1, AUTH_WINDOW))   # True = bị chặn
+        self.quarantined_until = 0.0
+        self.refreshed_at = 0.0
+
+    def saved_at(self) -> float:
+        try:
+            return os.path.getmtime(self.path)
+        except OSError:
+            return 0.0
+
+    def age(self) -> float:
+        saved = self.saved_at()
+        return float("inf") if not saved else time.time() - saved
+
+    def block_rate(self) -> float:
+        return sum(self.outcomes) / len(self.outcomes) if self.outcomes else 0.0
+
+    def usable(self, now: float) -> bool:
+        if not os.path.exists(self.path) or now < self.quarantined_until:
+            return False
+        return self.legacy or not AUTH_MAX_AGE or self.age() <= AUTH_MAX_AGE
+
+    def to_dict(self) -> dict:
+        return {
+            "path": self.path,
+            "legacy": self.legacy,
+            "age": round(self.age()),
+            "in_use": self.in_use,
+            "block_rate": round(self.block_rate(), 2),
+            "samples": len(self.outcomes),
+            "quarantined": self.quarantined_until > time.monotonic(),
+        }
+
+
+class AuthStatePool:
+    def __init__(self, root: str = AUTH_STATE_DIR):
+        self.root = root
+        self._states: Dict[str, Dict[str, AuthState]] = {}   # domain -> path -> state
+        self._scanned: Dict[str, float] = {}
+        self._legacy: Dict[str, str] = {}                     # domain -> file SiteSpec.storage_state
+        self._seeded: "weakref.WeakSet" = weakref.WeakSet()   # context đã được lưu thành state (context ấm)
+        self._lock = threading.Lock()
+
+    def _dir(self, domain: str) -> str:
+        return os.path.join(self.root, domain)
+
+    def _scan(self, domain: str, legacy: str = "") -> Dict[str, AuthState]:
+        """Đồng bộ danh sách state với thư mục (file mới do save_auth.py tạo / file bị xoá). Gọi khi giữ lock."""
+        states = self._states.setdefault(domain, {})
+        if legacy:
+            self._legacy[domain] = legacy
+        legacy = self._legacy.get(domain, "")
+        now = time.monotonic()
+        if now - self._scanned.get(domain, -_RESCAN_EVERY) < _RESCAN_EVERY:
+            return states
+        self._scanned[domain] = now
+        paths = set(glob.glob(os.path.join(self._dir(domain), "*.json")))
+        if legacy and os.path.exists(legacy):
+            paths.add(legacy)
+        for path in paths - set(states):
+            states[path] = AuthState(domain, path, legacy=path == legacy)
+        for path in set(states) - paths:
+            if not states[path].in_use:
+                del states[path]
+        return states
+
+    def states(self, domain: str, legacy: str = "") -> List[AuthState]:
+        with self._lock:
+            return list(self._scan(domain, legacy).values())
+
+    def acquire(self, domain: str, legacy: str = "") -> Optional[AuthState]:
+        """State dùng cho 1 context mới (gọi release() khi xong); None nếu domain chưa có state dùng được."""
+        with self._lock:
+            now = time.monotonic()
+            usable = [s for s in self._scan(domain, legacy).values() if s.usable(now)]
+            if not usable:
+                return None
+            best = min(usable, key=lambda s: (s.in_use, s.block_rate(), -s.saved_at()))
+            best.in_use += 1
+            return best
+
+    def release(self, state: Optional[AuthState], blocked: Optional[bool] = None, ctx: Any = None,
+                domain: str = "", managed: bool = False) -> None:
+        """Trả state đã acquire() (kèm báo kết quả lượt cuối, xem report)."""
+        self.report(state, blocked, ctx, domain, managed)
+        if state is not None:
+            with self._lock:
+                state.in_use = max(0, state.in_use - 1)
+
+    def report(self, state: Optional[AuthState], blocked: Optional[bool], ctx: Any = None,
+               domain: str = "", managed: bool = False) -> None:
+        """
+        Báo kết quả 1 trang tải bằng state (không trả state — context dùng lại cho nhiều trang gọi nhiều lần).
+        blocked: True = CAPTCHA/chặn, False = tải được, None = lỗi khác (không tính).
+        ctx: BrowserContext còn mở (phải gọi trên thread của context) để ghi lại cookie khi thành công.
+        state=None + managed=True (domain có khai báo storage_state): phiên thành công được lưu thành state mới
+        nếu pool của domain còn thiếu.
+        """
+        if state is None:
+            if managed and blocked is False and ctx is not None and domain:
+                with self._lock:
+                    n = len(self._scan(domain))
+                    seeded = _in(self._seeded, ctx)
+                if n < AUTH_STATES_PER_DOMAIN and not seeded:
+                    try:
+                        self.save(domain, ctx)
+                        with self._lock:
+                            self._seeded.add(ctx)
+                    except (OSError, TypeError):   # TypeError: object không weakref được
+                        pass  # không ghi được thư mục state: bỏ qua, lượt tải vẫn thành công
+            return
+        refresh = False
+        with self._lock:
+            if blocked is not None:
+                state.outcomes.append(blocked)
+            if len(state.outcomes) >= AUTH_MIN_SAMPLES and state.block_rate() > AUTH_MAX_BLOCK_RATE:
+                state.quarantined_until = time.monotonic() + AUTH_COOLDOWN
+                state.outcomes.clear()   # hết cách ly thì tính lại từ đầu
+            now = time.monotonic()
+            if blocked is False and ctx is not None and now - state.refreshed_at >= AUTH_REFRESH_EVERY:
+                state.refreshed_at = now
+                refresh = True
+        if refresh:
+            _write_state(ctx, state.path)
+
+    def save(self, domain: str, ctx: Any, name: str = "") -> str:
+        """Lưu storage_state của ctx thành 1 state của domain; trả đường dẫn file."""
+        name = re.sub(r"[^\w.-]+", "-", name) if name else time.strftime("%Y%m%d-%H%M%S") + f"-{os.getpid()}-{threading.get_ident() % 10000}"
+        path = os.path.join(self._dir(domain), f"{name}.json")
+        os.makedirs(self._dir(domain), exist_ok=True)
+        _write_state(ctx, path)
+        with self._lock:
+            self._states.setdefault(domain, {}).setdefault(path, AuthState(domain, path))
+        return path
+
+    def stats(self) -> Dict[str, List[dict]]:
+        with self._lock:
+            return {dom: [s.to_dict() for s in states.values()] for dom, states in self._states.items()}
+
+
+def _in(ws: "weakref.WeakSet", obj: Any) -> bool:
+    try:
+        return obj in ws
+    except TypeError:
+        return False
+
+
+def cookies_of(path: str) -> List[dict]:
+    """Cookie trong file storage_state (persistent context không nhận tham số storage_state)."""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return list(json.load(f).get("cookies") or [])
+    except (OSError, ValueError, AttributeError):
+        return []
+
+
+def _write_state(ctx: Any, path: str) -> None:
+    """ctx.storage_state -> file tạm rồi đổi tên: context khác đang đọc file không thấy file ghi dở."""
+    tmp = f"{path}.{threading.get_ident()}.tmp"
+    try:
+        ctx.storage_state(path=tmp)
+        os.replace(tmp, path)
+    except Exception:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+
+
+_DEFAULT: Optional[AuthStatePool] = None
+
+
+def default_pool() -> AuthStatePool:
+    global _DEFAULT
+    if _DEFAULT is None:
+        _DEFAULT = AuthStatePool()
+    return _DEFAULT
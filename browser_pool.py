@@ -0,0 +1,211 @@
+# browser_pool.py
+# Pool Chromium (Playwright sync API) dùng chung cho fetchers + crawler.
+# Object Playwright sync chỉ dùng được trên thread đã tạo ra nó, nên mỗi worker thread giữ 1 browser riêng
+# và nhận việc qua hàng đợi: caller gửi fn(browser) -> worker chạy -> trả kết quả qua Future.
+# Bỏ được chi phí launch Chromium (~1-2s) mỗi lần fetch.
+# Context "ấm" (warm_context): mỗi worker giữ 1 context / domain và mở trang mới từ đó -> cookie, localStorage,
+# service worker và HTTP cache (bundle JS/CSS của site) còn nguyên giữa các trang chi tiết, không tải lại.
+# Có BROWSER_PROFILE_DIR -> persistent context (profile riêng / domain / worker): cache nằm trên đĩa, còn cả
+# sau khi relaunch / restart process.
+from __future__ import annotations
+import os
+import queue
+import re
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+BROWSER_POOL_SIZE = int(os.getenv("BROWSER_POOL_SIZE", "2") or "2")       # 0 = tắt pool, launch mỗi lần
+BROWSER_MAX_JOBS = int(os.getenv("BROWSER_MAX_JOBS", "200") or "200")     # relaunch sau N lượt (chống rò RAM)
+BROWSER_WARM = os.getenv("BROWSER_WARM", "1") != "0"                      # 0 -> mỗi fetch 1 context mới như cũ
+BROWSER_WARM_PAGES = int(os.getenv("BROWSER_WARM_PAGES", "50") or "50")   # tạo lại context ấm sau N trang
+BROWSER_WARM_TTL = int(os.getenv("BROWSER_WARM_TTL", "900") or "900")     # giây sống tối đa của 1 context ấm
+BROWSER_PROFILE_DIR = os.getenv("BROWSER_PROFILE_DIR", "")                # rỗng = context thường (cache trong RAM)
+
+# trạng thái riêng của từng worker thread: context ấm theo domain, tên slot (đặt tên thư mục profile)
+_local = threading.local()
+
+
+class WarmContext:
+    """1 BrowserContext dùng lại cho nhiều trang của 1 domain trên 1 worker."""
+
+    def __init__(self, ctx: Any, data: Any = None, on_close: Optional[Callable[[Any], None]] = None):
+        self.ctx = ctx
+        self.data = data            # dữ liệu của caller (vd. storage_state đang dùng)
+        self.on_close = on_close
+        self.created = time.monotonic()
+        self.pages = 0
+        self.broken = False         # caller đặt True khi context hỏng / bị chặn -> tạo lại ở lần sau
+
+    def stale(self) -> bool:
+        return (self.broken or self.pages >= BROWSER_WARM_PAGES
+                or time.monotonic() - self.created > BROWSER_WARM_TTL)
+
+    def close(self) -> None:
+        _quietly(self.ctx.close)
+        if self.on_close is not None:
+            _quietly(lambda: self.on_close(self.data))
+
+
+def warm_context(key: str, open_ctx: Callable[[str], Tuple[Any, Any]],
+                 on_close: Optional[Callable[[Any], None]] = None,
+                 valid: Optional[Callable[[Any], bool]] = None) -> Optional[WarmContext]:
+    """
+    Context ấm của `key` (thường là domain) trên worker hiện tại; chưa có / đã cũ -> open_ctx(user_data_dir)
+    trả (context, data). user_data_dir khác rỗng: caller nên dùng launch_persistent_context với thư mục đó.
+    valid(data) False -> bỏ context cũ (vd. storage_state đang dùng vừa bị cách ly).
+    None nếu không chạy trên worker của pool hoặc BROWSER_WARM=0 (caller tự mở context mới như cũ).
+    """
+    warm: Optional[Dict[str, WarmContext]] = getattr(_local, "warm", None)
+    if warm is None or not BROWSER_WARM:
+        return None
+    wc = warm.get(key)
+    if wc is not None and (wc.stale() or (valid is not None and not valid(wc.data))):
+        del warm[key]
+        wc.close()
+        wc = None
+    if wc is None:
+        ctx, data = open_ctx(_profile_dir(key))
+        wc = warm[key] = WarmContext(ctx, data, on_close)
+        _count(key, "contexts")
+    wc.pages += 1
+    _count(key, "pages")
+    return wc
+
+
+_STATS: Dict[str, Dict[str, int]] = {}   # key -> {"contexts": số context ấm đã tạo, "pages": số trang đã mở}
+_STATS_LOCK = threading.Lock()
+
+
+def warm_stats() -> Dict[str, Dict[str, int]]:
+    """Thống kê context ấm theo key: pages / contexts càng lớn thì càng ít lần phải tải lại JS, cookie."""
+    with _STATS_LOCK:
+        return {k: dict(v) for k, v in _STATS.items()}
+
+
+def _count(key: str, field: str) -> None:
+    with _STATS_LOCK:
+        s = _STATS.setdefault(key, {"contexts": 0, "pages": 0})
+        s[field] += 1
+
+
+def _profile_dir(key: str) -> str:
+    if not BROWSER_PROFILE_DIR:
+        return ""
+    # Chromium khoá thư mục profile -> mỗi worker (và mỗi chế độ headless) 1 thư mục riêng
+    name = re.sub(r"[^\w.-]+", "-", key)
+    path = os.path.join(BROWSER_PROFILE_DIR, f"{name}-{getattr(_local, 'slot', '0')}")
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def _close_warm() -> None:
+    warm: Dict[str, WarmContext] = getattr(_local, "warm", None) or {}
+    for wc in list(warm.values()):
+        wc.close()
+    warm.clear()
+
+
+class BrowserPool:
+    def __init__(self, size: int = BROWSER_POOL_SIZE, headless: bool = True):
+        self.size = max(1, size)
+        self.headless = headless
+        self._jobs: "queue.Queue[Optional[tuple]]" = queue.Queue()
+        self._threads: List[threading.Thread] = []
+        self._lock = threading.Lock()
+
+    def _ensure_started(self) -> None:
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.size):
+                t = threading.Thread(target=self._worker, args=(i,), name=f"browser-{i}", daemon=True)
+                t.start()
+                self._threads.append(t)
+
+    def run(self, fn: Callable[[Any], Any], timeout: Optional[float] = None) -> Any:
+        """Chạy fn(browser) trên 1 worker của pool; exception của fn được raise lại ở caller."""
+        self._ensure_started()
+        fut: Future = Future()
+        self._jobs.put((fn, fut))
+        return fut.result(timeout)
+
+    def _worker(self, index: int = 0) -> None:
+        # pip install playwright && playwright install chromium
+        from playwright.sync_api import sync_playwright
+
+        _local.warm = {}
+        _local.slot = f"{'h' if self.headless else 'w'}{index}"
+        pw = None
+        browser = None
+        jobs = 0
+        try:
+            while True:
+                item = self._jobs.get()
+                if item is None:
+                    break
+                fn, fut = item
+                if not fut.set_running_or_notify_cancel():
+                    continue
+                try:
+                    if browser is not None and (jobs >= BROWSER_MAX_JOBS or not browser.is_connected()):
+                        _close_warm()
+                        _quietly(browser.close)
+                        browser, jobs = None, 0
+                    if browser is None:
+                        if pw is None:
+                            pw = sync_playwright().start()
+                        browser = pw.chromium.launch(headless=self.headless)
+                    jobs += 1
+                    fut.set_result(fn(browser))
+                except BaseException as e:
+                    fut.set_exception(e)
+        finally:
+            _close_warm()
+            if browser is not None:
+                _quietly(browser.close)
+            if pw is not None:
+                _quietly(pw.stop)
+
+    def close(self) -> None:
+        with self._lock:
+            for _ in self._threads:
+                self._jobs.put(None)
+            self._threads = []
+
+
+def _quietly(fn: Callable[[], Any]) -> None:
+    try:
+        fn()
+    except Exception:
+        pass
+
+
+_POOLS: Dict[bool, BrowserPool] = {}
+_POOLS_LOCK = threading.Lock()
+
+
+def get_pool(headless: bool = True) -> Optional[BrowserPool]:
+    """Pool dùng chung của process (theo chế độ headless); None nếu BROWSER_POOL_SIZE=0."""
+    if BROWSER_POOL_SIZE <= 0:
+        return None
+    with _POOLS_LOCK:
+        pool = _POOLS.get(headless)
+        if pool is None:
+            pool = _POOLS[headless] = BrowserPool(BROWSER_POOL_SIZE, headless)
+        return pool
+
+
+def with_browser(fn: Callable[[Any], Any], headless: bool = True) -> Any:
+    """fn(browser) trên pool; pool tắt -> launch Chromium riêng cho lần gọi này."""
+    pool = get_pool(headless)
+    if pool is not None:
+        return pool.run(fn)
+    from playwright.sync_api import sync_playwright
+    with sync_playwright() as p:
+        browser = p.chromium.launch(headless=headless)
+        try:
+            return fn(browser)
+        finally:
+            browser.close()
@@ -0,0 +1,133 @@
+# cache_fallback.py
+# Quản lý fallback sang Google Cache cho crawler:
+# - Negative cache: URL vừa tra cache thất bại (404 / không có dữ liệu) thì trong CACHE_NEG_TTL giây
+#   không gọi lại nữa -> không tốn thêm 1 request + rate limit cho kết quả đã biết là rỗng.
+# - Hedge: khi tải bằng Playwright (chậm), sau CACHE_HEDGE_DELAY giây bắn song song request cache,
+#   kết quả nào dùng được về trước thì lấy.
+# - Thống kê theo domain: số lần trích xuất, số lần phải dùng cache, hit/miss... (xem stats()).
+from __future__ import annotations
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional
+
+import requests
+
+from hedging import HEDGE_WORKERS, hedged
+from sites import canon_url
+
+CACHE_NEG_TTL = int(os.getenv("CACHE_NEG_TTL", "1800") or "1800")             # giây nhớ 1 lần cache miss
+CACHE_HEDGE_DELAY = float(os.getenv("CACHE_HEDGE_DELAY", "8") or "8")         # giây chờ nguồn chính trước khi hedge
+CACHE_HEDGE = os.getenv("CACHE_HEDGE", "1") != "0"
+
+
+# Pool riêng: primary (fetchers.get_html) bên trong lại hedge giữa các strategy trên pool của hedging
+_POOL = ThreadPoolExecutor(max_workers=HEDGE_WORKERS, thread_name_prefix="cache-hedge")
+
+
+class CacheMiss(Exception):
+    """Google Cache không có bản lưu / bản lưu không có dữ liệu (hoặc đang trong negative cache)."""
+
+
+def _usable(data) -> bool:
+    return isinstance(data, dict) and bool(data.get("title") or data.get("price") or data.get("area"))
+
+
+class FallbackManager:
+    """fetch_cache(link) -> dict tin rao (raise nếu lỗi), thường là crawler.extract_from_google_cache."""
+
+    _NEG_MAX = 20_000
+
+    def __init__(self, fetch_cache: Callable[[str], dict], usable: Callable[[dict], bool] = _usable,
+                 neg_ttl: int = CACHE_NEG_TTL, hedge_delay: float = CACHE_HEDGE_DELAY):
+        self.fetch_cache = fetch_cache
+        self.usable = usable
+        self.neg_ttl = neg_ttl
+        self.hedge_delay = hedge_delay
+        self._neg: Dict[str, float] = {}   # canon_url -> hết hạn (monotonic)
+        self._stats: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+
+    # ----- thống kê -----
+    def _count(self, domain: str, key: str) -> None:
+        with self._lock:
+            st = self._stats.setdefault(domain, {})
+            st[key] = st.get(key, 0) + 1
+
+    def record_attempt(self, domain: str) -> None:
+        self._count(domain, "attempts")
+
+    def stats(self) -> Dict[str, dict]:
+        """domain -> {attempts, fallbacks, hedges, hedge_wins, cache_hits, cache_misses, neg_skips, fallback_rate}"""
+        with self._lock:
+            out = {}
+            for domain, st in self._stats.items():
+                row = dict(st)
+                attempts = row.get("attempts", 0)
+                row["fallback_rate"] = round(row.get("fallbacks", 0) / attempts, 3) if attempts else 0.0
+                out[domain] = row
+            return out
+
+    # ----- negative cache -----
+    def _is_negative(self, key: str) -> bool:
+        with self._lock:
+            exp = self._neg.get(key)
+            if exp is None:
+                return False
+            if exp > time.monotonic():
+                return True
+            del self._neg[key]
+            return False
+
+    def _remember_miss(self, key: str) -> None:
+        now = time.monotonic()
+        with self._lock:
+            if len(self._neg) >= self._NEG_MAX:
+                self._neg = {k: v for k, v in self._neg.items() if v > now}
+                if len(self._neg) >= self._NEG_MAX:
+                    self._neg.clear()
+            self._neg[key] = now + self.neg_ttl
+
+    # ----- fallback -----
+    def fetch(self, link: str, domain: str, source: str = "google_cache_fallback") -> dict:
+        """Lấy tin từ Google Cache. CacheMiss nếu không có dữ liệu (kết quả được nhớ CACHE_NEG_TTL giây)."""
+        key = canon_url(link)
+        # request hedge chỉ là đầu cơ: chỉ tính là fallback khi thắng (xem hedge())
+        self._count(domain, "hedges" if source == "google_cache_hedged" else "fallbacks")
+        if self._is_negative(key):
+            self._count(domain, "neg_skips")
+            raise CacheMiss(f"cache miss (cached): {link}")
+        try:
+            data = self.fetch_cache(link)
+        except requests.HTTPError as e:
+            status = getattr(e.response, "status_code", None)
+            if status in (404, 410):
+                self._remember_miss(key)
+            self._count(domain, "cache_misses")
+            raise
+        if not self.usable(data):
+            self._remember_miss(key)
+            self._count(domain, "cache_misses")
+            raise CacheMiss(f"cache empty: {link}")
+        self._count(domain, "cache_hits")
+        return data | {"_source": source}
+
+    def hedge(self, link: str, domain: str, primary: Callable[[], dict], delay: Optional[float] = None) -> dict:
+        """
+        Chạy primary (vd. Playwright); chưa xong sau `delay` giây hoặc lỗi/rỗng -> tra cache song song.
+        Trả kết quả dùng được về trước; không bên nào dùng được -> như primary (trả dữ liệu rỗng hoặc raise).
+        """
+        if not CACHE_HEDGE:
+            return primary()
+        value, who = hedged(
+            primary,
+            lambda: self.fetch(link, domain, source="google_cache_hedged"),
+            self.hedge_delay if delay is None else delay,
+            self.usable,
+            pool=_POOL,
+        )
+        if who == "backup":
+            self._count(domain, "hedge_wins")
+            self._count(domain, "fallbacks")
+        return value
@@ -0,0 +1,72 @@
+# category_crawler.py
+# Crawl trang danh mục / kết quả tìm kiếm của từng site: phân trang, gom TẤT CẢ link chi tiết
+# kèm thông tin tóm tắt trên card (title, price, area, image) -> có thể hiển thị kết quả
+# mà không cần mở từng trang chi tiết.
+#
+# Mỗi sites/<site>.py khai báo:
+#   parse_list(link, html_or_soup) -> list[dict]   (card: link, title, price, area, image)
+#   page_url(link, page) -> str                      (URL trang thứ `page`)
+from __future__ import annotations
+import os
+from typing import List, Optional
+
+from fetchers import get_html
+from listing import Listing
+from sites import SiteSpec, site_for
+
+CATEGORY_MAX_PAGES = int(os.getenv("CATEGORY_MAX_PAGES", "3") or "3")
+
+
+def supports_listing(link: str) -> bool:
+    spec = site_for(link)
+    mod = spec.load() if spec else None
+    return bool(mod and hasattr(mod, "parse_list") and hasattr(mod, "page_url"))
+
+
+def card_to_result(card: dict, source: str) -> Listing:
+    """Card trang danh mục -> Listing cùng khuôn với kết quả extract_info_generic."""
+    return Listing.from_dict({
+        "link": card.get("link", ""),
+        "title": card.get("title", ""),
+        "price": card.get("price", ""),
+        "area": card.get("area", ""),
+        "description": card.get("description", ""),
+        "image": card.get("image", ""),
+        "contact": card.get("contact", ""),
+        "_source": source,
+    })
+
+
+def crawl_category(url: str, max_pages: int = CATEGORY_MAX_PAGES, max_items: int = 200,
+                   strategy: Optional[str] = None, site: Optional[SiteSpec] = None) -> List[Listing]:
+    """
+    Tải lần lượt các trang 1..max_pages của trang danh mục `url`, trả list card đã khử trùng lặp.
+    Dừng sớm khi đủ max_items hoặc 1 trang không có tin mới (hết trang / site trả lại trang 1).
+    site: SiteSpec khi url nằm ngoài domain của site (vd. API gateway.chotot.com của nhatot).
+    """
+    spec = site or site_for(url)
+    mod = spec.load() if spec else None
+    if not mod or not hasattr(mod, "parse_list"):
+        return []
+    use = strategy or spec.default_strategy
+
+    cards: List[Listing] = []
+    seen = set()
+    for page in range(1, max(1, max_pages) + 1):
+        page_link = mod.page_url(url, page) if hasattr(mod, "page_url") else url
+        try:
+            html = get_html(page_link, use)
+        except Exception:
+            break
+        fresh = 0
+        for c in mod.parse_list(page_link, html):
+            if c["link"] in seen:
+                continue
+            seen.add(c["link"])
+            cards.append(card_to_result(c, f"list:{use}"))
+            fresh += 1
+            if len(cards) >= max_items:
+                return cards
+        if fresh == 0 or not hasattr(mod, "page_url"):
+            break
+    return cards
@@ -0,0 +1,88 @@
+# deadline.py
+# Hạn chót (deadline) cho cả 1 lượt search, truyền xuống mọi tầng qua contextvars:
+#   with deadline(8):                       # search_google
+#       ... _call_google / get_html / Google Cache fallback ...
+#           requests.get(..., timeout=dl.timeout(20))   # = min(20, thời gian còn lại)
+# Mỗi tầng tự co timeout theo thời gian còn lại thay vì dùng hằng số riêng (20s, 25s, 60000ms...).
+# contextvars không tự đi theo sang thread của ThreadPoolExecutor -> submit qua bind()/submit() bên dưới.
+from __future__ import annotations
+import contextvars
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Iterator, Optional
+
+MIN_TIMEOUT = 1.0   # giây; còn ít hơn thì vẫn cho 1 request ngắn thay vì timeout=0
+
+_DEADLINE: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar("deadline", default=None)
+
+
+class DeadlineExceeded(TimeoutError):
+    pass
+
+
+@contextmanager
+def deadline(seconds: Optional[float]) -> Iterator[Optional[float]]:
+    """Đặt hạn chót sau `seconds` giây (None/<=0: không đổi). Lồng nhau -> lấy hạn sớm hơn."""
+    if not seconds or seconds <= 0:
+        yield _DEADLINE.get()
+        return
+    at = time.monotonic() + seconds
+    cur = _DEADLINE.get()
+    token = _DEADLINE.set(at if cur is None else min(cur, at))
+    try:
+        yield _DEADLINE.get()
+    finally:
+        _DEADLINE.reset(token)
+
+
+def remaining() -> Optional[float]:
+    """Số giây còn lại (có thể âm), None nếu không có deadline."""
+    at = _DEADLINE.get()
+    return None if at is None else at - time.monotonic()
+
+
+def expired() -> bool:
+    left = remaining()
+    return left is not None and left <= 0
+
+
+def check(what: str = "") -> None:
+    """Raise DeadlineExceeded nếu đã quá hạn (gọi trước khi bắt đầu 1 bước tốn thời gian)."""
+    if expired():
+        raise DeadlineExceeded(what or "deadline exceeded")
+
+
+def timeout(default: float, minimum: float = MIN_TIMEOUT) -> float:
+    """Timeout (giây) cho 1 bước: min(default, thời gian còn lại), không nhỏ hơn `minimum`. Quá hạn -> raise."""
+    left = remaining()
+    if left is None:
+        return default
+    if left <= 0:
+        raise DeadlineExceeded("deadline exceeded")
+    return max(minimum, min(default, left))
+
+
+def guard(fn: Callable[..., Any], *args, **kwargs) -> Any:
+    """
+    Chạy fn; lỗi xảy ra khi deadline đã hết (vd. requests timeout vì timeout bị co lại) -> DeadlineExceeded.
+    Dùng cho thân single-flight: caller gộp vào có thể còn thời gian và cần biết lỗi là do hạn của caller khác.
+    """
+    try:
+        return fn(*args, **kwargs)
+    except DeadlineExceeded:
+        raise
+    except Exception as e:
+        if expired():
+            raise DeadlineExceeded(f"deadline exceeded: {e}") from e
+        raise
+
+
+def bind(fn: Callable[..., Any]) -> Callable[..., Any]:
+    """Gói fn để chạy trong context (deadline) hiện tại — dùng khi đưa fn sang thread khác."""
+    ctx = contextvars.copy_context()
+    return lambda *a, **kw: ctx.copy().run(fn, *a, **kw)   # copy: 1 Context không chạy đồng thời ở 2 thread
+
+
+def submit(pool, fn: Callable[..., Any], *args, **kwargs):
+    """pool.submit nhưng giữ deadline của caller."""
+    return pool.submit(contextvars.copy_context().run, fn, *args, **kwargs)
@@ -1,37 +1,206 @@
 # fetchers.py
 from __future__ import annotations
-import os, time
+import os, re, sys, glob, time, subprocess, threading
+import importlib.util
+from typing import Optional
+from urllib.parse import urlparse
 import requests
 
+import deadline as dl
+from auth_states import cookies_of, default_pool as auth_pool
+import throttle
+from browser_pool import warm_context, with_browser
+from hedging import LATENCY, Cancelled, hedged
+from singleflight import SingleFlight
+from sites import site_for
+
+# Hedge: strategy chính chậm hơn p90 gần đây của (domain, strategy) -> chạy thêm strategy nhẹ song song
+HEDGE_FETCH = os.getenv("HEDGE_FETCH", "1") != "0"
+# requests: đọc HTML dạng stream, dừng sớm theo SiteSpec.stream_until / stream_budget
+STREAM_FETCH = os.getenv("STREAM_FETCH", "1") != "0"
+
+def _accept_encoding() -> str:
+    """br/zstd chỉ được quảng bá khi urllib3 giải nén được (đã cài brotli / zstandard)."""
+    try:
+        from urllib3.util.request import ACCEPT_ENCODING
+        return ACCEPT_ENCODING.replace(",", ", ")
+    except ImportError:
+        return "gzip, deflate"
+
+ACCEPT_ENCODING = _accept_encoding()
+
 REQ_HEADERS = {
     "User-Agent": os.getenv("UA", "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
                      "AppleWebKit/537.36 (KHTML, like Gecko) Chrome/115 Safari/537.36"),
+    "Accept-Encoding": ACCEPT_ENCODING,
     "Accept-Language": "vi-VN,vi;q=0.9,en-US;q=0.8",
     "Referer": "https://www.google.com/",
 }
 
-def fetch_requests(url: str, timeout: int = 25) -> str:
-    r = requests.get(url, headers=REQ_HEADERS, timeout=timeout)
-    if r.status_code in (403, 410, 451):
-        raise requests.HTTPError(f"Blocked: {r.status_code}")
+class BlockedError(requests.HTTPError):
+    """Site chặn request (403/451, trang CAPTCHA/verify) hoặc circuit breaker đang mở."""
+
+# Tin đã bị gỡ: mọi fetcher raise requests.HTTPError có e.response.status_code (refresh nhận biết "removed")
+GONE_STATUS = (404, 410)
+
+def http_error(status: int, url: str) -> requests.HTTPError:
+    """HTTPError kèm response giả mang status_code (cho fetcher không có requests.Response, vd. Playwright)."""
+    r = requests.Response()
+    r.status_code, r.url = status, url
+    return requests.HTTPError(f"HTTP {status}", response=r)
+
+_TITLE_RE = re.compile(r"<title[^>]*>(.*?)</title>", re.I | re.S)
+_BLOCK_WORDS = ("xác minh", "captcha", "verify", "access denied")
+
+def looks_blocked(html: str) -> bool:
+    """Nhận diện trang CAPTCHA/verify theo <title> (không cần parse cả DOM)."""
+    m = _TITLE_RE.search(html or "")
+    title = (m.group(1) if m else "").lower()
+    return any(x in title for x in _BLOCK_WORDS)
+
+_CONTENT_RE = re.compile(r"<h1[\s>]|property=[\"']og:title", re.I)
+
+def html_usable(html: str) -> bool:
+    """Kiểm tra chất lượng nhanh: không phải trang chặn và đã có nội dung tin (h1 / og:title)."""
+    return bool(html) and not looks_blocked(html) and _CONTENT_RE.search(html) is not None
+
+def fetch_requests(url: str, timeout: int = 25, budget: int = 0, until: tuple = ()) -> str:
+    if STREAM_FETCH and (budget or until):
+        return fetch_streamed(url, budget, until, timeout=timeout)
+    r = requests.get(url, headers=REQ_HEADERS, timeout=dl.timeout(timeout))
+    if r.status_code in (403, 451):
+        raise BlockedError(f"Blocked: {r.status_code}")
     r.raise_for_status()
     return r.text
 
+# ---------- Tải HTML dạng stream: dừng đọc khi đã đủ trường cần thiết ----------
+_STREAM_CHUNK = 16 * 1024
+_MARKER_RE = re.compile(r"^([a-z0-9]*)(?:#([\w-]+))?((?:\.[\w-]+)*)(?:\*(\d+))?$", re.I)
+_CHARSET_RE = re.compile(rb"<meta[^>]+charset=[\"']?([\w-]+)", re.I)
+
+class _MarkerWatcher:
+    """
+    Nạp từng chunk vào lxml HTMLPullParser; feed() trả True khi mọi marker "tag#id.class*N"
+    đã xuất hiện đủ số lần (tính ở sự kiện "end" -> nội dung phần tử đã nhận trọn).
+    """
+
+    def __init__(self, markers: tuple):
+        from lxml import etree  # pip install lxml
+        self._parser = etree.HTMLPullParser(events=("end",))
+        self._need = []
+        for m in markers:
+            mm = _MARKER_RE.match(m.strip())
+            if not mm:
+                raise ValueError(f"stream marker không hợp lệ: {m}")
+            tag, id_, classes, n = mm.groups()
+            self._need.append([tag.lower(), id_, set(filter(None, classes.split("."))), int(n or 1)])
+
+    def feed(self, chunk: bytes) -> bool:
+        self._parser.feed(chunk)
+        for _, el in self._parser.read_events():
+            tag = el.tag.lower() if isinstance(el.tag, str) else ""
+            for need in self._need:
+                want_tag, want_id, want_cls, left = need
+                if left <= 0 or (want_tag and tag != want_tag):
+                    continue
+                if want_id and el.get("id") != want_id:
+                    continue
+                if want_cls and not want_cls <= set((el.get("class") or "").split()):
+                    continue
+                need[3] = left - 1
+        return all(n[3] <= 0 for n in self._need)
+
+def _stream_encoding(r: requests.Response, head: bytes) -> str:
+    if "charset" in (r.headers.get("Content-Type") or "").lower() and r.encoding:
+        return r.encoding
+    m = _CHARSET_RE.search(head[:4096])
+    return m.group(1).decode("ascii") if m else "utf-8"
+
+def fetch_streamed(url: str, budget: int = 0, until: tuple = (), timeout: int = 25,
+                   headers: Optional[dict] = None) -> str:
+    """
+    GET stream: đọc từng chunk (đã giải nén gzip/br), dừng khi đã thấy đủ marker `until`
+    hoặc đọc quá `budget` byte. HTML bị cắt vẫn parse được (lxml/BeautifulSoup tự đóng thẻ).
+    """
+    with requests.get(url, headers=headers or REQ_HEADERS, timeout=dl.timeout(timeout), stream=True) as r:
+        if r.status_code in (403, 451):
+            raise BlockedError(f"Blocked: {r.status_code}")
+        r.raise_for_status()
+        try:
+            watcher = _MarkerWatcher(until) if until else None
+        except ImportError:
+            watcher = None  # không có lxml -> chỉ dừng theo budget
+        buf = bytearray()
+        for chunk in r.iter_content(_STREAM_CHUNK):
+            buf += chunk
+            if watcher is not None and watcher.feed(chunk):
+                break
+            if budget and len(buf) >= budget:
+                break
+        # thoát khỏi `with` khi chưa đọc hết -> connection bị đóng, phần còn lại không tải về
+        return bytes(buf).decode(_stream_encoding(r, bytes(buf[:4096])), errors="replace")
+
+def fetch_conditional(url: str, etag: str = "", last_modified: str = "", timeout: int = 25):
+    """
+    GET có điều kiện (If-None-Match / If-Modified-Since).
+    Trả (status_code, html, validators); status 304 -> html rỗng, nội dung không đổi.
+    404/410 không raise để caller nhận biết tin đã bị gỡ.
+    """
+    headers = dict(REQ_HEADERS)
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+    r = requests.get(url, headers=headers, timeout=dl.timeout(timeout))
+    if r.status_code in (403, 451):
+        raise BlockedError(f"Blocked: {r.status_code}")
+    validators = {"etag": r.headers.get("ETag", ""), "last_modified": r.headers.get("Last-Modified", "")}
+    if r.status_code in (304, 404, 410):
+        return r.status_code, "", validators
+    r.raise_for_status()
+    return r.status_code, r.text, validators
+
 def fetch_cloudscraper(url: str, timeout: int = 25) -> str:
     # pip install cloudscraper
     import cloudscraper
     s = cloudscraper.create_scraper()
-    r = s.get(url, timeout=timeout)
+    r = s.get(url, timeout=dl.timeout(timeout))
+    if r.status_code in (403, 451):
+        raise BlockedError(f"Blocked: {r.status_code}")
     if r.status_code >= 400:
-        raise requests.HTTPError(f"HTTP {r.status_code}")
+        raise requests.HTTPError(f"HTTP {r.status_code}", response=r)
     return r.text
 
-def fetch_playwright(url: str, timeout_ms: int = 60000, headless: bool = True) -> str:
+def _goto_cancellable(page, url: str, timeout_ms: int, cancel: threading.Event):
+    """page.goto nhưng cứ 0.5s kiểm tra cờ huỷ một lần thay vì chặn tới hết timeout; trả Response của goto."""
+    from playwright.sync_api import TimeoutError as PWTimeout
+    deadline = time.monotonic() + timeout_ms / 1000.0
+    resp = page.goto(url, timeout=timeout_ms, wait_until="commit")
+    while True:
+        if cancel.is_set():
+            raise Cancelled(url)
+        try:
+            page.wait_for_load_state("domcontentloaded", timeout=500)
+            return resp
+        except PWTimeout:
+            if time.monotonic() >= deadline:
+                raise
+
+def fetch_playwright(url: str, timeout_ms: int = 60000, headless: bool = True,
+                     cancel: Optional[threading.Event] = None) -> str:
     # pip install playwright && playwright install chromium
-    from playwright.sync_api import sync_playwright
-    with sync_playwright() as p:
-        browser = p.chromium.launch(headless=headless)
-        ctx = browser.new_context(
+    # Chromium lấy từ pool dùng chung (browser_pool); trang mở từ context "ấm" của domain trên worker đó
+    # (cookie, cache JS/CSS còn nguyên, xem browser_pool.warm_context), không có thì mỗi lần 1 context mới.
+    # Có deadline (xem deadline.py) -> mọi timeout co lại theo thời gian còn lại
+    spec = site_for(url)
+    timeout_ms = int(dl.timeout(timeout_ms / 1000.0) * 1000)
+
+    def _wait_ms(default_ms: int = 15000) -> int:
+        return int(dl.timeout(default_ms / 1000.0) * 1000)
+
+    def _open(browser, user_data_dir: str = ""):
+        """(context, storage_state đang dùng); user_data_dir -> persistent context (HTTP cache trên đĩa)."""
+        ctx_kwargs = dict(
             user_agent=REQ_HEADERS["User-Agent"],
             viewport={"width": 1366, "height": 900},
             extra_http_headers={
@@ -39,30 +208,214 @@ def fetch_playwright(url: str, timeout_ms: int = 60000, headless: bool = True) -
                 "Accept-Language": "vi-VN,vi;q=0.9,en-US;q=0.8",
             },
         )
+        # storage_state đã qua CAPTCHA: lấy 1 state trong pool của domain (auth_states), chia đều giữa các context
+        state = auth_pool().acquire(spec.domain, spec.storage_state) if spec else None
+        try:
+            if user_data_dir:
+                ctx = browser.browser_type.launch_persistent_context(user_data_dir, headless=headless, **ctx_kwargs)
+                if state is not None:
+                    ctx.add_cookies(cookies_of(state.path))  # persistent context không nhận storage_state
+            else:
+                if state is not None:
+                    ctx_kwargs["storage_state"] = state.path
+                ctx = browser.new_context(**ctx_kwargs)
+        except Exception:
+            auth_pool().release(state)
+            raise
         # chống detect webdriver
         ctx.add_init_script("Object.defineProperty(navigator,'webdriver',{get:()=>undefined})")
-        page = ctx.new_page()
+        return ctx, state
+
+    def _render(browser) -> str:
+        warm = None
+        if spec is not None:
+            warm = warm_context(spec.domain, lambda d: _open(browser, d), on_close=auth_pool().release,
+                                valid=lambda st: st is None or st.usable(time.monotonic()))
+        ctx, state = (warm.ctx, warm.data) if warm is not None else _open(browser)
+        page = None
+        blocked = None  # None = lỗi / huỷ: không tính vào block rate của state
         try:
-            page.goto(url, timeout=timeout_ms, wait_until="domcontentloaded")
+            page = ctx.new_page()
+            if cancel is None:
+                resp = page.goto(url, timeout=timeout_ms, wait_until="domcontentloaded")
+            else:
+                resp = _goto_cancellable(page, url, timeout_ms, cancel)
+            if resp is not None and resp.status in GONE_STATUS:
+                raise http_error(resp.status, url)   # trang lỗi "tin không tồn tại": không render / parse
             try:
-                page.wait_for_load_state("networkidle", timeout=15000)
+                page.wait_for_load_state("networkidle", timeout=_wait_ms())
+                # chờ lần lượt các selector khai báo trong SiteSpec.ready
+                for selector in (spec.ready if spec else ()):
+                    if cancel is not None and cancel.is_set():
+                        break
+                    page.wait_for_selector(selector, timeout=_wait_ms())
             except Exception:
-                pass
+                pass  # vẫn lấy content
+            if cancel is not None and cancel.is_set():
+                raise Cancelled(url)
             html = page.content()
+            blocked = looks_blocked(html)
             return html
         finally:
-            ctx.close(); browser.close()
+            # thành công -> ghi lại cookie mới vào state (hoặc lưu thành state mới); phải làm trước ctx.close()
+            if spec is not None:
+                done = auth_pool().report if warm is not None else auth_pool().release
+                done(state, blocked, ctx, spec.domain, managed=bool(spec.storage_state))
+            if warm is None:
+                ctx.close()
+            else:
+                if page is not None:
+                    try:
+                        page.close()
+                    except Exception:
+                        warm.broken = True
+                else:
+                    warm.broken = True   # không mở được trang: context đã hỏng
+                if blocked:
+                    warm.broken = True   # cookie của context đã bị đánh dấu -> lần sau mở context mới
 
-# strategy = "requests" | "cloudscraper" | "playwright"
-def get_html(url: str, strategy: str) -> str:
+    return with_browser(dl.bind(_render), headless=headless)   # _render chạy trên thread của pool
+
+def _browsers_roots() -> list[str]:
+    """Các thư mục Playwright có thể đặt browser (theo PLAYWRIGHT_BROWSERS_PATH hoặc mặc định của OS)."""
+    env = os.getenv("PLAYWRIGHT_BROWSERS_PATH", "")
+    if env and env != "0":
+        return [env]
+    if env == "0":
+        # browser nằm trong package playwright; find_spec không import playwright
+        spec = importlib.util.find_spec("playwright")
+        if spec and spec.origin:
+            return [os.path.join(os.path.dirname(spec.origin), "driver", "package", ".local-browsers")]
+        return []
+    home = os.path.expanduser("~")
+    return [
+        os.path.join(home, ".cache", "ms-playwright"),
+        os.path.join(home, "Library", "Caches", "ms-playwright"),
+        os.path.join(os.getenv("LOCALAPPDATA", os.path.join(home, "AppData", "Local")), "ms-playwright"),
+    ]
+
+def chromium_installed() -> bool:
+    """Probe nhanh: chỉ kiểm tra thư mục chromium đã có chưa (không chạy subprocess, không launch browser)."""
+    if importlib.util.find_spec("playwright") is None:
+        return False
+    return any(glob.glob(os.path.join(root, "chromium*")) for root in _browsers_roots())
+
+def ensure_chromium(with_deps: bool = False) -> bool:
+    """
+    Cài Chromium cho Playwright nếu probe báo chưa có. Trả về True nếu sẵn sàng.
+    Nên gọi 1 lần/process (vd. bọc trong st.cache_resource).
+    """
+    if chromium_installed():
+        return True
+    if importlib.util.find_spec("playwright") is None:
+        return False
+    if with_deps:
+        try:
+            subprocess.run(
+                [sys.executable, "-m", "playwright", "install-deps", "chromium"],
+                check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+            )
+        except Exception:
+            pass  # thiếu quyền root -> bỏ qua, vẫn thử cài browser
+    subprocess.run(
+        [sys.executable, "-m", "playwright", "install", "chromium"],
+        check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+    )
+    return chromium_installed()
+
+def _fetch_by_strategy(url: str, strategy: str, cancel: Optional[threading.Event] = None) -> str:
     if strategy == "playwright":
         headless = os.getenv("PLAYWRIGHT_HEADLESS", "1") == "1"
-        return fetch_playwright(url, headless=headless)
+        return fetch_playwright(url, headless=headless, cancel=cancel)
     if strategy == "cloudscraper":
         try:
             return fetch_cloudscraper(url)
+        except requests.HTTPError as e:
+            if getattr(e.response, "status_code", None) in GONE_STATUS:
+                raise  # tin đã bị gỡ: Playwright cũng chỉ nhận trang 404
+            headless = os.getenv("PLAYWRIGHT_HEADLESS", "1") == "1"
+            return fetch_playwright(url, headless=headless, cancel=cancel)
         except Exception:
             # fallback an toàn cho các site có WAF/Cloudflare
             headless = os.getenv("PLAYWRIGHT_HEADLESS", "1") == "1"
-            return fetch_playwright(url, headless=headless)
+            return fetch_playwright(url, headless=headless, cancel=cancel)
+    spec = site_for(url)
+    if spec is not None:
+        return fetch_requests(url, budget=spec.stream_budget, until=spec.stream_until)
     return fetch_requests(url)
+
+_FLIGHT = SingleFlight()
+
+# strategy = "requests" | "cloudscraper" | "playwright"
+def get_html(url: str, strategy: str) -> str:
+    """
+    Tải HTML theo strategy, có giới hạn tốc độ theo domain.
+    Nếu breaker của strategy đang mở (site vừa chặn liên tục) -> tự chuyển sang strategy khác.
+    Nhiều caller cùng tải 1 URL đồng thời -> dùng chung 1 lượt tải (single-flight).
+    """
+    return _FLIGHT.do((url, strategy), dl.guard, _get_html, url, strategy)
+
+# strategy chậm -> strategy nhẹ dùng để hedge (Google Cache đã được hedge riêng trong crawler)
+_HEDGE_ALT = {"playwright": "requests", "cloudscraper": "requests"}
+
+def _hedge_alt(domain: str, use: str) -> Optional[str]:
+    # peek: hedge thường không chạy -> không chiếm lượt thử half-open của alt ở đây (xem _fetch_alt)
+    alt = _HEDGE_ALT.get(use)
+    return alt if alt and throttle.peek(domain, alt) else None
+
+def _fetch_alt(url: str, domain: str, alt: str, cancel: threading.Event) -> str:
+    """Nhánh backup của hedge: chỉ khi thực sự chạy mới xin breaker của alt."""
+    if not throttle.allow(domain, alt):
+        raise BlockedError(f"Circuit open: {domain} ({alt})")
+    return _fetch_tracked(url, domain, alt, cancel)
+
+def _get_html(url: str, strategy: str) -> str:
+    domain = urlparse(url).netloc.lower()
+    use = throttle.pick_strategy(domain, strategy)
+    if use is None:
+        raise BlockedError(f"Circuit open: {domain}")
+    alt = _hedge_alt(domain, use) if HEDGE_FETCH else None
+    if alt is None:
+        return _fetch_tracked(url, domain, use)
+
+    # Quá ngưỡng p90 (hoặc strategy chính lỗi / trang rỗng) -> chạy alt song song, lấy HTML đạt chất lượng về trước,
+    # sau đó bật cờ huỷ để Playwright bên thua đóng trình duyệt sớm.
+    stop = threading.Event()
+    try:
+        html, _ = hedged(
+            lambda: _fetch_tracked(url, domain, use, stop),
+            lambda: _fetch_alt(url, domain, alt, stop),
+            LATENCY.threshold((domain, use)),
+            html_usable,
+        )
+    finally:
+        stop.set()
+    return html
+
+def _fetch_tracked(url: str, domain: str, use: str, cancel: Optional[threading.Event] = None) -> str:
+    """acquire -> fetch -> báo breaker; ghi độ trễ theo (domain, strategy) cho ngưỡng hedge."""
+    if cancel is not None and cancel.is_set():
+        raise Cancelled(url)  # bên kia đã xong trước khi task này kịp chạy -> không tốn token
+    dl.check(url)
+    if not throttle.acquire(domain, timeout=dl.remaining()):
+        raise dl.DeadlineExceeded(f"deadline exceeded waiting for {domain}")   # hết hạn khi đang chờ token
+    if cancel is not None and cancel.is_set():
+        raise Cancelled(url)
+    t0 = time.monotonic()
+    try:
+        html = _fetch_by_strategy(url, use, cancel)
+    except Cancelled:
+        raise
+    except BlockedError as e:
+        LATENCY.observe((domain, use), time.monotonic() - t0)
+        throttle.record_block(domain, use, str(e))
+        raise
+    except Exception:
+        LATENCY.observe((domain, use), time.monotonic() - t0)  # timeout cũng là mẫu "đuôi"
+        raise
+    LATENCY.observe((domain, use), time.monotonic() - t0)
+    if looks_blocked(html):
+        throttle.record_block(domain, use, "captcha")
+        raise BlockedError(f"CAPTCHA/verify page ({use})")
+    throttle.record_success(domain, use)
+    return html
@@ -0,0 +1,117 @@
+# hedging.py
+# Hedged request: chạy nguồn chính; nếu sau `delay` giây vẫn chưa có kết quả dùng được thì
+# bắn thêm nguồn dự phòng song song và lấy kết quả "dùng được" về trước.
+# Lưu ý: không huỷ cưỡng bức được thread -> nguồn thua chỉ dừng nếu tự kiểm tra cờ huỷ (xem fetchers.get_html).
+# Ngưỡng hedge lấy theo phân vị độ trễ gần đây của từng (domain, strategy): LatencyTracker.
+from __future__ import annotations
+import os
+import threading
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Deque, Dict, Hashable, Optional, Tuple
+
+import deadline as dl
+
+HEDGE_WORKERS = int(os.getenv("HEDGE_WORKERS", "16") or "16")
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", "90") or "90")  # hedge khi chậm hơn p90 gần đây
+HEDGE_MIN_DELAY = float(os.getenv("HEDGE_MIN_DELAY", "2") or "2")
+HEDGE_DEFAULT_DELAY = float(os.getenv("HEDGE_DEFAULT_DELAY", "10") or "10")  # khi chưa đủ mẫu
+HEDGE_MIN_SAMPLES = 20
+
+class Cancelled(Exception):
+    """Nguồn thua tự dừng khi thấy cờ huỷ (bên kia đã có kết quả)."""
+
+
+# Pool mặc định: task trong pool này không được tự gọi hedged() với cùng pool (xem tham số pool)
+_POOL = ThreadPoolExecutor(max_workers=HEDGE_WORKERS, thread_name_prefix="hedge")
+
+
+def hedged(
+    primary: Callable[[], Any],
+    backup: Optional[Callable[[], Any]],
+    delay: float,
+    usable: Callable[[Any], bool] = bool,
+    pool: Optional[ThreadPoolExecutor] = None,
+) -> Tuple[Any, str]:
+    """
+    Trả (kết quả, "primary" | "backup").
+    - primary lỗi / không usable trước `delay` -> chạy backup ngay, không chờ hết delay.
+    - Không bên nào usable: trả kết quả của primary nếu primary không lỗi, ngược lại raise lỗi của primary.
+    - pool: executor riêng khi primary/backup tự gọi hedged() bên trong (tránh chờ chéo trong cùng 1 pool).
+    """
+    pool = pool or _POOL
+    futures: Dict[Future, str] = {dl.submit(pool, primary): "primary"}   # giữ deadline của caller
+    primary_value: Any = None
+    primary_ok = False
+    primary_error: Optional[BaseException] = None
+    backup_started = backup is None
+
+    def _start_backup():
+        nonlocal backup_started
+        if not backup_started:
+            backup_started = True
+            futures[dl.submit(pool, backup)] = "backup"
+
+    timeout: Optional[float] = delay
+    while futures:
+        done, _ = wait(list(futures), timeout=timeout, return_when=FIRST_COMPLETED)
+        timeout = None
+        if not done:  # quá delay mà primary chưa xong -> hedge
+            _start_backup()
+            continue
+        for f in done:
+            who = futures.pop(f)
+            err = f.exception()
+            value = None if err else f.result()
+            if err is None and usable(value):
+                return value, who
+            if who == "primary":
+                primary_value, primary_ok, primary_error = value, err is None, err
+                _start_backup()
+
+    if primary_ok:
+        return primary_value, "primary"
+    raise primary_error  # type: ignore[misc]
+
+
+class LatencyTracker:
+    """Độ trễ gần đây (tối đa `window` mẫu) theo key, vd. (domain, strategy)."""
+
+    def __init__(self, window: int = 200):
+        self.window = window
+        self._samples: Dict[Hashable, Deque[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, key: Hashable, seconds: float) -> None:
+        with self._lock:
+            buf = self._samples.get(key)
+            if buf is None:
+                buf = self._samples[key] = deque(maxlen=self.window)
+            buf.append(seconds)
+
+    def percentile(self, key: Hashable, p: float) -> Optional[float]:
+        with self._lock:
+            data = sorted(self._samples.get(key) or ())
+        if len(data) < HEDGE_MIN_SAMPLES:
+            return None
+        idx = min(len(data) - 1, max(0, int(round(p / 100.0 * len(data))) - 1))
+        return data[idx]
+
+    def threshold(self, key: Hashable, default: float = HEDGE_DEFAULT_DELAY) -> float:
+        """Số giây chờ trước khi hedge: p{HEDGE_PERCENTILE} gần đây (>= HEDGE_MIN_DELAY), chưa đủ mẫu -> default."""
+        v = self.percentile(key, HEDGE_PERCENTILE)
+        return default if v is None else max(HEDGE_MIN_DELAY, v)
+
+    def snapshot(self) -> Dict[str, dict]:
+        with self._lock:
+            keys = list(self._samples)
+        out = {}
+        for key in keys:
+            name = "/".join(key) if isinstance(key, tuple) else str(key)
+            out[name] = {"p50": self.percentile(key, 50), "p95": self.percentile(key, 95),
+                         "samples": len(self._samples.get(key) or ())}
+        return out
+
+
+# Dùng chung cho fetchers + crawler: key = (domain, strategy)
+LATENCY = LatencyTracker()
@@ -0,0 +1,179 @@
+# htmlstore.py
+# Lưu HTML đã tải (debug dump, fixture, cache response) dạng nén trên đĩa.
+# - zstd + dictionary huấn luyện riêng cho từng site: các trang cùng site chung template/CSS/script
+#   nên dictionary nén trang 300KB còn vài chục KB (tốt hơn nhiều so với nén từng file độc lập).
+# - Chưa có dictionary: nén zstd thường; đủ HTML_DICT_SAMPLES trang thì tự train dictionary
+#   từ các trang đã lưu, các lần ghi sau dùng dictionary đó.
+# - Không có zstandard (pip install zstandard) -> gzip.
+# Bố cục: <root>/<domain>/<sha1(url)>.html.zst|.html.gz, dictionary: <root>/<domain>/dict-<id>.zdict
+from __future__ import annotations
+import glob
+import gzip
+import hashlib
+import os
+import threading
+from typing import Dict, List, Optional
+from urllib.parse import urlsplit
+
+HTML_STORE_DIR = os.getenv("HTML_STORE_DIR", "html_store")
+HTML_ZSTD_LEVEL = int(os.getenv("HTML_ZSTD_LEVEL", "10") or "10")
+HTML_DICT_SAMPLES = int(os.getenv("HTML_DICT_SAMPLES", "50") or "50")   # số trang để train dictionary
+HTML_DICT_SIZE = int(os.getenv("HTML_DICT_SIZE", str(112 * 1024)) or "0")
+
+
+def _zstd():
+    try:
+        import zstandard  # pip install zstandard
+        return zstandard
+    except ImportError:
+        return None
+
+
+def _domain_of(key: str) -> str:
+    host = urlsplit(key).netloc.lower() if "://" in key else ""
+    return host or "_misc"
+
+
+class HtmlStore:
+    def __init__(self, root: str = HTML_STORE_DIR):
+        self.root = root
+        self._dicts: Dict[str, Dict[int, object]] = {}   # domain -> dict_id -> ZstdCompressionDict
+        self._current: Dict[str, Optional[int]] = {}      # domain -> dict_id dùng khi ghi
+        self._tried: Dict[str, int] = {}                  # domain -> số file lúc train thất bại gần nhất
+        self._lock = threading.Lock()
+
+    # ----- đường dẫn -----
+    def _dir(self, domain: str) -> str:
+        return os.path.join(self.root, domain)
+
+    def _base(self, key: str) -> str:
+        return os.path.join(self._dir(_domain_of(key)), hashlib.sha1(key.encode("utf-8")).hexdigest())
+
+    # ----- dictionary -----
+    def _load_dicts(self, domain: str) -> None:
+        zstd = _zstd()
+        if zstd is None or domain in self._dicts:
+            return
+        dicts: Dict[int, object] = {}
+        for path in glob.glob(os.path.join(self._dir(domain), "dict-*.zdict")):
+            with open(path, "rb") as f:
+                d = zstd.ZstdCompressionDict(f.read())
+            dicts[d.dict_id()] = d
+        self._dicts[domain] = dicts
+        self._current[domain] = max(dicts, key=lambda i: os.path.getmtime(
+            os.path.join(self._dir(domain), f"dict-{i}.zdict"))) if dicts else None
+
+    def train(self, domain: str, samples: Optional[List[bytes]] = None) -> Optional[int]:
+        """Train dictionary cho domain từ `samples` (mặc định: các trang đã lưu). Trả dict_id hoặc None."""
+        zstd = _zstd()
+        if zstd is None:
+            return None
+        if samples is None:
+            samples = [s.encode("utf-8") for s in self.iter_domain(domain)]
+        if len(samples) < 8:  # quá ít mẫu -> dictionary vô nghĩa
+            return None
+        d = zstd.train_dictionary(HTML_DICT_SIZE, samples)
+        os.makedirs(self._dir(domain), exist_ok=True)
+        with open(os.path.join(self._dir(domain), f"dict-{d.dict_id()}.zdict"), "wb") as f:
+            f.write(d.as_bytes())
+        with self._lock:
+            self._load_dicts(domain)
+            self._dicts[domain][d.dict_id()] = d
+            self._current[domain] = d.dict_id()
+        return d.dict_id()
+
+    def _maybe_train(self, domain: str) -> None:
+        if self._current.get(domain) is not None or HTML_DICT_SAMPLES <= 0:
+            return
+        n = len(glob.glob(os.path.join(self._dir(domain), "*.html.zst")))
+        if n < max(HTML_DICT_SAMPLES, 2 * self._tried.get(domain, 0)):
+            return
+        try:
+            dict_id = self.train(domain)
+        except Exception:
+            dict_id = None  # train lỗi (mẫu quá giống/nhỏ) -> tiếp tục nén không dictionary
+        if dict_id is None:
+            self._tried[domain] = n  # thử lại khi số trang tăng gấp đôi
+
+    # ----- ghi / đọc -----
+    def put(self, key: str, html: str) -> str:
+        """Lưu HTML theo key (thường là URL); trả đường dẫn file."""
+        domain = _domain_of(key)
+        base = self._base(key)
+        os.makedirs(os.path.dirname(base), exist_ok=True)
+        raw = html.encode("utf-8")
+        zstd = _zstd()
+        if zstd is None:
+            path, data = base + ".html.gz", gzip.compress(raw, 6)
+        else:
+            with self._lock:
+                self._load_dicts(domain)
+                dict_id = self._current.get(domain)
+                zdict = self._dicts[domain].get(dict_id) if dict_id is not None else None
+            cctx = zstd.ZstdCompressor(level=HTML_ZSTD_LEVEL, dict_data=zdict) if zdict else \
+                zstd.ZstdCompressor(level=HTML_ZSTD_LEVEL)
+            path, data = base + ".html.zst", cctx.compress(raw)
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+        if zstd is not None:
+            self._maybe_train(domain)
+        return path
+
+    def _read(self, path: str) -> str:
+        with open(path, "rb") as f:
+            data = f.read()
+        if path.endswith(".gz"):
+            return gzip.decompress(data).decode("utf-8")
+        zstd = _zstd()
+        if zstd is None:
+            raise RuntimeError("cần zstandard để đọc .html.zst (pip install zstandard)")
+        dict_id = zstd.get_frame_parameters(data).dict_id
+        zdict = None
+        if dict_id:
+            domain = os.path.basename(os.path.dirname(path))
+            with self._lock:
+                self._load_dicts(domain)
+                zdict = self._dicts[domain].get(dict_id)
+            if zdict is None:
+                raise RuntimeError(f"thiếu dictionary {dict_id} cho {domain}")
+        dctx = zstd.ZstdDecompressor(dict_data=zdict) if zdict else zstd.ZstdDecompressor()
+        return dctx.decompress(data).decode("utf-8")
+
+    def get(self, key: str) -> Optional[str]:
+        base = self._base(key)
+        for ext in (".html.zst", ".html.gz"):
+            if os.path.exists(base + ext):
+                return self._read(base + ext)
+        return None
+
+    def iter_domain(self, domain: str):
+        for path in glob.glob(os.path.join(self._dir(domain), "*.html.*")):
+            if path.endswith(".tmp"):
+                continue
+            try:
+                yield self._read(path)
+            except Exception:
+                continue
+
+    def stats(self) -> Dict[str, dict]:
+        """domain -> {files, bytes, dict_id}"""
+        out = {}
+        for d in sorted(os.listdir(self.root)) if os.path.isdir(self.root) else []:
+            files = [p for p in glob.glob(os.path.join(self._dir(d), "*.html.*")) if not p.endswith(".tmp")]
+            with self._lock:
+                self._load_dicts(d)
+            out[d] = {"files": len(files), "bytes": sum(os.path.getsize(p) for p in files),
+                      "dict_id": self._current.get(d)}
+        return out
+
+
+_DEFAULT: Optional[HtmlStore] = None
+
+
+def default_store() -> HtmlStore:
+    global _DEFAULT
+    if _DEFAULT is None:
+        _DEFAULT = HtmlStore()
+    return _DEFAULT
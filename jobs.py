@@ -0,0 +1,166 @@
+# jobs.py
+# Hàng đợi job tìm kiếm chạy nền (SQLite) để request web không phải chờ crawl.
+# - Web: submit(query) -> job_id ngay lập tức, sau đó poll get(job_id) để xem tiến độ/kết quả.
+# - Worker: thread trong cùng process (JOB_WORKERS, mặc định 2) hoặc process riêng:
+#       JOB_WORKERS=0 flask run ...        # web chỉ nhận job
+#       python jobs.py 4                   # 1 process worker với 4 thread, scale độc lập
+#   Mọi process dùng chung file JOBS_DB nên có thể chạy nhiều process worker song song.
+from __future__ import annotations
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+from contextlib import closing
+from typing import List, Optional
+
+from listing import to_dicts
+
+JOBS_DB = os.getenv("JOBS_DB", "jobs.db")
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2") or "2")
+JOB_TTL = int(os.getenv("JOB_TTL", "86400") or "86400")      # xoá job cũ hơn (giây)
+JOB_STALE = int(os.getenv("JOB_STALE", "900") or "900")      # job "running" quá lâu không cập nhật -> chạy lại
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id           TEXT PRIMARY KEY,
+    query        TEXT NOT NULL,
+    target_total INTEGER NOT NULL,
+    status       TEXT NOT NULL DEFAULT 'queued',
+    done         INTEGER NOT NULL DEFAULT 0,
+    total        INTEGER NOT NULL DEFAULT 0,
+    result       TEXT,
+    error        TEXT NOT NULL DEFAULT '',
+    created_at   REAL NOT NULL,
+    updated_at   REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status, created_at);
+"""
+
+QUEUED, RUNNING, DONE, ERROR = "queued", "running", "done", "error"
+
+
+class JobQueue:
+    def __init__(self, path: str = JOBS_DB, poll_interval: float = 1.0):
+        self.path = path
+        self.poll_interval = poll_interval
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+        with closing(self._connect()) as conn:
+            conn.executescript(_SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        # mỗi thao tác 1 connection: an toàn giữa thread & process, SQLite tự khoá file
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    # ----- phía web -----
+    def submit(self, query: str, target_total: int = 30) -> str:
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with closing(self._connect()) as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, query, target_total, status, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (job_id, query, int(target_total), QUEUED, now, now),
+            )
+            conn.execute("DELETE FROM jobs WHERE updated_at < ?", (now - JOB_TTL,))
+        self._wake.set()
+        return job_id
+
+    def get(self, job_id: str) -> Optional[dict]:
+        """dict: id, query, status, done, total, error, results (list, chỉ có khi status=done)."""
+        with closing(self._connect()) as conn:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if not row:
+            return None
+        job = {k: row[k] for k in ("id", "query", "target_total", "status", "done", "total", "error")}
+        job["results"] = json.loads(row["result"]) if row["result"] else []
+        return job
+
+    # ----- phía worker -----
+    def _claim(self) -> Optional[sqlite3.Row]:
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")  # khoá ghi: 2 worker không nhận trùng 1 job
+            conn.execute(
+                "UPDATE jobs SET status = ?, updated_at = ? WHERE status = ? AND updated_at < ?",
+                (QUEUED, now, RUNNING, now - JOB_STALE),
+            )
+            row = conn.execute(
+                "SELECT * FROM jobs WHERE status = ? ORDER BY created_at LIMIT 1", (QUEUED,)
+            ).fetchone()
+            if row:
+                conn.execute("UPDATE jobs SET status = ?, updated_at = ? WHERE id = ?", (RUNNING, now, row["id"]))
+            conn.execute("COMMIT")
+            return row
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def _update(self, job_id: str, **fields) -> None:
+        fields["updated_at"] = time.time()
+        cols = ", ".join(f"{k} = ?" for k in fields)
+        with closing(self._connect()) as conn:
+            conn.execute(f"UPDATE jobs SET {cols} WHERE id = ?", (*fields.values(), job_id))
+
+    def _run(self, row: sqlite3.Row) -> None:
+        from search_google import search_google
+
+        job_id = row["id"]
+
+        def _progress(done: int, total: int) -> None:
+            self._update(job_id, done=done, total=total)
+
+        try:
+            results = search_google(row["query"], target_total=row["target_total"], on_progress=_progress)
+            self._update(job_id, status=DONE, result=json.dumps(to_dicts(results or []), ensure_ascii=False))
+        except Exception as e:
+            self._update(job_id, status=ERROR, error=str(e))
+
+    def _worker(self) -> None:
+        while not self._stop.is_set():
+            try:
+                row = self._claim()
+            except sqlite3.OperationalError:
+                row = None  # DB đang bận -> thử lại lượt sau
+            if row is None:
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+                continue
+            self._run(row)
+
+    def start(self, workers: int = JOB_WORKERS) -> None:
+        """Chạy `workers` thread nền (daemon). Gọi nhiều lần không tạo thêm thread."""
+        if self._threads:
+            return
+        for i in range(max(0, workers)):
+            t = threading.Thread(target=self._worker, name=f"job-worker-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._wake.set()
+
+
+def main():
+    workers = int(sys.argv[1]) if len(sys.argv) > 1 else max(1, JOB_WORKERS)
+    q = JobQueue()
+    q.start(workers)
+    print(f"🛠️  {workers} worker đang chạy, DB: {q.path} (Ctrl+C để dừng)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        q.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+# listing.py
+# Bản ghi tin rao gọn bộ nhớ cho job crawl số lượng lớn:
+# - dataclass slots (không có __dict__ mỗi object)
+# - domain / _source được intern: hàng nghìn tin cùng site dùng chung 1 object chuỗi
+# - description dài được nén zlib, chỉ giải nén khi truy cập (card chỉ hiện 300 ký tự đầu)
+# Listing hỗ trợ kiểu truy cập dict (get / [] / | / keys) nên code cũ dùng dict vẫn chạy;
+# ra JSON (jobs DB, API) thì gọi to_dict() / to_dicts().
+# quality(): điểm 0..1 của 1 tin (đủ trường, giá / diện tích parse được, không phải trang CAPTCHA / lỗi).
+from __future__ import annotations
+import re
+import sys
+import zlib
+from dataclasses import dataclass
+from typing import Any, Callable, Iterable, List, Optional, Union
+from urllib.parse import urlsplit
+
+DESC_COMPRESS_MIN = 256   # ký tự; mô tả ngắn hơn giữ nguyên str (nén không lợi)
+
+FIELDS = ("link", "title", "price", "area", "description", "image", "contact")
+
+
+def _intern(s: str) -> str:
+    return sys.intern(s) if s else ""
+
+
+def _domain(link: str) -> str:
+    try:
+        return _intern(urlsplit(link).netloc.lower())
+    except ValueError:
+        return ""
+
+
+@dataclass(slots=True)
+class Listing:
+    link: str = ""
+    title: str = ""
+    price: str = ""
+    area: str = ""
+    image: str = ""
+    contact: str = ""
+    domain: str = ""
+    source: str = ""
+    desc_blob: Union[str, bytes] = ""      # str hoặc bytes đã nén zlib (xem description)
+    extra: Optional[dict] = None           # các key khác (vd. _status của refresh)
+
+    # ----- description nén -----
+    @property
+    def description(self) -> str:
+        blob = self.desc_blob
+        return zlib.decompress(blob).decode("utf-8") if isinstance(blob, bytes) else blob
+
+    @description.setter
+    def description(self, text: str) -> None:
+        text = text or ""
+        self.desc_blob = zlib.compress(text.encode("utf-8")) if len(text) >= DESC_COMPRESS_MIN else text
+
+    # ----- chuyển đổi -----
+    @classmethod
+    def from_dict(cls, d: dict) -> "Listing":
+        link = d.get("link") or ""
+        item = cls(
+            link=link,
+            title=d.get("title") or "",
+            price=d.get("price") or "",
+            area=d.get("area") or "",
+            image=d.get("image") or "",
+            contact=d.get("contact") or "",
+            domain=_domain(link),
+            source=_intern(d.get("_source") or ""),
+        )
+        item.description = d.get("description") or ""
+        extra = {k: v for k, v in d.items() if k not in FIELDS and k != "_source"}
+        item.extra = extra or None
+        return item
+
+    def to_dict(self) -> dict:
+        d = {k: self[k] for k in FIELDS}
+        if self.source:
+            d["_source"] = self.source
+        if self.extra:
+            d.update(self.extra)
+        return d
+
+    # ----- truy cập kiểu dict -----
+    def __getitem__(self, key: str) -> Any:
+        if key in FIELDS:
+            return getattr(self, key)
+        if key == "_source":
+            return self.source
+        if self.extra and key in self.extra:
+            return self.extra[key]
+        raise KeyError(key)
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        if key in FIELDS:
+            setattr(self, key, value or "")
+            if key == "link":
+                self.domain = _domain(self.link)
+        elif key == "_source":
+            self.source = _intern(value or "")
+        else:
+            if self.extra is None:
+                self.extra = {}
+            self.extra[key] = value
+
+    def __contains__(self, key: str) -> bool:
+        try:
+            self[key]
+            return True
+        except KeyError:
+            return False
+
+    def get(self, key: str, default: Any = None) -> Any:
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def keys(self) -> List[str]:
+        return list(self.to_dict())
+
+    def __or__(self, other: dict) -> "Listing":
+        item = self.copy()
+        for k, v in other.items():
+            item[k] = v
+        return item
+
+    def copy(self) -> "Listing":
+        return Listing(self.link, self.title, self.price, self.area, self.image, self.contact,
+                       self.domain, self.source, self.desc_blob, dict(self.extra) if self.extra else None)
+
+
+def as_listing(obj: Union[dict, Listing]) -> Listing:
+    return obj if isinstance(obj, Listing) else Listing.from_dict(obj)
+
+
+def to_dicts(items: Iterable[Union[dict, Listing]]) -> List[dict]:
+    """List Listing/dict -> list dict (để json.dumps / jsonify)."""
+    return [x.to_dict() if isinstance(x, Listing) else x for x in items]
+
+
+# ---------- Chất lượng ----------
+# tiêu đề kiểu trang chặn / CAPTCHA (parser vẫn "trích xuất" được h1 / og:title của trang đó)
+_BLOCKED_TITLE = re.compile(
+    r"captcha|just a moment|attention required|access denied|are you a robot|xác minh|verify you are|"
+    r"403 forbidden|too many requests|cloudflare", re.I)
+_QUALITY_WEIGHTS = (("title", 0.3), ("price", 0.25), ("area", 0.2), ("description", 0.1),
+                    ("image", 0.1), ("contact", 0.05))
+
+
+def quality(item: Union[dict, Listing]) -> float:
+    """
+    Điểm 0..1: tiêu đề 0.3, giá 0.25 (parse ra số hoặc "thỏa thuận"), diện tích 0.2 (parse ra m²),
+    mô tả 0.1, ảnh 0.1, liên hệ 0.05. Tin lỗi / không hỗ trợ / trang CAPTCHA -> 0.
+    """
+    from sites.utils_values import area_to_m2, price_to_vnd
+    get = item.get
+    title = get("title") or ""
+    if get("_source") == "error" or title.startswith(("❌", "❓")) or _BLOCKED_TITLE.search(title):
+        return 0.0
+    score = 0.0
+    for key, w in _QUALITY_WEIGHTS:
+        v = (get(key) or "").strip()
+        if not v:
+            continue
+        if key == "price" and price_to_vnd(v) is None and not re.search(r"thỏa thuận|thoả thuận|liên hệ", v, re.I):
+            w /= 2  # có chữ nhưng không ra số
+        elif key == "area" and area_to_m2(v) is None:
+            w /= 2
+        elif key == "description" and len(v) < 50:
+            w /= 2
+        score += w
+    return round(score, 3)
+
+
+def make_soup(html: str):
+    from bs4 import BeautifulSoup
+    try:
+        return BeautifulSoup(html, "lxml")
+    except Exception:  # thiếu lxml
+        return BeautifulSoup(html, "html.parser")
+
+
+def parse_listing(parser: Callable[[str, Any], dict], link: str, html_or_soup, source: str = "",
+                  fast: Optional[Callable[[str, str], Optional[dict]]] = None) -> Listing:
+    """
+    Lớp chuyển đổi dùng cho mọi parser sites/<site>.parse: dựng soup 1 lần, parse, đổi sang Listing,
+    rồi decompose() cây DOM ngay (không để soup vài MB sống theo dict kết quả tới lúc GC dọn).
+    fast: parse_fast(link, html) của site (SiteSpec.fast_parser) — đọc JSON nhúng từ HTML thô, trả đủ dữ liệu
+    thì bỏ qua hẳn bước dựng DOM; None -> parse đầy đủ.
+    """
+    own = not hasattr(html_or_soup, "select")
+    if own and fast is not None:
+        try:
+            data = fast(link, html_or_soup)
+        except Exception:
+            data = None
+        if data:
+            item = as_listing(data)
+            if source:
+                item.source = _intern(source)
+            return item
+    soup = make_soup(html_or_soup) if own else html_or_soup
+    try:
+        item = as_listing(parser(link, soup))
+    finally:
+        if own:
+            soup.decompose()
+    if source:
+        item.source = _intern(source)
+    return item
@@ -0,0 +1,264 @@
+# refresh.py
+# Refresh tin rao theo kiểu incremental:
+# - Lưu fingerprint mỗi tin (hash các trường đã trích xuất + hash HTML thô + ETag/Last-Modified) vào SQLite.
+# - Chỉ tải lại tin đã quá TTL của site (SiteSpec.ttl); 304 hoặc HTML không đổi -> bỏ qua bước parse.
+# - Sinh change feed: new / price_drop / price_up / price_changed / updated / removed.
+#
+# Usage:  python refresh.py <url1> <url2> ...   (in change feed ra stdout)
+from __future__ import annotations
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from typing import List, Optional, Tuple
+from urllib.parse import urlparse
+
+import requests
+
+import deadline as dl
+import throttle
+from crawler import extract_info_generic
+from fetchers import GONE_STATUS, BlockedError, fetch_conditional, get_html
+from listing import Listing, as_listing, parse_listing
+from sites import site_for
+from sites.utils_values import price_to_vnd
+
+LISTING_DB = os.getenv("LISTING_DB", "listings.db")
+# giây tối đa chờ token của domain cho 1 tin; hết -> hoãn tin đó xuống cuối lượt (thử lại 1 lần)
+REFRESH_WAIT = float(os.getenv("REFRESH_WAIT", "30") or "30")
+
+# Các trường dùng để tính fingerprint (không gồm _source vì đổi theo strategy)
+FINGERPRINT_FIELDS = ("title", "price", "area", "description", "image", "contact")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS listings (
+    link          TEXT PRIMARY KEY,
+    data          TEXT NOT NULL,
+    fields_hash   TEXT NOT NULL,
+    html_hash     TEXT NOT NULL DEFAULT '',
+    etag          TEXT NOT NULL DEFAULT '',
+    last_modified TEXT NOT NULL DEFAULT '',
+    status        TEXT NOT NULL DEFAULT 'active',
+    checked_at    REAL NOT NULL,
+    changed_at    REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS changes (
+    id    INTEGER PRIMARY KEY AUTOINCREMENT,
+    link  TEXT NOT NULL,
+    kind  TEXT NOT NULL,
+    old   TEXT NOT NULL DEFAULT '',
+    new   TEXT NOT NULL DEFAULT '',
+    at    REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_changes_at ON changes(at);
+"""
+
+
+def _sha1(s: str) -> str:
+    return hashlib.sha1((s or "").encode("utf-8", "ignore")).hexdigest()
+
+
+def fingerprint(data: dict) -> str:
+    return _sha1(json.dumps([data.get(k) or "" for k in FINGERPRINT_FIELDS], ensure_ascii=False))
+
+
+class ListingStore:
+    """Kho SQLite lưu tin + fingerprint + change feed (an toàn đa luồng qua 1 lock)."""
+
+    def __init__(self, path: str = LISTING_DB):
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.executescript(_SCHEMA)
+
+    def get(self, link: str) -> Optional[sqlite3.Row]:
+        with self._lock:
+            return self._conn.execute("SELECT * FROM listings WHERE link = ?", (link,)).fetchone()
+
+    def upsert(self, link: str, data: dict, html_hash: str, validators: dict, status: str, changed: bool) -> None:
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                """
+                INSERT INTO listings (link, data, fields_hash, html_hash, etag, last_modified, status, checked_at, changed_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(link) DO UPDATE SET
+                    data = excluded.data, fields_hash = excluded.fields_hash, html_hash = excluded.html_hash,
+                    etag = excluded.etag, last_modified = excluded.last_modified, status = excluded.status,
+                    checked_at = excluded.checked_at,
+                    changed_at = CASE WHEN ? THEN excluded.changed_at ELSE listings.changed_at END
+                """,
+                (link, json.dumps(data, ensure_ascii=False), fingerprint(data), html_hash,
+                 validators.get("etag", ""), validators.get("last_modified", ""), status, now, now, int(changed)),
+            )
+
+    def touch(self, link: str) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("UPDATE listings SET checked_at = ? WHERE link = ?", (time.time(), link))
+
+    def add_change(self, link: str, kind: str, old: str = "", new: str = "") -> dict:
+        ev = {"link": link, "kind": kind, "old": old or "", "new": new or "", "at": time.time()}
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO changes (link, kind, old, new, at) VALUES (?, ?, ?, ?, ?)",
+                (ev["link"], ev["kind"], ev["old"], ev["new"], ev["at"]),
+            )
+        return ev
+
+    def changes_since(self, ts: float = 0.0) -> List[dict]:
+        with self._lock:
+            rows = self._conn.execute("SELECT link, kind, old, new, at FROM changes WHERE at > ? ORDER BY at", (ts,))
+            return [dict(r) for r in rows.fetchall()]
+
+
+def _diff(link: str, old: dict, new: dict, store: ListingStore) -> List[dict]:
+    events = []
+    if (old.get("price") or "") != (new.get("price") or ""):
+        a, b = price_to_vnd(old.get("price", "")), price_to_vnd(new.get("price", ""))
+        kind = "price_changed"
+        if a is not None and b is not None and a != b:
+            kind = "price_drop" if b < a else "price_up"
+        events.append(store.add_change(link, kind, old.get("price", ""), new.get("price", "")))
+    other = [k for k in FINGERPRINT_FIELDS if k != "price" and (old.get(k) or "") != (new.get(k) or "")]
+    if other:
+        events.append(store.add_change(link, "updated", ",".join(other), ""))
+    return events
+
+
+class Deferred(RuntimeError):
+    """Chưa tải được lúc này (breaker đang mở / chờ token quá REFRESH_WAIT): giữ bản cũ, thử lại sau."""
+
+
+def _fetch(link: str, row: Optional[sqlite3.Row]) -> Tuple[int, str, dict, str]:
+    """Trả (status, html, validators, source). Site render tĩnh -> GET có điều kiện; site cần JS -> get_html."""
+    spec = site_for(link)
+    strategy = spec.default_strategy if spec else "requests"
+    if strategy == "requests":
+        domain = urlparse(link).netloc.lower()
+        if not throttle.allow(domain, "requests"):
+            raise Deferred(f"Circuit open: {domain}")
+        if not throttle.acquire(domain, timeout=dl.timeout(REFRESH_WAIT, minimum=0.0)):
+            raise Deferred(f"rate limit: {domain}")
+        try:
+            status, html, validators = fetch_conditional(
+                link,
+                etag=row["etag"] if row else "",
+                last_modified=row["last_modified"] if row else "",
+            )
+        except BlockedError as e:
+            throttle.record_block(domain, "requests", str(e))
+            raise
+        throttle.record_success(domain, "requests")
+        return status, html, validators, "requests"
+    try:
+        return 200, get_html(link, strategy), {}, strategy
+    except requests.HTTPError as e:
+        # mọi fetcher (requests / cloudscraper / Playwright) gắn status vào e.response
+        code = getattr(getattr(e, "response", None), "status_code", 0)
+        if code in GONE_STATUS:
+            return code, "", {}, strategy
+        raise
+
+
+def _is_stale(row: sqlite3.Row, link: str, now: float) -> bool:
+    spec = site_for(link)
+    ttl = spec.ttl if spec else 6 * 3600
+    return now - row["checked_at"] >= ttl
+
+
+def refresh_one(link: str, store: ListingStore, force: bool = False) -> Tuple[dict, List[dict]]:
+    """Refresh 1 tin; trả (data, events). Tin còn trong TTL -> trả bản đã lưu, không tải lại."""
+    spec = site_for(link)
+    if spec is None or spec.parser is None:
+        return extract_info_generic(link), []   # domain không hỗ trợ: không tải trang (thông báo, không lưu)
+    row = store.get(link)
+    if row and not force and not _is_stale(row, link, time.time()):
+        return json.loads(row["data"]), []
+
+    status, html, validators, source = _fetch(link, row)
+
+    if status in GONE_STATUS:
+        if row and row["status"] != "removed":
+            old = json.loads(row["data"])
+            store.upsert(link, old, row["html_hash"], {}, "removed", changed=True)
+            return old | {"_status": "removed"}, [store.add_change(link, "removed", old.get("price", ""), "")]
+        return {"link": link, "_status": "removed"}, []
+
+    if status == 304 and row:
+        store.touch(link)
+        return json.loads(row["data"]), []
+
+    html_hash = _sha1(html)
+    if row and row["html_hash"] == html_hash:
+        # HTML thô không đổi -> bỏ qua parse
+        store.touch(link)
+        return json.loads(row["data"]), []
+
+    data = parse_listing(spec.parser, link, html, source=source, fast=spec.fast_parser).to_dict()
+
+    events: List[dict] = []
+    if not row:
+        events.append(store.add_change(link, "new", "", data.get("price", "")))
+        changed = True
+    else:
+        old = json.loads(row["data"])
+        changed = fingerprint(old) != fingerprint(data)
+        if changed:
+            events.extend(_diff(link, old, data, store))
+        if row["status"] == "removed":
+            events.append(store.add_change(link, "relisted", "", data.get("price", "")))
+            changed = True
+    validators = validators or {"etag": row["etag"] if row else "", "last_modified": row["last_modified"] if row else ""}
+    store.upsert(link, data, html_hash, validators, "active", changed)
+    return data, events
+
+
+def refresh_listings(links: List[str], force: bool = False, store: Optional[ListingStore] = None) -> Tuple[List[Listing], List[dict]]:
+    """
+    Refresh danh sách link; trả (listings, change_feed). listings là Listing (gọn bộ nhớ cho lượt refresh lớn).
+    Lỗi tải 1 link không làm hỏng cả lượt: tin đó giữ bản cũ (nếu có).
+    Tin bị hoãn (breaker mở / chờ token quá REFRESH_WAIT giây) được thử lại 1 lần ở cuối lượt.
+    """
+    store = store or ListingStore()
+    results: List[Optional[Listing]] = [None] * len(links)
+    feed: List[dict] = []
+
+    def _one(i: int, link: str, last: bool) -> bool:
+        """False = bị hoãn (Deferred) và còn được thử lại."""
+        try:
+            data, events = refresh_one(link, store, force=force)
+        except Deferred:
+            if not last:
+                return False
+            data, events = _kept(link, store, "đang bị giới hạn / chặn, thử lại sau"), []
+        except Exception as e:
+            data, events = _kept(link, store, e), []
+        results[i] = as_listing(data)
+        feed.extend(events)
+        return True
+
+    deferred = [(i, link) for i, link in enumerate(links) if not _one(i, link, last=False)]
+    for i, link in deferred:   # token đã hồi / breaker có thể đã half-open
+        _one(i, link, last=True)
+    return results, feed
+
+
+def _kept(link: str, store: ListingStore, reason) -> dict:
+    row = store.get(link)
+    return json.loads(row["data"]) if row else {"link": link, "title": f"❌ Lỗi khi refresh: {reason}"}
+
+
+def main():
+    urls = [a for a in sys.argv[1:] if a.strip()]
+    if not urls:
+        print("Usage: python refresh.py <url1> <url2> ..."); sys.exit(1)
+    _, feed = refresh_listings(urls)
+    print(json.dumps(feed, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
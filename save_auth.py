@@ -0,0 +1,52 @@
+# save_auth.py
+# Mở trình duyệt (có giao diện) tới 1 trang của site để người dùng tự vượt CAPTCHA,
+# rồi lưu storage_state (cookie + localStorage) vào pool của domain (auth_states.py).
+#   python save_auth.py <url> [tên]        -> auth_states/<domain>/<tên>.json
+#   python save_auth.py <url> --out x.json -> ghi đúng file x.json (vd. SiteSpec.storage_state cũ)
+# Chạy nhiều lần (khác tên / khác mạng) để có nhiều state cho fetchers xoay vòng.
+import sys
+from urllib.parse import urlparse
+
+from playwright.sync_api import sync_playwright
+
+from auth_states import default_pool
+from sites import normalize_host, site_for
+
+
+def save_auth(url: str, name: str = "", out: str = "") -> str:
+    spec = site_for(url)
+    domain = spec.domain if spec else normalize_host(urlparse(url).netloc)
+    with sync_playwright() as p:
+        browser = p.chromium.launch(headless=False)  # Bật trình duyệt để tick CAPTCHA
+        context = browser.new_context()
+        page = context.new_page()
+
+        # Mở link bất kỳ của site để xác thực robot
+        page.goto(url)
+        print("👉 Tick CAPTCHA nếu có. Sau đó quay lại đây.")
+
+        # Chờ bạn tick CAPTCHA xong
+        input("⏳ Nhấn Enter sau khi đã xác minh robot...")
+
+        # Lưu storage (cookie + localStorage)
+        if out:
+            context.storage_state(path=out)
+            path = out
+        else:
+            path = default_pool().save(domain, context, name)
+        print(f"✅ Đã lưu session vào {path}")
+
+        browser.close()
+    return path
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    if not args:
+        sys.exit("Cách dùng: python save_auth.py <url> [tên] [--out file.json]")
+    out = ""
+    if "--out" in args:
+        i = args.index("--out")
+        out = args[i + 1] if i + 1 < len(args) else ""
+        del args[i:i + 2]
+    save_auth(args[0], args[1] if len(args) > 1 else "", out)
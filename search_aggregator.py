@@ -1,31 +1,233 @@
 # search_aggregator.py
-import os, time, re, requests
+# Gom link CHI TIẾT từ mọi site đã đăng ký (sites/SITES) song song:
+# - mỗi site 1 producer: trang tìm kiếm của chính site (search_url, xem sites/utils_query) trước,
+#   thiếu mới bổ sung bằng Google CSE siteSearch (giới hạn ~100 kết quả, tốn quota)
+# - link nào về trước thì đưa ra trước (generator) -> caller trích xuất ngay, không chờ gom xong
+# - ghép theo priority / quota của SiteSpec (ghi đè bằng env SITE_PRIORITY / SITE_QUOTA)
+# - lọc trước khi trích xuất theo câu tìm kiếm đã parse (sites/utils_query): slug URL sai quận / sai giao dịch,
+#   card có giá / diện tích ngoài khoảng -> bỏ, không tốn lượt tải trang chi tiết
+from __future__ import annotations
+import os
+import queue
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, List, Optional, Tuple
 from urllib.parse import urlparse
-from sites import pick_site
-from fetchers import get_html
 
-# ... (hàm gọi Google CSE giống file cũ của bạn) ...
+import deadline as dl
+import throttle
+from category_crawler import card_to_result, crawl_category
+from crawler import extract_info_generic
+from listing import Listing
+from search_google import DETAIL_PATTERNS, _call_google, _parse_whitelist
+from sites import SITES, SiteSpec, canon_url, site_for
+from sites.utils_query import SearchQuery, parse_query
+
+DISCOVERY_WORKERS = int(os.getenv("DISCOVERY_WORKERS", "6") or "6")   # số site gom link song song
+NATIVE_SEARCH = os.getenv("NATIVE_SEARCH", "1") != "0"                # 0 -> chỉ dùng Google CSE
+QUERY_FILTERS = os.getenv("QUERY_FILTERS", "1") != "0"                # 0 -> không lọc theo câu tìm kiếm
+
+
+def query_filters(query: str) -> Optional[SearchQuery]:
+    """Câu tìm kiếm đã parse (dùng làm bộ lọc), hoặc None nếu tắt QUERY_FILTERS."""
+    return parse_query(query) if QUERY_FILTERS else None
 
-DETAIL_PATTERNS = re.compile(r"(?:-pr\d+|-\d{6,}\.(?:htm|html)$|/tin-\d+)", re.I)
 
 def extract_one(link: str) -> dict:
-    picked = pick_site(link)
-    if not picked:
-        return {"link": link, "title": "❓Không hỗ trợ domain", "price": "", "area": "",
-                "description": "", "image": "", "contact": ""}
+    # Dùng chung engine với search_google (crawler.extract_info_generic: single-flight, throttle,
+    # browser pool, Google Cache fallback). FORCE_STRATEGY để ép strategy khi debug.
+    return extract_info_generic(link, os.getenv("FORCE_STRATEGY", "") or None)
+
+
+# ---------- Kế hoạch: site nào, ưu tiên / quota bao nhiêu ----------
+def _parse_pairs(name: str) -> Dict[str, int]:
+    """"batdongsan.com.vn:10, alonhadat.com.vn:5" -> {domain: int}"""
+    out: Dict[str, int] = {}
+    for part in os.getenv(name, "").split(","):
+        dom, _, val = part.strip().rpartition(":")
+        if dom and val.strip().lstrip("-").isdigit():
+            out[dom.strip().lower()] = int(val)
+    return out
+
+
+def discovery_plan(domains: Optional[List[str]] = None) -> List[Tuple[SiteSpec, int, int]]:
+    """
+    [(spec, priority, quota)] theo priority tăng dần, bỏ site đang bị chặn (breaker mở).
+    domains=None: mọi site trong SITES; có SITE_WHITELIST thì chỉ batdongsan + whitelist (như code cũ).
+    """
+    if domains is None:
+        wl = _parse_whitelist()
+        domains = (["batdongsan.com.vn"] + wl) if wl else SITES.domains()
+    prio, quota = _parse_pairs("SITE_PRIORITY"), _parse_pairs("SITE_QUOTA")
+    plan, seen = [], set()
+    for dom in domains:
+        spec = SITES.get(dom)
+        if spec is None or spec.domain in seen or throttle.domain_blocked(spec.domain):
+            continue
+        seen.add(spec.domain)
+        plan.append((spec, prio.get(spec.domain, spec.priority), quota.get(spec.domain, spec.quota)))
+    plan.sort(key=lambda t: t[1])
+    return plan
+
+
+# ---------- Producer: link chi tiết của 1 site ----------
+def _site_links(query: str, spec: SiteSpec, need: int, stop: threading.Event,
+                sq: Optional[SearchQuery] = None) -> Iterator[Tuple[str, Optional[Listing]]]:
+    """(link, card|None) của 1 site: trang tìm kiếm của site trước (kèm card), rồi Google CSE siteSearch."""
+    mod = spec.load()
+    found = set()
+
+    search_url = getattr(mod, "search_url", None) if mod and NATIVE_SEARCH else None
+    if search_url:
+        try:
+            url = search_url(query)
+        except Exception:
+            url = ""
+        if url:
+            strategy = getattr(mod, "SEARCH_STRATEGY", None)
+            for c in crawl_category(url, max_items=need, strategy=strategy, site=spec):
+                cu = canon_url(c.link)
+                if sq is not None and not (sq.url_ok(cu) and sq.listing_ok(c)):
+                    continue
+                if cu not in found:
+                    found.add(cu)
+                    yield cu, c
+            if len(found) >= need:
+                return
+
+    hints = getattr(mod, "CSE_HINTS", ()) if mod else ()
+    detail_cards = getattr(mod, "detail_cards", None) if mod else None   # vd. nhatot: card từ gateway API
+    text = (sq.search_text if sq is not None else "") or query   # bỏ phần giá / diện tích: CSE khớp theo chữ
+    variants = [text] + [f"{text} {h}" for h in hints] + list(hints)
+    extra = {"siteSearch": spec.domain, "siteSearchFilter": "i"}
+    for q in variants:
+        if stop.is_set() or len(found) >= need or dl.expired():
+            return
+        try:
+            links = _call_google(q, want=min(20, need * 2), extra=extra)
+        except Exception:
+            continue
+        fresh = [u for u in links if u not in found and spec.is_detail(u) and (sq is None or sq.url_ok(u))]
+        fresh = fresh[:need - len(found)]
+        got: dict = {}
+        if detail_cards is not None and fresh:
+            try:
+                got = detail_cards(fresh)   # tra cả lô song song thay vì từng trang chi tiết
+            except Exception:
+                got = {}
+        for u in fresh:
+            found.add(u)
+            card = card_to_result(got[u], "api") if u in got else None
+            if card is not None and sq is not None and not sq.listing_ok(card):
+                continue
+            yield u, card
+        if len(found) >= need:
+            return
+
 
-    parser, default_strategy = picked
-    strategy = os.getenv("FORCE_STRATEGY", "") or default_strategy
+def _produce(out: "queue.Queue", stop: threading.Event, query: str, spec: SiteSpec, need: int,
+             sq: Optional[SearchQuery]) -> None:
     try:
-        html = get_html(link, strategy)
-        data = parser(link, html)
-        data["_source"] = strategy
-        return data
-    except Exception as e:
-        return {"link": link, "title": f"❌ Lỗi khi trích xuất: {e}",
-                "price": "", "area": "", "description": "", "image": "", "contact": ""}
-
-def crawl_detail_links(query: str, target_total: int = 30) -> list[str]:
-    # giữ nguyên thuật toán ưu tiên batdongsan -> alonhadat từ code cũ của bạn
-    # (dựa vào Custom Search API + siteSearch + pattern DETAIL_PATTERNS)
-    ...
+        for link, card in _site_links(query, spec, need, stop, sq):
+            if stop.is_set():
+                break
+            out.put((spec.domain, link, card))
+    except Exception:
+        pass  # 1 site lỗi không ảnh hưởng các site khác
+    finally:
+        out.put((spec.domain, None, None))  # báo site này đã xong
+
+
+# ---------- Ghép ----------
+def iter_detail_links(query: str, target_total: int = 30, cards: Optional[dict] = None,
+                      domains: Optional[List[str]] = None, sq: Optional[SearchQuery] = None) -> Iterator[str]:
+    """
+    Sinh link chi tiết (đã canon, không trùng) ngay khi producer tìm thấy, tối đa target_total.
+    - Mỗi site lấy tối đa quota link (quota 0 -> tới target_total).
+    - Site ưu tiên cao hơn mà chưa xong được giữ chỗ phần quota còn thiếu: link của site ưu tiên thấp
+      vượt phần còn trống bị hoãn lại, tới khi site kia xong (hoặc hết link) mới được đưa ra.
+    - Mọi site xong mà vẫn thiếu -> gọi CSE chung và lọc trang chi tiết.
+    cards: dict truyền vào sẽ được điền link -> card tóm tắt (Listing) khi link đến từ trang tìm kiếm của site.
+    Dừng đọc generator giữa chừng -> các producer được báo dừng.
+    sq: bộ lọc (mặc định parse từ query, xem query_filters) — link/card không khớp bị bỏ trước khi trích xuất.
+    """
+    target_total = int(target_total or 30)
+    sq = sq if sq is not None else query_filters(query)
+    plan = discovery_plan(domains)
+    prio = {s.domain: p for s, p, _ in plan}
+    cap = {s.domain: (q or target_total) for s, _, q in plan}
+    held = {s.domain: q for s, _, q in plan if q}   # site có giữ chỗ
+    count = {s.domain: 0 for s, _, _ in plan}
+    pending: Dict[str, deque] = {s.domain: deque() for s, _, _ in plan}
+    running = set(count)
+    seen: set = set()
+    total = 0
+
+    def _reserved(dom: str) -> int:
+        return sum(max(0, held[d] - count[d]) for d in running if d in held and prio[d] < prio[dom])
+
+    def _admit(dom: str) -> bool:
+        return count[dom] < cap[dom] and total + _reserved(dom) < target_total
+
+    out: "queue.Queue" = queue.Queue()
+    stop = threading.Event()
+    pool = ThreadPoolExecutor(max_workers=max(1, min(DISCOVERY_WORKERS, len(plan) or 1)),
+                              thread_name_prefix="discover")
+    try:
+        for spec, _, q in plan:
+            dl.submit(pool, _produce, out, stop, query, spec, q or target_total, sq)   # giữ deadline của search
+
+        while running and total < target_total:
+            try:
+                left = dl.remaining()   # không có deadline -> chờ tới khi có link
+                dom, link, card = out.get(timeout=None if left is None else max(0.0, left))
+            except queue.Empty:
+                return  # hết hạn của lượt search (deadline.py): dừng, không gọi thêm CSE
+            if link is None:
+                running.discard(dom)
+            elif link not in seen:
+                seen.add(link)
+                if card is not None and cards is not None:
+                    cards[link] = card | {"link": link}
+                pending[dom].append(link)
+            # đưa ra mọi link đủ điều kiện, site ưu tiên cao trước
+            for d in sorted(pending, key=prio.__getitem__):
+                while pending[d] and total < target_total and _admit(d):
+                    count[d] += 1
+                    total += 1
+                    yield pending[d].popleft()
+
+        # mọi site đã xong: giải phóng giữ chỗ, lấp phần còn lại theo ưu tiên
+        for d in sorted(pending, key=prio.__getitem__):
+            while pending[d] and total < target_total and count[d] < cap[d]:
+                count[d] += 1
+                total += 1
+                yield pending[d].popleft()
+    finally:
+        stop.set()
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    if total >= target_total or domains is not None or dl.expired():
+        return
+    try:
+        extra_links = _call_google((sq.search_text if sq is not None else "") or query, want=target_total * 2)
+    except Exception:
+        return
+    for u in extra_links:
+        if total >= target_total:
+            break
+        spec = site_for(u)
+        if u in seen or (spec is not None and throttle.domain_blocked(spec.domain)):
+            continue
+        if sq is not None and not sq.url_ok(u):
+            continue
+        if (spec.is_detail(u) if spec else False) or DETAIL_PATTERNS.search(urlparse(u).path or ""):
+            seen.add(u)
+            total += 1
+            yield u
+
+
+def crawl_detail_links(query: str, target_total: int = 30) -> List[str]:
+    """List link chi tiết từ mọi site (xem iter_detail_links); cần trích xuất dần thì dùng iter_detail_links."""
+    return list(iter_detail_links(query, target_total))
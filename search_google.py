@@ -1,11 +1,30 @@
 import os
 import re
-import time
-from urllib.parse import urlparse, urljoin, urlunparse
+import itertools
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+from urllib.parse import urlparse, urljoin
 
 import requests
 from bs4 import BeautifulSoup
+
+import deadline as dl
+from category_crawler import crawl_category, supports_listing
 from crawler import extract_info_generic
+from singleflight import SingleFlight
+from listing import as_listing, quality
+from sites import canon_url
+from thumbs import prefetch as prefetch_thumbs
+
+# 0 -> không mở trang chi tiết khi đã có card tóm tắt từ trang danh mục (nhanh hơn nhiều)
+FETCH_DETAILS = os.getenv("FETCH_DETAILS", "1") != "0"
+EXTRACT_WORKERS = int(os.getenv("EXTRACT_WORKERS", "4") or "4")   # số tin trích xuất song song / search
+QUALITY_MIN = float(os.getenv("QUALITY_MIN", "0.55") or "0.55")     # điểm listing.quality của 1 tin "tốt"
+DISCOVERY_OVERFETCH = int(os.getenv("DISCOVERY_OVERFETCH", "3") or "3")  # gom dư link để bù tin hỏng
+# giây / search (0 = không giới hạn); là deadline cho MỌI tầng bên dưới (CSE, fetch, Playwright, Google Cache)
+SEARCH_TIME_BUDGET = float(os.getenv("SEARCH_TIME_BUDGET", "30") or "0")
 
 # --------- HTTP defaults ----------
 UA = (
@@ -36,18 +55,8 @@ def _get_env():
     return api_key, cx
 
 
-def _canon_url(s: str) -> str:
-    """Chuẩn hóa URL để khử trùng lặp: bỏ fragment/query, bỏ '/' cuối."""
-    try:
-        p = urlparse(s)
-        p = p._replace(query="", fragment="")
-        path = p.path or "/"
-        if path != "/" and path.endswith("/"):
-            path = path[:-1]
-        p = p._replace(path=path)
-        return urlunparse(p)
-    except Exception:
-        return s
+# Chuẩn hóa URL để khử trùng lặp: bỏ fragment/query, bỏ '/' cuối (dùng chung với crawler)
+_canon_url = canon_url
 
 
 def _parse_whitelist() -> list[str]:
@@ -64,11 +73,20 @@ def _parse_whitelist() -> list[str]:
 
 
 # ---------- Google CSE ----------
+_CSE_FLIGHT = SingleFlight()
+
+
 def _call_google(query: str, want: int, extra: dict | None = None) -> list[str]:
     """
     Gọi Google CSE API (tự phân trang, num<=10/trang) và trả danh sách link đã canon + dedup.
     extra: tham số bổ sung (vd: {"siteSearch": "batdongsan.com.vn", "siteSearchFilter": "i"})
+    Nhiều user gửi cùng query đồng thời -> chỉ 1 lượt gọi API (single-flight).
     """
+    key = (query.strip().lower(), int(want), tuple(sorted((extra or {}).items())))
+    return _CSE_FLIGHT.do(key, dl.guard, _call_google_uncoalesced, query, want, extra)
+
+
+def _call_google_uncoalesced(query: str, want: int, extra: dict | None = None) -> list[str]:
     api_key, cx = _get_env()
     url = "https://www.googleapis.com/customsearch/v1"
     want = max(1, int(want))
@@ -90,7 +108,7 @@ def _call_google(query: str, want: int, extra: dict | None = None) -> list[str]:
         if extra:
             params.update(extra)
 
-        resp = requests.get(url, params=params, timeout=REQ_TIMEOUT, headers={"User-Agent": UA})
+        resp = requests.get(url, params=params, timeout=dl.timeout(REQ_TIMEOUT), headers={"User-Agent": UA})
         resp.raise_for_status()
         data = resp.json()
         if "error" in data:
@@ -117,116 +135,26 @@ def _call_google(query: str, want: int, extra: dict | None = None) -> list[str]:
     return out[:want]
 
 
-# ---------- Lấy link CHI TIẾT cho 1 domain (ưu tiên batdongsan) ----------
-def _detail_links_for_domain(query: str, domain: str, need: int, already: set[str]) -> list[str]:
-    """
-    Lấy trực tiếp link CHI TIẾT từ Google CSE cho 1 domain:
-    - Dùng siteSearch + inurl để bắt pattern trang chi tiết (không fetch HTML danh mục).
-    - Tốc độ nhanh, tránh bị chặn từ batdongsan.
-    """
-    need = max(0, int(need))
-    if need == 0:
-        return []
-
-    variants = [
-        {"q": query, "extra": {"siteSearch": domain, "siteSearchFilter": "i"}},
-        {"q": f"{query} inurl:-pr", "extra": {"siteSearch": domain, "siteSearchFilter": "i"}},
-        {"q": f"{query} inurl:/tin-", "extra": {"siteSearch": domain, "siteSearchFilter": "i"}},
-        {"q": "inurl:-pr", "extra": {"siteSearch": domain, "siteSearchFilter": "i"}},
-        {"q": "inurl:/tin-", "extra": {"siteSearch": domain, "siteSearchFilter": "i"}},
-    ]
-
-    found: list[str] = []
-    for v in variants:
-        if len(found) >= need:
-            break
-        try:
-            links = _call_google(v["q"], want=min(20, need * 2), extra=v["extra"])
-        except Exception:
-            continue
-        for u in links:
-            if u in already:
-                continue
-            if DETAIL_PATTERNS.search((urlparse(u).path or "")):
-                cu = _canon_url(u)
-                if cu not in already and cu not in found:
-                    found.append(cu)
-                    if len(found) >= need:
-                        break
-    return found[:need]
-
-
-# ---------- Lấy sublink cho alonhadat (quét trang danh mục) ----------
-def _sub_links_alonhadat(link: str, soup: BeautifulSoup, max_links: int) -> list[str]:
-    subs: list[str] = []
-    p0 = urlparse(link)
-    domain = p0.netloc.lower()
-    path0 = p0.path or "/"
-
-    # Trang chi tiết -> trả luôn
-    if re.search(r"-\d{6,}\.(?:htm|html)$", path0):
-        return [_canon_url(link)]
-
-    # Trang danh mục -> gom link chi tiết
-    detail_pat = re.compile(r"/[a-z0-9-]+-\d{6,}\.(?:htm|html)$", re.IGNORECASE)
-
-    candidates = []
-    candidates.extend(soup.select("h3 a[href]"))
-    candidates.extend(soup.select("div.content-item a[href]"))
-    candidates.extend(soup.select("a[href].vip, a[href].title"))
-
-    def _try_add(a_tag):
-        href = a_tag.get("href", "")
-        full = urljoin(link, href)
-        p = urlparse(full)
-        if p.scheme not in ("http", "https") or p.netloc.lower() != domain:
-            return
-        if detail_pat.search(p.path or ""):
-            cu = _canon_url(full)
-            if cu not in subs:
-                subs.append(cu)
-
-    for a in candidates:
-        _try_add(a)
-        if len(subs) >= max_links:
-            return subs[:max_links]
-
-    if len(subs) < max_links:
-        for a in soup.find_all("a", href=True):
-            _try_add(a)
-            if len(subs) >= max_links:
-                break
-
-    return subs[:max_links]
-
-
 def get_sub_links(link: str, max_links: int = 5) -> list:
     """
     - Nếu link chi tiết: trả luôn link đó (tránh fetch).
-    - Nếu alonhadat: quét trang danh mục (HTML) → lấy link chi tiết.
+    - Site có parser trang danh mục (sites/<site>.parse_list): dùng category_crawler.
     - Domain khác: nếu fetch được, gom link chi tiết theo pattern.
     """
     p0 = urlparse(link)
-    domain = (p0.netloc or "").lower()
     path0 = p0.path or "/"
 
     if DETAIL_PATTERNS.search(path0):
         return [_canon_url(link)]
 
-    # alonhadat: cần HTML để gỡ link chi tiết
-    if "alonhadat.com.vn" in domain:
-        try:
-            r = requests.get(link, headers={"User-Agent": UA}, timeout=REQ_TIMEOUT)
-            r.raise_for_status()
-            soup = BeautifulSoup(r.text, "lxml")
-            return _sub_links_alonhadat(link, soup, max_links)
-        except Exception:
-            return []
+    if supports_listing(link):
+        cards = crawl_category(link, max_pages=1, max_items=max_links)
+        return [_canon_url(c["link"]) for c in cards]
 
     # Domain khác: nếu fetch được, gom link chi tiết theo pattern
     subs: list[str] = []
     try:
-        r = requests.get(link, headers={"User-Agent": UA}, timeout=REQ_TIMEOUT)
+        r = requests.get(link, headers={"User-Agent": UA}, timeout=dl.timeout(REQ_TIMEOUT))
         r.raise_for_status()
         soup = BeautifulSoup(r.text, "lxml")
 
@@ -253,112 +181,178 @@ def get_sub_links(link: str, max_links: int = 5) -> list:
         return []
 
 
-# ---------- search_google (ưu tiên batdongsan, nhanh & ổn định) ----------
-def search_google(query: str, target_total: int = 30) -> list:
+# ---------- search_google (gom link song song mọi site, trích xuất ngay khi link về) ----------
+def _extract_one(link: str, card, fetch_details: bool):
+    """Listing cho 1 link chi tiết; trang lỗi/rỗng mà có card tóm tắt thì dùng card."""
+    if not fetch_details and card is not None:
+        prefetch_thumbs([card.get("image")])
+        return card
+    try:
+        info = extract_info_generic(link)
+        # trang chi tiết lỗi/không hỗ trợ/rỗng nhưng đã có card tóm tắt -> dùng card
+        if card is not None and (info.get("_source") in (None, "error") or not (info.get("title") or info.get("price"))):
+            info = card
+    except Exception as e:
+        info = {
+            "link": link,
+            "title": f"❌ Lỗi khi trích xuất: {e}",
+            "price": "",
+            "area": "",
+            "description": "",
+            "image": "",
+            "contact": "",
+        }
+    # "lịch sự" do throttle lo (token bucket theo domain), không cần sleep cố định
+    prefetch_thumbs([info.get("image")])  # thumbnail tải + resize nền, sẵn sàng khi render card
+    return as_listing(info)  # Listing: gọn bộ nhớ, mô tả nén
+
+
+def _deep_links(query: str, sq, need: int, seen: set, cards: dict):
+    """Link chi tiết từ trang danh mục trong kết quả CSE chung (bước cuối, có thể chậm)."""
+    max_top = int(os.getenv("MAX_TOP_LINKS", "5") or "5")
+    try:
+        top_links = _call_google((sq.search_text if sq is not None else "") or query, want=max_top)
+    except Exception:
+        return
+    for link in top_links:
+        if DETAIL_PATTERNS.search((urlparse(link).path or "")):
+            yield _canon_url(link)
+        elif supports_listing(link):
+            # crawl trang danh mục: gom hết link chi tiết + card tóm tắt
+            for c in crawl_category(link, max_items=need):
+                cs = _canon_url(c["link"])
+                if cs not in seen:
+                    cards[cs] = c | {"link": cs}  # Listing (card_to_result)
+                    yield cs
+        else:
+            for s in get_sub_links(link, max_links=5):
+                yield _canon_url(s)
+
+
+class SearchResults(list):
+    """list tin trả về từ search_google; truncated=True: hết time_budget khi chưa đủ tin (kết quả một phần)."""
+    truncated = False
+
+
+def search_google(query: str, target_total: int = 30, fetch_details: bool = FETCH_DETAILS,
+                  on_progress: Callable[[int, int], None] | None = None,
+                  min_quality: float = QUALITY_MIN, time_budget: float = SEARCH_TIME_BUDGET) -> list:
     """
-    Trả về list dict tin rao: title, price, area, description, image, contact, link.
-    Chiến lược nhanh:
-      1) Ưu tiên batdongsan.com.vn → kéo link CHI TIẾT trực tiếp (CSE siteSearch + inurl).
-      2) Bổ sung từ các domain khác trong SITE_WHITELIST (alonhadat…).
-      3) Nếu vẫn thiếu: gọi CSE chung & lọc CHI TIẾT; cuối cùng mới đào sâu danh mục (có thể chậm).
+    Trả về list tin rao (Listing): title, price, area, description, image, contact, link.
+    Mục tiêu là target_total tin TỐT (listing.quality >= min_quality), không phải target_total link:
+      1) Gom link CHI TIẾT song song từ mọi site đã đăng ký (search_aggregator.iter_detail_links:
+         trang tìm kiếm của site + CSE siteSearch, ghép theo priority/quota — batdongsan vẫn đứng đầu),
+         gom dư DISCOVERY_OVERFETCH lần để bù tin lỗi / rỗng / CAPTCHA.
+      2) Link nào về là đưa ngay vào EXTRACT_WORKERS luồng trích xuất (tối đa 2 x EXTRACT_WORKERS tin chờ).
+      3) Hết link mà vẫn thiếu: crawl trang danh mục từ kết quả CSE chung.
+      Đủ target_total tin tốt hoặc hết time_budget giây -> dừng gom link, huỷ các tin chưa chạy.
+    time_budget là deadline (deadline.py) truyền xuống mọi tầng: timeout của CSE / requests / Playwright co lại
+    theo thời gian còn lại, hết hạn thì không thử Google Cache nữa. Tin đang trích xuất dở lúc hết hạn mà đã có
+    card tóm tắt thì trả card (kết quả một phần thay vì lỗi).
+    Câu tìm kiếm được parse thành bộ lọc (sites/utils_query): link / card sai quận, sai giao dịch, ngoài khoảng
+    giá / diện tích bị bỏ trước khi trích xuất; tin trích xuất xong cũng được lọc lại theo giá / diện tích.
+    Kết quả: tin tốt theo thứ tự link, thiếu thì bù tin kém hơn (điểm > 0) theo điểm giảm dần.
+    Bị cắt vì hết hạn khi chưa đủ target_total tin tốt -> kết quả có .truncated = True (đừng cache lâu).
+    fetch_details=False: link nào đã có card tóm tắt thì dùng luôn, không mở trang chi tiết.
+    on_progress(good, target_total): gọi sau mỗi tin được trích xuất (dùng cho job chạy nền).
     """
-    target_total = int(target_total or 30)
-    first_batch = min(10, target_total)  # 10 tin đầu
-    results: list[dict] = []
-    detail_links: list[str] = []
-    seen_links: set[str] = set()
-
-    # --- 1) Ưu tiên batdongsan ---
-    need_bds = first_batch
-    bds_links = _detail_links_for_domain(query, "batdongsan.com.vn", need_bds, seen_links)
-    for u in bds_links:
-        if u not in seen_links:
-            seen_links.add(u)
-            detail_links.append(u)
-
-    # --- 2) Bổ sung alonhadat & các domain whitelist khác ---
-    if len(detail_links) < first_batch:
-        wl = _parse_whitelist() or ["alonhadat.com.vn"]
-        for dom in wl:
-            if dom == "batdongsan.com.vn":
-                continue
-            need = first_batch - len(detail_links)
-            if need <= 0:
-                break
-            more = _detail_links_for_domain(query, dom, need, seen_links)
-            for u in more:
-                if u not in seen_links:
-                    seen_links.add(u)
-                    detail_links.append(u)
-
-    # --- 3) Nếu vẫn thiếu cho tổng target_total: mở rộng tìm kiếm ---
-    if len(detail_links) < target_total:
-        # ưu tiên whitelist thêm 1 lượt nữa
-        wl2 = _parse_whitelist() or ["batdongsan.com.vn", "alonhadat.com.vn"]
-        for dom in wl2:
-            need = target_total - len(detail_links)
-            if need <= 0:
-                break
-            more = _detail_links_for_domain(query, dom, need, seen_links)
-            for u in more:
-                if u not in seen_links:
-                    seen_links.add(u)
-                    detail_links.append(u)
-                    if len(detail_links) >= target_total:
-                        break
+    from search_aggregator import iter_detail_links, query_filters  # import trễ: search_aggregator import module này
 
-        # nếu vẫn thiếu → gọi CSE chung (không giới hạn domain) và lọc trang chi tiết
-        if len(detail_links) < target_total:
-            extra_links = _call_google(query, want=target_total * 2)
-            for u in extra_links:
-                if u in seen_links:
+    target_total = int(target_total or 30)
+    sq = query_filters(query)  # giao dịch / quận / khoảng giá, diện tích tách từ câu tìm kiếm
+    cards: dict = {}   # link chi tiết -> card tóm tắt (Listing) từ trang danh mục / tìm kiếm
+    order: list[str] = []
+    seen: set[str] = set()
+    stop = threading.Event()
+    slots = threading.Semaphore(max(1, EXTRACT_WORKERS) * 2)   # giới hạn tin đã gửi mà chưa xong
+    done_q: "queue.Queue" = queue.Queue()
+    pool = ThreadPoolExecutor(max_workers=max(1, EXTRACT_WORKERS), thread_name_prefix="extract")
+
+    def _ok(link: str) -> bool:
+        return sq is None or (sq.url_ok(link) and (link not in cards or sq.listing_ok(cards[link])))
+
+    def _feed() -> None:
+        # chạy trên thread riêng: gom link (có thể chờ mạng) không chặn vòng nhận kết quả / kiểm tra deadline
+        gens = (iter_detail_links(query, target_total * DISCOVERY_OVERFETCH, cards=cards, sq=sq),
+                _deep_links(query, sq, target_total, seen, cards))
+        try:
+            for link in itertools.chain(*gens):
+                if stop.is_set():
+                    break
+                if link in seen or not _ok(link):
                     continue
-                if DETAIL_PATTERNS.search((urlparse(u).path or "")):
-                    cu = _canon_url(u)
-                    seen_links.add(cu)
-                    detail_links.append(cu)
-                    if len(detail_links) >= target_total:
-                        break
-
-    # --- 4) Cuối cùng, nếu vẫn thiếu → đào sâu trang danh mục (có thể chậm) ---
-    if len(detail_links) < target_total:
-        max_top = int(os.getenv("MAX_TOP_LINKS", "5") or "5")
-        top_links = _call_google(query, want=max_top)
-        # gom sublinks theo pattern
-        for link in top_links:
-            if len(detail_links) >= target_total:
-                break
-            if DETAIL_PATTERNS.search((urlparse(link).path or "")):
-                cu = _canon_url(link)
-                if cu not in seen_links:
-                    seen_links.add(cu)
-                    detail_links.append(cu)
-            else:
-                subs = get_sub_links(link, max_links=5)
-                for s in subs:
-                    cs = _canon_url(s)
-                    if cs not in seen_links:
-                        seen_links.add(cs)
-                        detail_links.append(cs)
-                        if len(detail_links) >= target_total:
-                            break
-
-    # --- 5) Trích xuất nội dung cho các link đã gom ---
-    for link in detail_links[:target_total]:
+                while not slots.acquire(timeout=0.2):
+                    if stop.is_set():
+                        return
+                seen.add(link)
+                order.append(link)
+                fut = dl.submit(pool, _extract_one, link, cards.get(link), fetch_details)
+                fut.add_done_callback(lambda f, link=link: (slots.release(), done_q.put((link, f))))
+        except Exception:
+            pass  # lỗi gom link: giữ các tin đã có
+        finally:
+            for g in gens:
+                g.close()  # báo producer của search_aggregator dừng
+            done_q.put(None)  # hết link
+
+    results: dict = {}
+    good = 0
+    fed_all = False
+    truncated = False
+
+    def _take(link: str, info) -> None:
+        nonlocal good
+        # lọc sau trích xuất: giá / diện tích thật của tin nằm ngoài khoảng người dùng hỏi -> bỏ
+        if sq is not None and not sq.listing_ok(info):
+            results[link] = None
+            return
+        score = quality(info)
+        results[link] = (score, info)
+        if score >= min_quality:
+            good += 1
+        if on_progress:
+            on_progress(good, target_total)
+    with dl.deadline(time_budget):
+        feeder = threading.Thread(target=dl.bind(_feed), name="search-feed", daemon=True)
+        feeder.start()
         try:
-            info = extract_info_generic(link)
-        except Exception as e:
-            info = {
-                "link": link,
-                "title": f"❌ Lỗi khi trích xuất: {e}",
-                "price": "",
-                "area": "",
-                "description": "",
-                "image": "",
-                "contact": "",
-            }
-        results.append(info)
-        # giảm delay để tăng tốc (0.1s), vẫn "lịch sự"
-        time.sleep(0.1)
-
-    return results
+            if on_progress:
+                on_progress(0, target_total)
+            while good < target_total:
+                if fed_all and len(results) >= len(order):
+                    break
+                timeout = dl.remaining()
+                if timeout is not None and timeout <= 0:
+                    break
+                try:
+                    item = done_q.get(timeout=timeout)
+                except queue.Empty:
+                    break  # hết time_budget: trả phần đã có
+                if item is None:
+                    fed_all = True
+                    continue
+                link, fut = item
+                if fut.cancelled():
+                    continue
+                _take(link, fut.result())
+            truncated = good < target_total and dl.expired()
+        finally:
+            stop.set()
+            pool.shutdown(wait=False, cancel_futures=True)  # tin chưa chạy bị huỷ; tin đang chạy chạy nốt ở nền
+
+    # hết hạn giữa chừng: tin đang trích xuất dở mà có card tóm tắt -> dùng card
+    if good < target_total:
+        for link in list(order):
+            if link not in results and cards.get(link) is not None:
+                _take(link, as_listing(cards[link]))
+
+    done = [(link, results[link]) for link in order if results.get(link)]
+    best = [info for _, (score, info) in done if score >= min_quality][:target_total]
+    if len(best) < target_total:
+        rest = sorted((r for _, r in done if 0 < r[0] < min_quality), key=lambda r: -r[0])
+        best += [info for _, info in rest[:target_total - len(best)]]
+    if not best:  # không có gì dùng được: trả tin lỗi để người dùng thấy lý do
+        best = [info for _, (_, info) in done][:target_total]
+    out = SearchResults(best)
+    out.truncated = truncated
+    return out
@@ -0,0 +1,68 @@
+# singleflight.py
+# Gộp các lời gọi trùng nhau đang chạy đồng thời (single-flight):
+# nhiều user cùng tìm 1 quận -> cùng 1 URL / 1 query CSE chỉ được tải + parse 1 lần,
+# các caller đến sau chờ và nhận chung kết quả (hoặc chung exception) của lời gọi đầu tiên.
+# Chỉ gộp lời gọi ĐANG chạy; xong là xoá khỏi bảng (không phải cache).
+# Lời gọi đầu hết deadline của chính nó (DeadlineExceeded, deadline.py) mà caller đến sau còn thời gian
+# (hoặc không có deadline) -> caller đó tự chạy lại thay vì nhận lỗi hết hạn của người khác.
+from __future__ import annotations
+import threading
+from typing import Any, Callable, Dict, Hashable
+
+import deadline as dl
+
+
+def _own(result):
+    # mỗi caller nhận bản sao nông: caller hay sửa kết quả (vd. gán "_source") — dict, list, Listing...
+    return result.copy() if hasattr(result, "copy") else result
+
+
+class _Call:
+    __slots__ = ("event", "result", "error", "dups")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result: Any = None
+        self.error: BaseException | None = None
+        self.dups = 0
+
+
+class SingleFlight:
+    def __init__(self):
+        self._calls: Dict[Hashable, _Call] = {}
+        self._lock = threading.Lock()
+        self.shared = 0  # số lời gọi đã được gộp (để theo dõi hiệu quả)
+
+    def do(self, key: Hashable, fn: Callable, *args, **kwargs):
+        while True:
+            with self._lock:
+                call = self._calls.get(key)
+                leader = call is None
+                if leader:
+                    call = self._calls[key] = _Call()
+                else:
+                    call.dups += 1
+                    self.shared += 1
+
+            if not leader:
+                call.event.wait()
+                if call.error is not None:
+                    if isinstance(call.error, dl.DeadlineExceeded) and not dl.expired():
+                        continue  # hạn của lời gọi đầu, không phải của caller này -> chạy lại
+                    raise call.error
+                return _own(call.result)
+
+            try:
+                call.result = fn(*args, **kwargs)
+                return _own(call.result)
+            except BaseException as e:
+                call.error = e
+                raise
+            finally:
+                with self._lock:
+                    self._calls.pop(key, None)
+                call.event.set()
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls)
@@ -1,59 +1,54 @@
 # sites/__init__.py
-from urllib.parse import urlparse
-from typing import Callable, Tuple, Dict
+import os
+from typing import Mapping, Optional
 
-# Import các parser theo site.
+from .registry import SiteSpec, SiteIndex, ParserRegistry, normalize_host, canon_url
+
+__all__ = ["SITES", "SITE_REGISTRY", "site_for", "pick_site",
+           "SiteSpec", "SiteIndex", "ParserRegistry", "normalize_host", "canon_url"]
+
+# Registry các site hỗ trợ. Module parser chỉ được import ở lần dùng đầu tiên (lazy).
 # YÊU CẦU: mỗi file sites/<site>.py phải có hàm parse(link: str, html_text: str) -> dict
 # và (không bắt buộc) hằng DEFAULT_STRATEGY = "requests" | "cloudscraper" | "playwright"
-from . import alonhadat
-from . import batdongsan
-from . import nhatot
-from . import muaban
-from . import guland  # <-- thêm guland.vn
-
 # i-batdongsan: file phải đặt tên i_batdongsan.py (KHÔNG dùng dấu '-')
-try:
-    from . import i_batdongsan as _i_batdongsan
-except Exception:
-    _i_batdongsan = None  # chưa có file hoặc lỗi import -> bỏ qua domain này
-
-SITE_REGISTRY: Dict[str, Tuple[Callable, str]] = {
-    "alonhadat.com.vn": (
-        getattr(alonhadat, "parse"),
-        getattr(alonhadat, "DEFAULT_STRATEGY", "requests"),
-    ),
-    "batdongsan.com.vn": (
-        getattr(batdongsan, "parse"),
-        getattr(batdongsan, "DEFAULT_STRATEGY", "playwright"),
-    ),
-    "nhatot.com": (
-        getattr(nhatot, "parse"),
-        getattr(nhatot, "DEFAULT_STRATEGY", "playwright"),
-    ),
-    "muaban.net": (
-        getattr(muaban, "parse"),
-        getattr(muaban, "DEFAULT_STRATEGY", "playwright"),
-    ),
-    "guland.vn": (
-        getattr(guland, "parse"),
-        getattr(guland, "DEFAULT_STRATEGY", "playwright"),
-    ),
-}
-
-# Chỉ đăng ký i-batdongsan nếu import thành công
-if _i_batdongsan:
-    SITE_REGISTRY["i-batdongsan.com"] = (
-        getattr(_i_batdongsan, "parse"),
-        getattr(_i_batdongsan, "DEFAULT_STRATEGY", "requests"),
-    )
+SITES = SiteIndex([
+    SiteSpec("alonhadat.com.vn", "sites.alonhadat", strategy="requests", rate=1.0,
+             ready=("h1, #limage, meta[property='og:title']",),
+             stream_budget=400_000, stream_until=("h1", "span.value*2", "img#limage", "div.detail",
+                                                  "div.contact-info"),
+             storage_state=os.getenv("ALONHADAT_STORAGE", "auth_alonhadat.json"),
+             priority=10),
+    SiteSpec("batdongsan.com.vn", "sites.batdongsan", strategy="playwright", rate=0.5, burst=1,
+             priority=0, quota=10,
+             ready=("#product-detail-web > h1", "#product-detail-web .re__pr-short-info"),
+             stream_budget=700_000, stream_until=("h1", "div.re__pr-short-info", "div.re__pr-description",
+                                                  "div.re__ldp-agent-wrap")),
+    SiteSpec("nhatot.com", "sites.nhatot", strategy="playwright", rate=1.0,
+             ready=("h1",), ttl=3 * 3600,
+             stream_budget=2_000_000, stream_until=("script#__NEXT_DATA__",)),
+    SiteSpec("muaban.net", "sites.muaban", strategy="playwright", rate=1.0,
+             ready=("h1",), stream_budget=800_000),
+    SiteSpec("guland.vn", "sites.guland", strategy="playwright", rate=1.0,
+             ready=(".dtl-main h1, h1",), stream_budget=800_000),
+    SiteSpec("i-batdongsan.com", "sites.i_batdongsan", strategy="requests", rate=1.0,
+             ready=("h1",), ttl=12 * 3600, stream_budget=400_000),
+])
+
+# domain -> (parser_func, default_strategy) — giữ cho code cũ
+SITE_REGISTRY: Mapping = ParserRegistry(SITES)
+
+
+def site_for(link: str) -> Optional[SiteSpec]:
+    """SiteSpec theo host của link (khớp cả subdomain), hoặc None nếu domain chưa hỗ trợ."""
+    return SITES.lookup(link)
+
 
 def pick_site(link: str):
     """
     Trả về tuple (parser_func, default_strategy) theo domain của link,
     hoặc None nếu domain chưa hỗ trợ.
     """
-    host = (urlparse(link).netloc or "").lower()
-    for dom, val in SITE_REGISTRY.items():
-        if dom in host:
-            return val
-    return None
+    spec = SITES.lookup(link)
+    if spec is None or spec.parser is None:
+        return None
+    return spec.parser, spec.default_strategy
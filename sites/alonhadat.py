@@ -1,12 +1,15 @@
 # sites/alonhadat.py
 from bs4 import BeautifulSoup
 import re
-from urllib.parse import urljoin
+from urllib.parse import urljoin, urlparse
+from .utils_dom import list_cards
+from .utils_query import parse_query
 
 def _txt(el): return el.get_text(" ", strip=True) if el else ""
 
-def parse(link: str, html: str) -> dict:
-    soup = BeautifulSoup(html, "lxml")
+def parse(link: str, html_or_soup) -> dict:
+    # Chấp nhận string HTML hoặc BeautifulSoup
+    soup = html_or_soup if hasattr(html_or_soup, "select") else BeautifulSoup(html_or_soup, "lxml")
     title = _txt(soup.find("h1") or soup.select_one("h1.title, h1.h1"))
 
     price, area = "", ""
@@ -32,17 +35,62 @@ def parse(link: str, html: str) -> dict:
         og = soup.find("meta", property="og:image")
         if og and og.get("content"): image = urljoin(link, og["content"])
 
-    contact_name = _txt(soup.select_one(".info-contact .name, .contact .name, .name a, .name span"))
+    contact_name = _txt(soup.find("div", class_="name")
+                        or soup.select_one(".info-contact .name, .contact .name, .name a, .name span"))
     phone = ""
     tel = soup.find("a", href=lambda h: h and str(h).startswith("tel:"))
     if tel: phone = tel.get_text(strip=True) or tel.get("href","").replace("tel:","")
+    if not phone:
+        m = re.search(r"(?:\+?84|0)[\s\.]*(\d[\d\s\.]{8,12}\d)", soup.get_text(" ", strip=True))
+        if m: phone = re.sub(r"[^\d]+", "", m.group(0))
 
     return {
         "link": link, "title": title, "price": price, "area": area,
-        "description": _txt(soup.select_one("div.detail.text-content, #content, .description, .post-content")),
+        "description": _txt(soup.select_one("div.detail.text-content")
+                            or soup.select_one("#content, .description, .post-content, .news-content, .content")),
         "image": image,
         "contact": (contact_name + (" - " + phone if phone else "")).strip(" -"),
     }
 
+# ===== Trang danh mục / kết quả tìm kiếm =====
+_LIST_CARD = "div.content-item"
+_LIST_LINK = ".ct_title a[href], h3 a[href], a[href].vip, a[href].title"
+_LIST_TITLE = ".ct_title, h3"
+_LIST_PRICE = ".ct_price"
+_LIST_AREA = ".ct_dt"
+_LIST_IMG = ".thumbnail img, img"
+DETAIL_RE = re.compile(r"/[a-z0-9-]+-\d{6,}\.(?:htm|html)$", re.I)
+
+def parse_list(link: str, html_or_soup) -> list:
+    """Card tin trên trang danh mục alonhadat -> list dict (link, title, price, area, image)."""
+    soup = html_or_soup if hasattr(html_or_soup, "select") else BeautifulSoup(html_or_soup, "lxml")
+    return list_cards(soup, link, _LIST_CARD, DETAIL_RE, link=_LIST_LINK, title=_LIST_TITLE,
+                      price=_LIST_PRICE, area=_LIST_AREA, image=_LIST_IMG)
+
+def page_url(link: str, page: int) -> str:
+    """alonhadat phân trang: /nha-dat/can-ban/.../quan-3.html -> /nha-dat/can-ban/.../quan-3/trang--2.html"""
+    p = urlparse(link)
+    path = re.sub(r"/trang--\d+\.html?$", ".html", p.path)
+    if page > 1:
+        stem = path[:-5] if path.endswith(".html") else path.rstrip("/")
+        path = f"{stem}/trang--{page}.html"
+    return p._replace(path=path).geturl()
+
+# ===== Trang tìm kiếm của site (search_aggregator dùng thay cho Google CSE) =====
+# /nha-dat/<can-ban|cho-thue>/<loại>/<tỉnh>/<quận>.html
+_SEARCH_KIND = {"": "nha-dat", "nha": "nha-trong-hem", "nha-mat-pho": "nha-mat-tien", "can-ho": "can-ho-chung-cu",
+                "biet-thu": "biet-thu-nha-lien-ke", "dat": "dat-tho-cu-dat-o", "phong-tro": "phong-tro-nha-tro",
+                "van-phong": "van-phong"}
+
+def search_url(query: str) -> str:
+    """Câu tìm kiếm tự do -> URL trang danh mục alonhadat tương ứng."""
+    q = parse_query(query)
+    parts = ["nha-dat", "can-ban" if q.transaction == "ban" else "cho-thue", _SEARCH_KIND.get(q.kind, "nha-dat")]
+    if q.province:
+        parts.append(q.province)
+        if q.district:
+            parts.append(q.district)
+    return "https://alonhadat.com.vn/" + "/".join(parts) + ".html"
+
 # gợi ý strategy mặc định cho site này
 DEFAULT_STRATEGY = "requests"
@@ -1,7 +1,9 @@
 # sites/batdongsan.py
 from bs4 import BeautifulSoup
 import re
-from .utils_dom import sel, sel1, text_or_empty as _txt
+from urllib.parse import urlparse
+from .utils_dom import sel, sel1, text_or_empty as _txt, list_cards
+from .utils_query import parse_query
 
 # 2 selector bạn cung cấp (để nguyên bản) + fallback ngắn gọn hơn
 _NAME_SEL_LONG = ("body > div.re__main > div.re__ldp.re__main-content-layout.re__ldp-extend.js__main-container "
@@ -49,6 +51,14 @@ def parse(link: str, html_or_soup) -> dict:
             price = _txt(p) or price
             area  = _txt(a) or area
 
+    if not price or not area:
+        # Fallback: cấu trúc cũ <span.value> (giá, diện tích theo thứ tự)
+        vals = soup.find_all("span", class_="value")
+        if not price and len(vals) > 0:
+            price = _txt(vals[0])
+        if not area and len(vals) > 1:
+            area = _txt(vals[1])
+
     if not price or not area:
         # Fallback theo label/regex để chống đổi layout
         for row in sel(soup, ".re__pr-shortinfo, .re__pr-config, .re__info, .re__pr-specs, .re__list, ul li, .re__box-info"):
@@ -62,6 +72,19 @@ def parse(link: str, html_or_soup) -> dict:
                 if m2:
                     area = m2.group(0)
 
+    text_all = ""
+    if not price or not area:
+        # Fallback cuối: regex trên toàn bộ text
+        text_all = soup.get_text(" ", strip=True)
+        if not price:
+            m = re.search(r"(Giá|Price)\s*[:\-]?\s*([^\s].{0,50}?)\s{2,}", text_all, re.I)
+            if m:
+                price = m.group(2).strip()
+        if not area:
+            m = re.search(r"(\d[\d\.,]*)\s*m(?:2|²)\b", text_all, re.I)
+            if m:
+                area = m.group(0)
+
     # ===== Description =====
     desc = ""
     if root:
@@ -74,6 +97,11 @@ def parse(link: str, html_or_soup) -> dict:
     og = soup.find("meta", property="og:image")
     if og and og.get("content"):
         image = og["content"].strip()
+    if not image:
+        # ảnh đang active trong swiper (khi đã render bằng Playwright)
+        img = sel1(soup, ".re__media-preview li.swiper-slide-active img")
+        if img and (img.get("src") or img.get("data-src")):
+            image = (img.get("src") or img.get("data-src")).strip()
     if not image:
         img = sel1(soup, "img.pr-img, img[data-src], img[src*='cloudfront'], img[src$='.jpg'], img[src$='.jpeg']")
         if img:
@@ -93,6 +121,10 @@ def parse(link: str, html_or_soup) -> dict:
         tel = soup.find("a", href=lambda h: h and str(h).startswith("tel:"))
         if tel:
             phone = _clean_phone(tel.get_text(strip=True) or tel.get("href", "").replace("tel:", ""))
+    if not phone:
+        m = re.search(r"(?:\+?84|0)[\s\.]*(\d[\d\s\.]{8,12}\d)", text_all or soup.get_text(" ", strip=True))
+        if m:
+            phone = _clean_phone(m.group(0))
 
     contact = (name + (" - " + phone if phone else "")).strip(" -")
 
@@ -106,5 +138,48 @@ def parse(link: str, html_or_soup) -> dict:
         "contact": contact,
     }
 
+# ===== Trang danh mục / kết quả tìm kiếm =====
+_LIST_CARD = "div.js__card, div.re__card-full, .re__srp-list .js__card"
+_LIST_LINK = "a.js__product-link-for-product-id, a[href*='-pr']"
+_LIST_TITLE = ".js__card-title, .re__card-title"
+_LIST_PRICE = ".re__card-config-price"
+_LIST_AREA = ".re__card-config-area"
+_LIST_IMG = ".re__card-image img, img"
+DETAIL_RE = re.compile(r"-pr\d+$", re.I)
+CSE_HINTS = ("inurl:-pr",)   # gợi ý thêm cho Google CSE siteSearch (search_aggregator)
+
+def parse_list(link: str, html_or_soup) -> list:
+    """Card tin trên trang danh mục batdongsan -> list dict (link, title, price, area, image)."""
+    soup = html_or_soup if hasattr(html_or_soup, "select") else BeautifulSoup(html_or_soup, "lxml")
+    return list_cards(soup, link, _LIST_CARD, DETAIL_RE, link=_LIST_LINK, title=_LIST_TITLE,
+                      price=_LIST_PRICE, area=_LIST_AREA, image=_LIST_IMG)
+
+def page_url(link: str, page: int) -> str:
+    """batdongsan phân trang bằng hậu tố /p<N>: /ban-nha-rieng-quan-3/p2"""
+    p = urlparse(link)
+    path = re.sub(r"/p\d+/?$", "", p.path.rstrip("/"))
+    if page > 1:
+        path = f"{path}/p{page}"
+    return p._replace(path=path).geturl()
+
+# ===== Trang tìm kiếm của site (search_aggregator dùng thay cho Google CSE) =====
+# /<loại>-<địa bàn>: /ban-nha-rieng-quan-3, /cho-thue-can-ho-chung-cu-tp-hcm, /nha-dat-ban
+_SEARCH_CAT = {
+    "ban": {"": "nha-dat-ban", "nha": "ban-nha-rieng", "can-ho": "ban-can-ho-chung-cu",
+            "nha-mat-pho": "ban-nha-mat-pho", "biet-thu": "ban-nha-biet-thu-lien-ke", "dat": "ban-dat"},
+    "thue": {"": "nha-dat-cho-thue", "nha": "cho-thue-nha-rieng", "can-ho": "cho-thue-can-ho-chung-cu",
+             "nha-mat-pho": "cho-thue-nha-mat-pho", "phong-tro": "cho-thue-nha-tro-phong-tro",
+             "van-phong": "cho-thue-van-phong"},
+}
+_SEARCH_PROVINCE = {"ho-chi-minh": "tp-hcm"}   # slug tỉnh trên batdongsan khác slug chuẩn
+
+def search_url(query: str) -> str:
+    """Câu tìm kiếm tự do -> URL trang danh mục batdongsan tương ứng."""
+    q = parse_query(query)
+    cats = _SEARCH_CAT[q.transaction]
+    cat = cats.get(q.kind) or cats[""]
+    loc = q.district or _SEARCH_PROVINCE.get(q.province, q.province)
+    return f"https://batdongsan.com.vn/{cat}-{loc}" if loc else f"https://batdongsan.com.vn/{cat}"
+
 # Với site này thường gặp 403 → ưu tiên playwright
 DEFAULT_STRATEGY = "playwright"
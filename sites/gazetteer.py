@@ -0,0 +1,98 @@
+# sites/gazetteer.py
+# Danh mục quận/huyện của các tỉnh có nhiều tin rao nhất + index tra theo tên không dấu.
+# Dùng bởi utils_query.parse_query: "Bình Thạnh" -> (ho-chi-minh, quan-binh-thanh) kể cả khi người dùng
+# không gõ "Quận" / tên tỉnh. Phường/xã không liệt kê (quá nhiều) — nhận theo tiền tố "phường"/"xã".
+from __future__ import annotations
+import re
+import unicodedata
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+# tỉnh -> [(tiền tố slug, tên)]
+DISTRICTS: Dict[str, List[Tuple[str, str]]] = {
+    "ho-chi-minh": [("quan", str(i)) for i in range(1, 13)] + [
+        ("quan", "Bình Thạnh"), ("quan", "Gò Vấp"), ("quan", "Phú Nhuận"), ("quan", "Tân Bình"),
+        ("quan", "Tân Phú"), ("quan", "Bình Tân"), ("thanh-pho", "Thủ Đức"), ("huyen", "Bình Chánh"),
+        ("huyen", "Củ Chi"), ("huyen", "Hóc Môn"), ("huyen", "Nhà Bè"), ("huyen", "Cần Giờ"),
+    ],
+    "ha-noi": [
+        ("quan", "Ba Đình"), ("quan", "Hoàn Kiếm"), ("quan", "Hai Bà Trưng"), ("quan", "Đống Đa"),
+        ("quan", "Tây Hồ"), ("quan", "Cầu Giấy"), ("quan", "Thanh Xuân"), ("quan", "Hoàng Mai"),
+        ("quan", "Long Biên"), ("quan", "Bắc Từ Liêm"), ("quan", "Nam Từ Liêm"), ("quan", "Hà Đông"),
+        ("thi-xa", "Sơn Tây"), ("huyen", "Đông Anh"), ("huyen", "Gia Lâm"), ("huyen", "Thanh Trì"),
+        ("huyen", "Sóc Sơn"), ("huyen", "Mê Linh"), ("huyen", "Hoài Đức"), ("huyen", "Đan Phượng"),
+        ("huyen", "Thạch Thất"), ("huyen", "Quốc Oai"), ("huyen", "Chương Mỹ"), ("huyen", "Thanh Oai"),
+        ("huyen", "Thường Tín"), ("huyen", "Phú Xuyên"), ("huyen", "Ứng Hòa"), ("huyen", "Mỹ Đức"),
+        ("huyen", "Ba Vì"), ("huyen", "Phúc Thọ"),
+    ],
+    "da-nang": [
+        ("quan", "Hải Châu"), ("quan", "Thanh Khê"), ("quan", "Sơn Trà"), ("quan", "Ngũ Hành Sơn"),
+        ("quan", "Liên Chiểu"), ("quan", "Cẩm Lệ"), ("huyen", "Hòa Vang"),
+    ],
+    "hai-phong": [
+        ("quan", "Hồng Bàng"), ("quan", "Ngô Quyền"), ("quan", "Lê Chân"), ("quan", "Hải An"),
+        ("quan", "Kiến An"), ("quan", "Dương Kinh"), ("quan", "Đồ Sơn"), ("huyen", "Thủy Nguyên"),
+        ("huyen", "An Dương"),
+    ],
+    "can-tho": [
+        ("quan", "Ninh Kiều"), ("quan", "Bình Thủy"), ("quan", "Cái Răng"), ("quan", "Ô Môn"),
+        ("quan", "Thốt Nốt"),
+    ],
+    "binh-duong": [
+        ("thanh-pho", "Thủ Dầu Một"), ("thanh-pho", "Dĩ An"), ("thanh-pho", "Thuận An"),
+        ("thanh-pho", "Tân Uyên"), ("thi-xa", "Bến Cát"), ("huyen", "Bàu Bàng"),
+    ],
+    "dong-nai": [
+        ("thanh-pho", "Biên Hòa"), ("thanh-pho", "Long Khánh"), ("huyen", "Long Thành"),
+        ("huyen", "Nhơn Trạch"), ("huyen", "Trảng Bom"),
+    ],
+    "khanh-hoa": [("thanh-pho", "Nha Trang"), ("thanh-pho", "Cam Ranh"), ("huyen", "Cam Lâm")],
+    "ba-ria-vung-tau": [("thanh-pho", "Vũng Tàu"), ("thanh-pho", "Bà Rịa"), ("thi-xa", "Phú Mỹ")],
+    "lam-dong": [("thanh-pho", "Đà Lạt"), ("thanh-pho", "Bảo Lộc")],
+    "quang-ninh": [("thanh-pho", "Hạ Long"), ("thanh-pho", "Cẩm Phả"), ("thanh-pho", "Uông Bí")],
+    "long-an": [("thanh-pho", "Tân An"), ("huyen", "Đức Hòa"), ("huyen", "Bến Lức")],
+    "bac-ninh": [("thanh-pho", "Bắc Ninh"), ("thanh-pho", "Từ Sơn")],
+}
+
+
+def _plain(s: str) -> str:
+    s = (s or "").replace("đ", "d").replace("Đ", "D")
+    s = "".join(c for c in unicodedata.normalize("NFD", s) if unicodedata.category(c) != "Mn")
+    return re.sub(r"\s+", " ", re.sub(r"[^a-z0-9]+", " ", s.lower())).strip()
+
+
+class District(NamedTuple):
+    province: str
+    slug: str          # có tiền tố: "quan-binh-thanh", "thanh-pho-thu-duc"
+    name: str
+
+
+# tên không dấu ("binh thanh", "3") -> các quận trùng tên (khác tỉnh)
+_INDEX: Dict[str, List[District]] = {}
+_BY_PROVINCE: Dict[str, List[District]] = {}
+MAX_NAME_TOKENS = 1
+
+
+def _build() -> None:
+    global MAX_NAME_TOKENS
+    for prov, items in DISTRICTS.items():
+        for prefix, name in items:
+            key = _plain(name)
+            d = District(prov, f"{prefix}-{key.replace(' ', '-')}", name)
+            _INDEX.setdefault(key, []).append(d)
+            _BY_PROVINCE.setdefault(prov, []).append(d)
+            MAX_NAME_TOKENS = max(MAX_NAME_TOKENS, len(key.split()))
+
+
+_build()
+
+
+def lookup(name: str, province: str = "") -> Optional[District]:
+    """Tên quận (có/không dấu) -> District; trùng tên giữa các tỉnh thì chọn theo province (nếu có)."""
+    hits = _INDEX.get(_plain(name)) or []
+    if province:
+        hits = [d for d in hits if d.province == province]
+    return hits[0] if len(hits) == 1 or (hits and province) else None
+
+
+def districts_of(province: str) -> List[District]:
+    return _BY_PROVINCE.get(province, [])
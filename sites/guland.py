@@ -4,6 +4,8 @@ from bs4 import BeautifulSoup
 import re
 from typing import Optional
 from urllib.parse import urljoin
+from .utils_dom import list_cards, with_query_page
+from .utils_query import parse_query
 
 def _txt(el) -> str:
     return el.get_text(" ", strip=True) if el else ""
@@ -93,5 +95,32 @@ def parse(link: str, html_or_soup) -> dict:
         "contact": contact,
     }
 
+# ===== Trang danh mục / kết quả tìm kiếm =====
+_LIST_CARD = ".c-sdb-card, .l-sdb-list__single"
+_LIST_LINK = ".c-sdb-card__tle a[href], a[href*='/post/']"
+_LIST_TITLE = ".c-sdb-card__tle"
+_LIST_PRICE = ".c-sdb-card__prc, [class*='prc']"
+_LIST_AREA = ".c-sdb-card__dtc, [class*='dtc']"
+_LIST_IMG = ".c-sdb-card__img img, img"
+DETAIL_RE = re.compile(r"/post/[^/]+-\d+/?$", re.I)
+
+def parse_list(link: str, html_or_soup) -> list:
+    """Card tin trên trang danh mục guland -> list dict (link, title, price, area, image)."""
+    soup = html_or_soup if hasattr(html_or_soup, "select") else BeautifulSoup(html_or_soup, "lxml")
+    return list_cards(soup, link, _LIST_CARD, DETAIL_RE, link=_LIST_LINK, title=_LIST_TITLE,
+                      price=_LIST_PRICE, area=_LIST_AREA, image=_LIST_IMG)
+
+def page_url(link: str, page: int) -> str:
+    return with_query_page(link, page)
+
+# ===== Trang tìm kiếm của site (search_aggregator dùng thay cho Google CSE) =====
+# /mua-ban-bat-dong-san-<tỉnh>, /cho-thue-bat-dong-san-<quận>-<tỉnh>
+def search_url(query: str) -> str:
+    """Câu tìm kiếm tự do -> URL trang danh mục guland tương ứng."""
+    q = parse_query(query)
+    base = "mua-ban-bat-dong-san" if q.transaction == "ban" else "cho-thue-bat-dong-san"
+    slug = "-".join(x for x in (base, q.district, q.province) if x)
+    return f"https://guland.vn/{slug}"
+
 # Trang SPA/Next-like → ưu tiên dùng Playwright cho chắc
 DEFAULT_STRATEGY = "playwright"
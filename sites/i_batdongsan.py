@@ -3,7 +3,8 @@ from __future__ import annotations
 from bs4 import BeautifulSoup
 import re
 from typing import Optional
-from urllib.parse import urljoin
+from urllib.parse import urljoin, urlparse
+from .utils_dom import list_cards
 
 def _txt(el) -> str:
     return el.get_text(" ", strip=True) if el else ""
@@ -119,5 +120,31 @@ def parse(link: str, html_or_soup) -> dict:
         "contact": contact,
     }
 
+# ===== Trang danh mục / kết quả tìm kiếm (cùng template với alonhadat) =====
+_LIST_CARD = "div.content-item, .list-item"
+_LIST_LINK = ".ct_title a[href], h3 a[href], a[href]"
+_LIST_TITLE = ".ct_title, h3"
+_LIST_PRICE = ".ct_price, .price"
+_LIST_AREA = ".ct_dt, .square"
+_LIST_IMG = ".thumbnail img, img"
+DETAIL_RE = re.compile(r"-\d{5,}\.html?$", re.I)
+
+def parse_list(link: str, html_or_soup) -> list:
+    """Card tin trên trang danh mục i-batdongsan -> list dict (link, title, price, area, image)."""
+    soup = html_or_soup if hasattr(html_or_soup, "select") else BeautifulSoup(html_or_soup, "lxml")
+    return list_cards(soup, link, _LIST_CARD, DETAIL_RE, link=_LIST_LINK, title=_LIST_TITLE,
+                      price=_LIST_PRICE, area=_LIST_AREA, image=_LIST_IMG)
+
+def page_url(link: str, page: int) -> str:
+    """i-batdongsan phân trang: .../ban-nha.htm -> .../ban-nha/trang--2.htm"""
+    p = urlparse(link)
+    path = re.sub(r"/trang--\d+(\.html?)$", r"\1", p.path)
+    if page > 1:
+        m = re.search(r"(\.html?)$", path)
+        ext = m.group(1) if m else ".htm"
+        stem = path[: -len(ext)] if m else path.rstrip("/")
+        path = f"{stem}/trang--{page}{ext}"
+    return p._replace(path=path).geturl()
+
 # Site này thường render tĩnh, ưu tiên requests
 DEFAULT_STRATEGY = "requests"
@@ -3,6 +3,8 @@ from __future__ import annotations
 from bs4 import BeautifulSoup
 import re
 from typing import Optional
+from .utils_dom import list_cards, with_query_page
+from .utils_query import parse_query
 
 def _txt(el) -> str:
     return el.get_text(" ", strip=True) if el else ""
@@ -119,5 +121,39 @@ def parse(link: str, html_or_soup) -> dict:
         "contact": contact,
     }
 
+# ===== Trang danh mục / kết quả tìm kiếm =====
+_LIST_CARD = "[class*='ListItem'], [class*='list-item'], li:has(> a[href*='-id'])"
+_LIST_LINK = "a[href*='-id']"
+_LIST_TITLE = "h2, h3, [class*='title']"
+_LIST_PRICE = "[class*='price']"
+_LIST_AREA = "[class*='area'], [class*='acreage']"
+_LIST_IMG = "img"
+DETAIL_RE = re.compile(r"-id\d+/?$", re.I)
+
+def parse_list(link: str, html_or_soup) -> list:
+    """Card tin trên trang danh mục muaban -> list dict (link, title, price, area, image)."""
+    soup = html_or_soup if hasattr(html_or_soup, "select") else BeautifulSoup(html_or_soup, "lxml")
+    return list_cards(soup, link, _LIST_CARD, DETAIL_RE, link=_LIST_LINK, title=_LIST_TITLE,
+                      price=_LIST_PRICE, area=_LIST_AREA, image=_LIST_IMG)
+
+def page_url(link: str, page: int) -> str:
+    return with_query_page(link, page)
+
+# ===== Trang tìm kiếm của site (search_aggregator dùng thay cho Google CSE) =====
+# /bat-dong-san/<loại>-<quận>-<tỉnh>: /bat-dong-san/ban-nha-quan-3-ho-chi-minh
+_SEARCH_CAT = {
+    "ban": {"": "ban-nha-dat", "nha": "ban-nha", "nha-mat-pho": "ban-nha", "biet-thu": "ban-nha",
+            "can-ho": "ban-can-ho-chung-cu", "dat": "ban-dat"},
+    "thue": {"": "cho-thue-nha-dat", "nha": "cho-thue-nha", "nha-mat-pho": "cho-thue-nha", "biet-thu": "cho-thue-nha",
+             "can-ho": "cho-thue-can-ho-chung-cu", "phong-tro": "cho-thue-phong-tro", "van-phong": "cho-thue-van-phong"},
+}
+
+def search_url(query: str) -> str:
+    """Câu tìm kiếm tự do -> URL trang danh mục muaban tương ứng."""
+    q = parse_query(query)
+    cats = _SEARCH_CAT[q.transaction]
+    slug = "-".join(x for x in (cats.get(q.kind) or cats[""], q.district, q.province) if x)
+    return f"https://muaban.net/bat-dong-san/{slug}"
+
 # Trang động → ưu tiên playwright (nếu dùng chế độ auto)
 DEFAULT_STRATEGY = "playwright"
@@ -1,9 +1,14 @@
 # sites/nhatot.py
 from __future__ import annotations
 from bs4 import BeautifulSoup
-import json, re
+import re
 from typing import Any, Dict, Optional
-import requests
+from urllib.parse import urlencode
+
+from .nhatot_gateway import GATEWAY
+from .utils_dom import list_cards, with_query_page
+from .utils_json import Locator, ld_json, loads, script_json, search_keys
+from .utils_query import parse_query
 
 # Tái dùng UA mặc định của project (nếu có)
 try:
@@ -83,27 +88,6 @@ def _first(*vals: Optional[str]) -> str:
             return v.strip()
     return ""
 
-def _json_safe(s: str):
-    try:
-        return json.loads(s)
-    except Exception:
-        return None
-
-def _search(obj: Any, keys: set[str]):
-    if isinstance(obj, dict):
-        for k, v in obj.items():
-            if str(k).lower() in keys:
-                return v
-            found = _search(v, keys)
-            if found is not None:
-                return found
-    elif isinstance(obj, list):
-        for it in obj:
-            found = _search(it, keys)
-            if found is not None:
-                return found
-    return None
-
 def _extract_list_id(link: str, soup: BeautifulSoup) -> Optional[str]:
     m = re.search(r"/(\d{6,})\.htm", link)
     if m:
@@ -113,50 +97,59 @@ def _extract_list_id(link: str, soup: BeautifulSoup) -> Optional[str]:
     if m2:
         return m2.group(2)
     nd = soup.find("script", id="__NEXT_DATA__")
-    if nd and (obj := _json_safe(nd.string or nd.text or "")):
-        v = _search(obj, {"list_id", "ad_id", "adid", "id"})
+    if nd and (obj := loads(nd.string or nd.text or "")):
+        v = search_keys(obj, {"list_id", "ad_id", "adid", "id"})
         if v:
             return str(v)
     return None
 
-def _from_ld_json(soup: BeautifulSoup) -> Dict[str, str]:
-    out: Dict[str, str] = {}
+def _soup_json(soup: BeautifulSoup):
+    """(__NEXT_DATA__, [JSON-LD]) khi đã có soup (parse đầy đủ); HTML thô thì dùng utils_json trực tiếp."""
+    nd = soup.find("script", id="__NEXT_DATA__")
+    next_data = loads(nd.string or nd.text or "") if nd else None
+    ld = []
     for sc in soup.find_all("script", attrs={"type": "application/ld+json"}):
-        obj = _json_safe(sc.string or sc.text or "")
-        if not obj:
-            continue
-        for c in (obj if isinstance(obj, list) else [obj]):
-            if not isinstance(c, dict):
-                continue
-            out.setdefault("title", _first(c.get("name"), c.get("headline")))
-            out.setdefault("description", _first(c.get("description")))
-            offers = c.get("offers") or {}
-            if isinstance(offers, list):
-                offers = offers[0] if offers else {}
-            price = offers.get("price") or c.get("price")
-            cur = offers.get("priceCurrency") or c.get("currency")
-            if price:
-                out.setdefault("price", f"{price} {cur}".strip())
-            img = c.get("image")
-            if isinstance(img, list):
-                img = img[0] if img else ""
-            if img:
-                out.setdefault("image", img)
+        obj = loads(sc.string or sc.text or "")
+        ld.extend(c for c in (obj if isinstance(obj, list) else [obj]) if isinstance(c, dict))
+    return next_data, ld
+
+def _from_ld_json(objs) -> Dict[str, str]:
+    out: Dict[str, str] = {}
+    for c in objs:
+        out.setdefault("title", _first(c.get("name"), c.get("headline")))
+        out.setdefault("description", _first(c.get("description")))
+        offers = c.get("offers") or {}
+        if isinstance(offers, list):
+            offers = offers[0] if offers else {}
+        price = offers.get("price") or c.get("price")
+        cur = offers.get("priceCurrency") or c.get("currency")
+        if price:
+            out.setdefault("price", f"{price} {cur}".strip())
+        img = c.get("image")
+        if isinstance(img, list):
+            img = img[0] if img else ""
+        if img:
+            out.setdefault("image", img)
     return out
 
-def _from_next_data(soup: BeautifulSoup) -> Dict[str, str]:
+# Tin trong __NEXT_DATA__ có cùng khuôn với gateway API (subject, body, price_string...):
+# thử đường dẫn đã biết trước, không thấy mới duyệt cả cây (Locator nhớ đường dẫn cho các trang sau)
+_AD = Locator(lambda v: isinstance(v, dict) and "list_id" in v and ("subject" in v or "body" in v),
+              paths=("props.initialState.adView.adInfo.ad", "props.pageProps.initialState.adView.adInfo.ad"))
+
+def _from_next_data(obj) -> Dict[str, str]:
     out: Dict[str, str] = {}
-    sc = soup.find("script", id="__NEXT_DATA__")
-    if not sc:
-        return out
-    obj = _json_safe(sc.string or sc.text or "")
     if not obj:
         return out
-    out["title"] = _first(out.get("title"), str(_search(obj, {"subject", "title", "name", "headline"}) or ""))
-    out["description"] = _first(out.get("description"), str(_search(obj, {"body", "description", "content"}) or ""))
-    out["price"] = _first(out.get("price"), str(_search(obj, {"price_string", "price"}) or ""))
-    out["area"] = _first(out.get("area"), str(_search(obj, {"area", "size", "square"}) or ""))
-    images = _search(obj, {"images", "image"})
+    ad = _AD.get(obj)
+    if ad is not None:
+        return _ad_fields(ad)
+    # khuôn lạ: tìm theo tên khoá trên cả cây như trước
+    out["title"] = _first(str(search_keys(obj, {"subject", "title", "name", "headline"}) or ""))
+    out["description"] = _first(str(search_keys(obj, {"body", "description", "content"}) or ""))
+    out["price"] = _first(str(search_keys(obj, {"price_string", "price"}) or ""))
+    out["area"] = _first(str(search_keys(obj, {"area", "size", "square"}) or ""))
+    images = search_keys(obj, {"images", "image"})
     img = ""
     if isinstance(images, list) and images:
         first = images[0]
@@ -168,8 +161,8 @@ def _from_next_data(soup: BeautifulSoup) -> Dict[str, str]:
         img = images.get("full_path") or images.get("url") or ""
     if img:
         out["image"] = img
-    name = _search(obj, {"sellername", "seller_name", "accountname", "name"})
-    phone = _search(obj, {"phone", "phonenum", "phone_number"})
+    name = search_keys(obj, {"sellername", "seller_name", "accountname", "name"})
+    phone = search_keys(obj, {"phone", "phonenum", "phone_number"})
     if name:
         out["name"] = str(name)
     if phone:
@@ -177,45 +170,55 @@ def _from_next_data(soup: BeautifulSoup) -> Dict[str, str]:
     return out
 
 def _from_gateway(list_id: str) -> Dict[str, str]:
+    """Trường của tin theo gateway API (GATEWAY: session chung, cache theo list_id, nhớ version v2/v1)."""
+    ad = GATEWAY.get(list_id)
+    return _ad_fields(ad) if ad else {}
+
+def _ad_fields(ad: dict) -> Dict[str, str]:
     out: Dict[str, str] = {}
-    for ver in ("v2", "v1"):
-        url = f"https://gateway.chotot.com/{ver}/public/ad-listing/{list_id}"
-        try:
-            r = requests.get(url, headers=_REQ_HEADERS, timeout=15)
-            if r.status_code >= 400:
-                continue
-            js = r.json()
-        except Exception:
-            continue
-        ad = js.get("ad") or js
-        if not isinstance(ad, dict):
-            continue
-        out["title"] = _first(out.get("title"), ad.get("subject"))
-        out["description"] = _first(out.get("description"), ad.get("body"))
-        out["price"] = _first(out.get("price"), ad.get("price_string"), str(ad.get("price") or ""))
-        area = ad.get("size") or ad.get("square")
-        if not area:
-            params = ad.get("parameters") or []
-            if isinstance(params, list):
-                for p in params:
-                    if isinstance(p, dict) and str(p.get("key", "")).lower() in {"size", "square", "area"}:
-                        area = p.get("value")
-                        break
-        if area:
-            out["area"] = str(area)
-        imgs = ad.get("images") or []
-        img = ""
-        if isinstance(imgs, list) and imgs:
-            first = imgs[0]
-            if isinstance(first, dict):
-                img = first.get("full_path") or first.get("url") or ""
-            elif isinstance(first, str):
-                img = first
-        if img:
-            out["image"] = img
-        out["name"] = _first(out.get("name"), ad.get("account_name"))
-        out["phone"] = _first(out.get("phone"), _clean_phone(ad.get("account_phone", "")))
-        break
+    out["title"] = _first(ad.get("subject"))
+    out["description"] = _first(ad.get("body"))
+    out["price"] = _first(ad.get("price_string"), str(ad.get("price") or ""))
+    area = ad.get("size") or ad.get("square")
+    if not area:
+        params = ad.get("parameters") or []
+        if isinstance(params, list):
+            for p in params:
+                if isinstance(p, dict) and str(p.get("key", "")).lower() in {"size", "square", "area"}:
+                    area = p.get("value")
+                    break
+    if area:
+        out["area"] = f"{area} m²" if str(area).replace(".", "").isdigit() else str(area)
+    imgs = ad.get("images") or []
+    img = ""
+    if isinstance(imgs, list) and imgs:
+        first = imgs[0]
+        if isinstance(first, dict):
+            img = first.get("full_path") or first.get("url") or ""
+        elif isinstance(first, str):
+            img = first
+    if img:
+        out["image"] = img
+    out["name"] = _first(ad.get("account_name"))
+    out["phone"] = _clean_phone(ad.get("account_phone", ""))
+    return out
+
+def detail_cards(links) -> Dict[str, Dict[str, str]]:
+    """
+    Link chi tiết (vd. từ Google CSE) -> card đủ trường, tra gateway song song cho cả lô
+    (search_aggregator gọi hook này; link không có list_id / tin đã gỡ bị bỏ qua).
+    """
+    ids = {}
+    for link in links:
+        m = re.search(r"/(\d{6,})\.htm", link)
+        if m:
+            ids[m.group(1)] = link
+    out = {}
+    for lid, ad in GATEWAY.get_many(ids).items():
+        f = _ad_fields(ad)
+        name, phone = f.pop("name", ""), f.pop("phone", "")
+        contact = (name + (" - " + phone if phone else "")).strip(" -")
+        out[ids[lid]] = f | {"link": ids[lid], "contact": contact}
     return out
 
 # ---- tìm số che: cho phép khoảng trắng giữa chữ số & nhiều ký tự che ----
@@ -289,14 +292,15 @@ def parse(link: str, html_or_soup) -> dict:
             phone = m.group(0)
 
     # 2) JSON-LD
-    jd = _from_ld_json(soup)
+    next_data, ld = _soup_json(soup)
+    jd = _from_ld_json(ld)
     title = _first(title, jd.get("title"))
     price = _first(price, jd.get("price"))
     desc  = _first(desc,  jd.get("description"))
     image = _first(image, jd.get("image"))
 
     # 3) __NEXT_DATA__
-    nd = _from_next_data(soup)
+    nd = _from_next_data(next_data)
     title = _first(title, nd.get("title"))
     price = _first(price, nd.get("price"))
     area  = _first(area,  nd.get("area"))
@@ -337,5 +341,103 @@ def parse(link: str, html_or_soup) -> dict:
         "contact": contact,
     }
 
+def parse_fast(link: str, html: str) -> Optional[dict]:
+    """
+    Đường nhanh (listing.parse_listing gọi trước parse): chỉ đọc __NEXT_DATA__ / JSON-LD bằng quét chuỗi HTML thô,
+    không dựng DOM. Thiếu trường chính (tiêu đề, giá, mô tả, ảnh), diện tích hoặc số điện thoại -> None để parse
+    đầy đủ như cũ (số che / nút tel: / regex toàn trang, diện tích theo regex chỉ có ở parse).
+    """
+    nd = _from_next_data(script_json(html, "__NEXT_DATA__"))
+    jd = _from_ld_json(ld_json(html))
+    title = _first(nd.get("title"), jd.get("title"))
+    price = _first(nd.get("price"), jd.get("price"))
+    desc = _first(nd.get("description"), jd.get("description"))
+    image = _first(nd.get("image"), jd.get("image"))
+    area, name, phone = nd.get("area", ""), nd.get("name", ""), nd.get("phone", "")
+    if not title or not price or not desc or not image or not area or not phone:
+        return None
+    return {
+        "link": link,
+        "title": title,
+        "price": price,
+        "area": area,
+        "description": desc,
+        "image": image,
+        "contact": (name + " - " + phone).strip(" -"),
+    }
+
+# ===== Trang danh mục / kết quả tìm kiếm =====
+_LIST_CARD = "li[itemprop='itemListElement'], [class*='AdItem']"
+_LIST_TITLE = "h3, [class*='title']"
+_LIST_PRICE = "[class*='price']"
+_LIST_AREA = "[class*='size'], [class*='area']"
+DETAIL_RE = re.compile(r"/\d{6,}\.htm$", re.I)
+
+# list tin (dict có list_id) trong JSON __NEXT_DATA__ / gateway
+_ADS = Locator(lambda v: isinstance(v, list) and bool(v) and all(isinstance(x, dict) for x in v)
+               and "list_id" in v[0], paths=("ads", "props.initialState.adlisting.data.ads"))
+
+def _find_ads(obj: Any) -> list:
+    return _ADS.get(obj) or []
+
+def ad_card(ad: dict) -> Dict[str, str]:
+    """1 tin (JSON của Next.js / gateway) -> card dict (link, title, price, area, image)."""
+    area = ad.get("size") or ad.get("area") or ad.get("square") or ""
+    return {
+        "link": f"https://www.nhatot.com/{ad.get('list_id')}.htm",
+        "title": str(ad.get("subject") or ""),
+        "price": str(ad.get("price_string") or ad.get("price") or ""),
+        "area": f"{area} m²" if area and str(area).replace(".", "").isdigit() else str(area),
+        "image": str(ad.get("image") or ad.get("thumbnail_image") or ""),
+    }
+
+def parse_list(link: str, html_or_soup) -> list:
+    """Trang danh mục nhatot: ưu tiên danh sách tin trong __NEXT_DATA__, fallback quét card DOM.
+    Kết quả gateway listing API (JSON, xem search_url) cũng được nhận."""
+    if isinstance(html_or_soup, str) and html_or_soup.lstrip().startswith("{"):
+        ads = _find_ads(loads(html_or_soup))
+        GATEWAY.prime(ads)   # tin đủ nội dung -> trang chi tiết lấy từ cache, không gọi gateway lại
+        return [ad_card(a) for a in ads if a.get("list_id")]
+    if isinstance(html_or_soup, str):
+        # HTML thô: đọc __NEXT_DATA__ bằng quét chuỗi, chỉ dựng DOM khi phải quét card
+        ads = _find_ads(script_json(html_or_soup, "__NEXT_DATA__"))
+        if ads:
+            return [ad_card(a) for a in ads if a.get("list_id")]
+    soup = html_or_soup if hasattr(html_or_soup, "select") else BeautifulSoup(html_or_soup, "lxml")
+    nd = soup.find("script", id="__NEXT_DATA__")
+    ads = _find_ads(loads(nd.string or nd.text or "")) if nd else []
+    if ads:
+        return [ad_card(a) for a in ads if a.get("list_id")]
+    return list_cards(soup, link, _LIST_CARD, DETAIL_RE, title=_LIST_TITLE,
+                      price=_LIST_PRICE, area=_LIST_AREA)
+
+def page_url(link: str, page: int) -> str:
+    if link.startswith(_GATEWAY_LIST):  # gateway phân trang bằng offset o=
+        return with_query_page(link, (page - 1) * SEARCH_LIMIT, "o")
+    return with_query_page(link, page)
+
+# ===== Trang tìm kiếm: gateway listing API của Chợ Tốt (JSON, không cần render, 20 tin/request) =====
+_GATEWAY_LIST = "https://gateway.chotot.com/v1/public/ad-listing"
+_SEARCH_CG = {"": 1000, "can-ho": 1010, "nha": 1020, "nha-mat-pho": 1020, "biet-thu": 1020,
+              "van-phong": 1030, "dat": 1040, "phong-tro": 1050}
+_SEARCH_REGION = {"ho-chi-minh": 13000, "ha-noi": 12000}
+SEARCH_LIMIT = 20
+SEARCH_STRATEGY = "requests"   # JSON -> requests là đủ (DEFAULT_STRATEGY của site là playwright)
+
+def search_url(query: str) -> str:
+    """Câu tìm kiếm tự do -> URL gateway listing API (lọc theo danh mục, tỉnh; quận làm từ khoá)."""
+    q = parse_query(query)
+    params = {"cg": _SEARCH_CG.get(q.kind, 1000), "st": "s,k" if q.transaction == "ban" else "u,h",
+              "limit": SEARCH_LIMIT, "key_param_included": "true"}
+    if q.province in _SEARCH_REGION:
+        params["region_v2"] = _SEARCH_REGION[q.province]
+    if q.district_name:
+        params["q"] = q.district_name
+    if q.price_min is not None or q.price_max is not None:   # lọc giá / diện tích ngay trên API
+        params["price"] = f"{int(q.price_min or 0)}-{int(q.price_max) if q.price_max is not None else ''}"
+    if q.area_min is not None or q.area_max is not None:
+        params["size"] = f"{int(q.area_min or 0)}-{int(q.area_max) if q.area_max is not None else ''}"
+    return f"{_GATEWAY_LIST}?{urlencode(params)}"
+
 # Next.js → ưu tiên Playwright
 DEFAULT_STRATEGY = "playwright"
@@ -0,0 +1,181 @@
+# sites/nhatot_gateway.py
+# Client gateway API của Chợ Tốt (gateway.chotot.com/{v2,v1}/public/ad-listing/<list_id>) cho sites/nhatot:
+# - 1 requests.Session dùng chung (keep-alive, pool kết nối) thay vì requests.get mới mỗi lần
+# - nhớ version API đang chạy được: thử version đó trước, chỉ dò version khác khi nó lỗi
+#   (không gọi v2 rồi v1 cho mọi tin như trước)
+# - cache theo list_id (LRU + TTL, cả kết quả "không có tin"), gộp lời gọi trùng đang chạy (single-flight)
+# - get_many(): tra nhiều list_id song song (hit cache trả ngay, phần còn lại gọi đồng thời);
+#   prime(): nạp sẵn cache từ tin đầy đủ trong kết quả listing API -> trang chi tiết không phải gọi lại
+from __future__ import annotations
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    from fetchers import REQ_HEADERS as _REQ_HEADERS
+except Exception:
+    _REQ_HEADERS = {
+        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/115 Safari/537.36",
+        "Accept-Language": "vi-VN,vi;q=0.9,en-US;q=0.8",
+    }
+import deadline as _dl
+import throttle as _throttle
+from singleflight import SingleFlight
+
+GATEWAY_WORKERS = int(os.getenv("NHATOT_GATEWAY_WORKERS", "8") or "8")        # lookup song song / get_many
+GATEWAY_CACHE_SIZE = int(os.getenv("NHATOT_GATEWAY_CACHE", "2000") or "2000")  # số list_id giữ trong cache
+GATEWAY_TTL = int(os.getenv("NHATOT_GATEWAY_TTL", "1800") or "1800")           # giây
+GATEWAY_RATE = float(os.getenv("NHATOT_GATEWAY_RATE", "5") or "5")             # req/s tới gateway (API JSON)
+GATEWAY_BURST = int(os.getenv("NHATOT_GATEWAY_BURST", str(GATEWAY_WORKERS)) or "1")
+GATEWAY_TIMEOUT = 15
+GATEWAY_HOST = "gateway.chotot.com"
+# gateway không phải site đăng ký -> mặc định chỉ 1 req/s, burst 1 (get_many chạy tuần tự); search_url của nhatot
+# cũng gọi host này nên dùng chung bucket
+_throttle.configure(GATEWAY_HOST, GATEWAY_RATE, GATEWAY_BURST)
+_VERSIONS = ("v2", "v1")
+_MISSING = (404, 410)   # status = tin không có (được cache); status lỗi khác thì không
+_RECHECK_EVERY = 3600.0   # giây: thỉnh thoảng thử lại version ưu tiên hơn (v2) khi đang dùng v1
+
+
+class GatewayClient:
+    def __init__(self, workers: int = GATEWAY_WORKERS, cache_size: int = GATEWAY_CACHE_SIZE, ttl: int = GATEWAY_TTL):
+        self.workers = max(1, workers)
+        self.cache_size = cache_size
+        self.ttl = ttl
+        self._session: Optional[requests.Session] = None
+        self._cache: "OrderedDict[str, Tuple[float, Optional[dict]]]" = OrderedDict()   # list_id -> (lúc lưu, ad)
+        self._version = _VERSIONS[0]
+        self._version_at = 0.0
+        self._lock = threading.Lock()
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._flight = SingleFlight()
+        self.stats = {"hits": 0, "calls": 0, "probes": 0}
+
+    # ----- HTTP -----
+    def session(self) -> requests.Session:
+        with self._lock:
+            if self._session is None:
+                s = requests.Session()
+                s.headers.update(_REQ_HEADERS)
+                adapter = HTTPAdapter(pool_connections=2, pool_maxsize=self.workers * 2)
+                s.mount("https://", adapter)
+                self._session = s
+            return self._session
+
+    def _versions(self) -> List[str]:
+        """Version đang dùng được trước; version ưu tiên hơn được thử lại sau _RECHECK_EVERY."""
+        with self._lock:
+            cur = self._version
+            if cur != _VERSIONS[0] and time.monotonic() - self._version_at > _RECHECK_EVERY:
+                cur = _VERSIONS[0]
+        return [cur] + [v for v in _VERSIONS if v != cur]
+
+    def _fetch(self, list_id: str) -> Optional[dict]:
+        """
+        GET 1 tin; None nếu mọi version đều không có (404/410 / JSON lạ).
+        Lỗi mạng, 429, 5xx... -> raise (không cache như "không có tin").
+        """
+        error: Optional[BaseException] = None
+        for i, ver in enumerate(self._versions()):
+            if not _throttle.acquire(GATEWAY_HOST, timeout=_dl.remaining()):
+                raise _dl.DeadlineExceeded(f"deadline exceeded waiting for {GATEWAY_HOST}")
+            timeout = _dl.timeout(GATEWAY_TIMEOUT)
+            with self._lock:   # _fetch chạy song song trên pool của get_many
+                self.stats["calls"] += 1
+                if i:
+                    self.stats["probes"] += 1
+            try:
+                r = self.session().get(f"https://{GATEWAY_HOST}/{ver}/public/ad-listing/{list_id}", timeout=timeout)
+                if r.status_code in _MISSING:
+                    continue
+                r.raise_for_status()
+                js = r.json()
+            except (requests.RequestException, ValueError) as e:
+                error = e
+                continue
+            ad = (js.get("ad") or js) if isinstance(js, dict) else None
+            if not isinstance(ad, dict) or not (ad.get("subject") or ad.get("body")):
+                continue
+            with self._lock:
+                self._version, self._version_at = ver, time.monotonic()
+            return ad
+        if error is not None:
+            raise error
+        return None
+
+    # ----- cache -----
+    def _cached(self, list_id: str) -> Tuple[bool, Optional[dict]]:
+        with self._lock:
+            hit = self._cache.get(list_id)
+            if hit is None:
+                return False, None
+            if time.monotonic() - hit[0] > self.ttl:
+                del self._cache[list_id]
+                return False, None
+            self._cache.move_to_end(list_id)
+            self.stats["hits"] += 1
+            return True, hit[1]
+
+    def _store(self, list_id: str, ad: Optional[dict]) -> None:
+        with self._lock:
+            self._cache[list_id] = (time.monotonic(), ad)
+            self._cache.move_to_end(list_id)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def prime(self, ads: Iterable[dict]) -> None:
+        """Nạp cache từ tin lấy được ở nơi khác (listing API); chỉ tin có đủ nội dung (body) mới được nạp."""
+        for ad in ads:
+            if isinstance(ad, dict) and ad.get("list_id") and ad.get("body"):
+                self._store(str(ad["list_id"]), ad)
+
+    # ----- API -----
+    def get(self, list_id: str) -> Optional[dict]:
+        """Dict "ad" của 1 tin (subject, body, price_string, images, account_name...), None nếu không có / lỗi."""
+        list_id = str(list_id)
+        ok, ad = self._cached(list_id)
+        if ok:
+            return ad
+        try:
+            ad = self._flight.do(list_id, _dl.guard, self._fetch, list_id)
+        except Exception:
+            return None   # lỗi mạng: không cache, lần sau thử lại
+        self._store(list_id, ad)
+        return ad
+
+    def get_many(self, list_ids: Iterable[str]) -> Dict[str, dict]:
+        """{list_id: ad} cho nhiều tin; tin chưa có trong cache được tra song song trên pool kết nối chung."""
+        out: Dict[str, dict] = {}
+        missing: List[str] = []
+        for lid in dict.fromkeys(str(x) for x in list_ids):
+            ok, ad = self._cached(lid)
+            if ok:
+                if ad is not None:
+                    out[lid] = ad
+            else:
+                missing.append(lid)
+        if len(missing) == 1:
+            ad = self.get(missing[0])
+            if ad is not None:
+                out[missing[0]] = ad
+        elif missing:
+            # bind: giữ deadline của caller
+            for lid, ad in zip(missing, self._executor().map(_dl.bind(self.get), missing)):
+                if ad is not None:
+                    out[lid] = ad
+        return out
+
+    def _executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="nhatot-gw")
+            return self._pool
+
+
+GATEWAY = GatewayClient()
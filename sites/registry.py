@@ -0,0 +1,189 @@
+# sites/registry.py
+from __future__ import annotations
+import importlib
+from collections.abc import Mapping
+from dataclasses import dataclass
+from types import ModuleType
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from urllib.parse import urlparse, urlsplit, urlunparse
+
+# module path -> module đã import (None nếu import lỗi)
+_MODULES: Dict[str, Optional[ModuleType]] = {}
+
+
+@dataclass(frozen=True)
+class SiteSpec:
+    """
+    Metadata của 1 site. Module parser chỉ import khi gọi load()/parser lần đầu.
+    - strategy: "requests" | "cloudscraper" | "playwright" (mặc định nếu module không khai báo)
+    - rate / burst: giới hạn request/giây cho domain (token bucket)
+    - ready: các selector cần chờ khi render bằng Playwright (chờ lần lượt)
+    - ttl: số giây một tin được coi là còn "tươi" trước khi refresh
+    - stream_budget: tải bằng requests thì đọc tối đa bấy nhiêu byte HTML (0 = đọc hết)
+    - stream_until: phần tử cần có trước khi ngừng đọc sớm, dạng "tag#id.class*N"
+      (vd. "span.value*2" = đã đóng đủ 2 thẻ span.value); rỗng = chỉ dừng theo budget
+      Phải gồm cả khối liên hệ (tên + số điện thoại): regex tìm số trên toàn trang của parser chỉ thấy phần đã đọc.
+      Marker không có trong trang -> đọc tới hết budget (như không stream).
+    - storage_state: file Playwright storage_state (cookie đã qua CAPTCHA...) dùng nếu tồn tại; khác rỗng ->
+      site cần session: phiên Playwright thành công được lưu thêm vào pool state của domain (auth_states)
+    - priority: thứ tự ưu tiên khi gom link tìm kiếm (nhỏ = ưu tiên hơn)
+    - quota: số link tối đa lấy từ site trong 1 lượt tìm kiếm; phần này được "giữ chỗ" trước các site
+      ưu tiên thấp hơn (0 = không giữ chỗ, chỉ giới hạn bởi tổng)
+    """
+    domain: str
+    module: str
+    strategy: str = "requests"
+    rate: float = 1.0
+    burst: int = 2
+    ready: Tuple[str, ...] = ()
+    ttl: int = 6 * 3600
+    stream_budget: int = 0
+    stream_until: Tuple[str, ...] = ()
+    storage_state: str = ""
+    priority: int = 100
+    quota: int = 0
+
+    def load(self) -> Optional[ModuleType]:
+        if self.module not in _MODULES:
+            try:
+                _MODULES[self.module] = importlib.import_module(self.module)
+            except Exception:
+                _MODULES[self.module] = None  # lỗi import -> coi như chưa hỗ trợ
+        return _MODULES[self.module]
+
+    @property
+    def parser(self) -> Optional[Callable]:
+        mod = self.load()
+        return getattr(mod, "parse", None) if mod else None
+
+    @property
+    def default_strategy(self) -> str:
+        mod = self.load()
+        return getattr(mod, "DEFAULT_STRATEGY", self.strategy) if mod else self.strategy
+
+    @property
+    def fast_parser(self) -> Optional[Callable]:
+        """parse_fast(link, html) của module (đọc JSON nhúng từ HTML thô, không dựng DOM) nếu có."""
+        mod = self.load()
+        return getattr(mod, "parse_fast", None) if mod else None
+
+    def is_detail(self, link: str) -> bool:
+        """Link có phải trang chi tiết tin của site không (theo DETAIL_RE của module)."""
+        mod = self.load()
+        rx = getattr(mod, "DETAIL_RE", None) if mod else None
+        try:
+            return bool(rx and rx.search(urlsplit(link).path or ""))
+        except ValueError:
+            return False
+
+
+def normalize_host(host: str) -> str:
+    """lower-case, bỏ user:pass@, port và dấu '.' cuối."""
+    host = (host or "").strip().lower()
+    host = host.rsplit("@", 1)[-1]
+    if host.startswith("["):  # IPv6
+        return host
+    return host.split(":", 1)[0].rstrip(".")
+
+
+def canon_url(s: str) -> str:
+    """Chuẩn hóa URL để khử trùng lặp / làm key: bỏ fragment/query, bỏ '/' cuối, host viết thường."""
+    try:
+        p = urlparse(s)
+        p = p._replace(netloc=p.netloc.lower(), query="", fragment="")
+        path = p.path or "/"
+        if path != "/" and path.endswith("/"):
+            path = path[:-1]
+        p = p._replace(path=path)
+        return urlunparse(p)
+    except Exception:
+        return s
+
+
+class SiteIndex:
+    """
+    Index domain -> SiteSpec, tra cứu theo host bằng cách đi ngược lên domain cha:
+    "m.batdongsan.com.vn" -> "batdongsan.com.vn" -> "com.vn" -> "vn".
+    Chi phí O(số label của host); khớp theo ranh giới label nên
+    "i-batdongsan.com" không bao giờ khớp nhầm "batdongsan.com".
+    """
+
+    _CACHE_MAX = 50_000
+
+    def __init__(self, specs: Iterable[SiteSpec] = ()):
+        self._by_domain: Dict[str, SiteSpec] = {}
+        self._cache: Dict[str, Optional[SiteSpec]] = {}
+        for spec in specs:
+            self.add(spec)
+
+    def add(self, spec: SiteSpec) -> None:
+        self._by_domain[normalize_host(spec.domain)] = spec
+        self._cache.clear()
+
+    def __iter__(self):
+        return iter(self._by_domain.values())
+
+    def __len__(self) -> int:
+        return len(self._by_domain)
+
+    def domains(self) -> List[str]:
+        return list(self._by_domain)
+
+    def get(self, domain: str) -> Optional[SiteSpec]:
+        return self._by_domain.get(normalize_host(domain))
+
+    def lookup_host(self, host: str) -> Optional[SiteSpec]:
+        host = normalize_host(host)
+        try:
+            return self._cache[host]
+        except KeyError:
+            pass
+        spec = None
+        cand = host
+        while cand:
+            spec = self._by_domain.get(cand)
+            if spec is not None:
+                break
+            dot = cand.find(".")
+            cand = cand[dot + 1:] if dot >= 0 else ""
+        if len(self._cache) >= self._CACHE_MAX:
+            self._cache.clear()
+        self._cache[host] = spec
+        return spec
+
+    def lookup(self, link: str) -> Optional[SiteSpec]:
+        try:
+            return self.lookup_host(urlsplit(link).netloc)
+        except ValueError:
+            return None
+
+    def classify(self, links: Iterable[str]) -> Dict[Optional[str], List[str]]:
+        """Gom nhóm link theo domain đã đăng ký (key None = chưa hỗ trợ). Dùng cho job gom link số lượng lớn."""
+        out: Dict[Optional[str], List[str]] = {}
+        for link in links:
+            spec = self.lookup(link)
+            out.setdefault(spec.domain if spec else None, []).append(link)
+        return out
+
+
+class ParserRegistry(Mapping):
+    """
+    View tương thích ngược: domain -> (parser_func, default_strategy).
+    Site import lỗi (chưa có file, thiếu thư viện...) -> coi như không đăng ký domain đó.
+    """
+
+    def __init__(self, index: SiteIndex):
+        self._index = index
+
+    def __getitem__(self, dom: str) -> Tuple[Callable, str]:
+        spec = self._index.get(dom)
+        parser = spec.parser if spec else None
+        if parser is None:
+            raise KeyError(dom)
+        return parser, spec.default_strategy
+
+    def __iter__(self):
+        return iter(self._index.domains())
+
+    def __len__(self) -> int:
+        return len(self._index)
@@ -2,6 +2,7 @@
 from __future__ import annotations
 import re
 from typing import List, Optional
+from urllib.parse import urljoin, urlparse, parse_qsl, urlencode
 from bs4 import BeautifulSoup, Tag
 
 _LEADING_COMBINATORS = re.compile(r"^\s*([>+~,]+)\s*")
@@ -30,3 +31,68 @@ def text_or_empty(node: Tag, strip: bool = True) -> str:
     if not node:
         return ""
     return node.get_text(strip=strip)
+
+def _img_src(img: Tag) -> str:
+    if not img:
+        return ""
+    for attr in ("data-src", "data-lazy", "data-original", "src"):
+        v = (img.get(attr) or "").strip()
+        if v and not v.startswith("data:"):
+            return v
+    return ""
+
+def list_cards(
+    soup: BeautifulSoup,
+    base: str,
+    card: str,
+    detail_re: re.Pattern,
+    link: str = "a[href]",
+    title: str = "",
+    price: str = "",
+    area: str = "",
+    image: str = "img",
+) -> List[dict]:
+    """
+    Gom các "card" tin rao trên trang danh mục/kết quả tìm kiếm -> list dict
+    (link, title, price, area, image). Chỉ giữ link khớp detail_re (trang chi tiết).
+    Không thấy card nào (layout đổi) -> quét mọi <a> khớp detail_re, chỉ lấy link + title.
+    """
+    out: List[dict] = []
+    seen = set()
+
+    def _add(a: Tag, box: Optional[Tag]):
+        href = urljoin(base, a.get("href", ""))
+        p = urlparse(href)
+        if p.scheme not in ("http", "https") or not detail_re.search(p.path or ""):
+            return
+        key = p._replace(query="", fragment="").geturl().rstrip("/")
+        if key in seen:
+            return
+        seen.add(key)
+        t = (text_or_empty(sel1(box, title)) if box is not None and title else "") \
+            or (a.get("title") or "").strip() or a.get_text(" ", strip=True)
+        img = sel1(box, image) if box is not None and image else None
+        out.append({
+            "link": key,
+            "title": t,
+            "price": text_or_empty(sel1(box, price)) if box is not None and price else "",
+            "area": text_or_empty(sel1(box, area)) if box is not None and area else "",
+            "image": urljoin(base, _img_src(img)) if _img_src(img) else "",
+        })
+
+    for box in sel(soup, card):
+        a = sel1(box, link) or (box if box.name == "a" and box.get("href") else None)
+        if a is not None:
+            _add(a, box)
+    if not out:
+        for a in soup.find_all("a", href=True):
+            _add(a, None)
+    return out
+
+def with_query_page(link: str, page: int, param: str = "page") -> str:
+    """Trang thứ `page` của 1 trang danh mục phân trang bằng query (?page=N)."""
+    p = urlparse(link)
+    q = [(k, v) for k, v in parse_qsl(p.query, keep_blank_values=True) if k != param]
+    if page > 1:
+        q.append((param, str(page)))
+    return p._replace(query=urlencode(q)).geturl()
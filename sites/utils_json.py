@@ -0,0 +1,150 @@
+# sites/utils_json.py
+# JSON nhúng trong trang (Next.js __NEXT_DATA__, JSON-LD) lấy thẳng từ HTML thô, không dựng DOM:
+# - tìm thẻ <script> bằng regex trên chuỗi HTML (trang Next.js 1-2MB: vài ms thay vì vài trăm ms BeautifulSoup)
+# - parse bằng orjson nếu có (pip install orjson), không thì json
+# - Locator: đường dẫn khoá biết trước ("props.pageProps.ad") thử trước; không khớp mới duyệt đệ quy tìm
+#   node đầu tiên thoả điều kiện, và nhớ đường dẫn đó để các trang sau (cùng khuôn) đi thẳng tới
+# Dùng cho mọi site nhúng dữ liệu kiểu này (xem sites/nhatot.py: parse_fast / parse_list).
+from __future__ import annotations
+import json
+import re
+import threading
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+try:
+    import orjson  # pip install orjson
+except ImportError:
+    orjson = None
+
+Path = Tuple[Union[str, int], ...]
+
+_SCRIPT_END = re.compile(r"</script\s*>", re.I)
+_LD_OPEN = re.compile(r"<script\b[^>]*\btype\s*=\s*[\"']?application/ld\+json[\"']?[^>]*>", re.I)
+_ID_OPEN: Dict[str, "re.Pattern"] = {}
+
+
+def loads(text: Union[str, bytes, None]) -> Any:
+    """JSON -> object; rỗng / lỗi -> None."""
+    if not text:
+        return None
+    try:
+        return orjson.loads(text) if orjson is not None else json.loads(text)
+    except ValueError:   # orjson.JSONDecodeError / json.JSONDecodeError đều là ValueError
+        return None
+
+
+def _body(html: str, start: int) -> str:
+    m = _SCRIPT_END.search(html, start)
+    return html[start:m.start() if m else len(html)].strip()
+
+
+def script_json(html: str, script_id: str = "__NEXT_DATA__") -> Any:
+    """JSON trong <script id=script_id> của HTML thô (None nếu không có / lỗi)."""
+    if not html or script_id not in html:   # kiểm tra chuỗi con trước: rẻ hơn regex
+        return None
+    rx = _ID_OPEN.get(script_id)
+    if rx is None:
+        rx = _ID_OPEN[script_id] = re.compile(
+            r"<script\b[^>]*\bid\s*=\s*[\"']?" + re.escape(script_id) + r"[\"']?[^>]*>", re.I)
+    m = rx.search(html)
+    return loads(_body(html, m.end())) if m else None
+
+
+def ld_json(html: str) -> List[dict]:
+    """Mọi object JSON-LD trong HTML thô (đã trải list và @graph)."""
+    out: List[dict] = []
+    if not html or "ld+json" not in html:
+        return out
+    for m in _LD_OPEN.finditer(html):
+        out.extend(_flatten_ld(loads(_body(html, m.end()))))
+    return out
+
+
+def _flatten_ld(obj: Any) -> Iterator[dict]:
+    if isinstance(obj, list):
+        for it in obj:
+            yield from _flatten_ld(it)
+    elif isinstance(obj, dict):
+        yield obj
+        if isinstance(obj.get("@graph"), list):
+            yield from _flatten_ld(obj["@graph"])
+
+
+# ---------- Tra cứu trong cây JSON ----------
+def walk(obj: Any, path: Iterable[Union[str, int]]) -> Any:
+    """obj theo đường dẫn (khoá dict / chỉ số list); đứt giữa chừng -> None."""
+    for k in path:
+        if isinstance(obj, dict):
+            obj = obj.get(k)
+        elif isinstance(obj, list) and isinstance(k, int) and -len(obj) <= k < len(obj):
+            obj = obj[k]
+        else:
+            return None
+    return obj
+
+
+def find_path(obj: Any, pred: Callable[[Any], bool], _path: Path = ()) -> Optional[Path]:
+    """Đường dẫn tới node đầu tiên (duyệt sâu) thoả pred, hoặc None."""
+    if pred(obj):
+        return _path
+    if isinstance(obj, dict):
+        items = obj.items()
+    elif isinstance(obj, list):
+        items = enumerate(obj)
+    else:
+        return None
+    for k, v in items:
+        p = find_path(v, pred, _path + (k,))
+        if p is not None:
+            return p
+    return None
+
+
+def search_keys(obj: Any, keys: Iterable[str]) -> Any:
+    """Giá trị (khác None) của khoá đầu tiên thuộc keys (không phân biệt hoa thường), duyệt sâu toàn cây."""
+    keys = {k.lower() for k in keys}
+    if isinstance(obj, dict):
+        for k, v in obj.items():
+            if str(k).lower() in keys and v is not None:
+                return v
+            found = search_keys(v, keys)
+            if found is not None:
+                return found
+    elif isinstance(obj, list):
+        for it in obj:
+            found = search_keys(it, keys)
+            if found is not None:
+                return found
+    return None
+
+
+class Locator:
+    """
+    Tìm 1 node trong cây JSON: thử các đường dẫn cho trước (dạng "a.b.0.c") và đường dẫn đã học, node ở đó
+    thoả pred thì trả luôn; không thì duyệt đệ quy (find_path) rồi nhớ đường dẫn tìm được (tối đa `learn`).
+    """
+
+    def __init__(self, pred: Callable[[Any], bool], paths: Iterable[str] = (), learn: int = 4):
+        self.pred = pred
+        self.paths: List[Path] = [tuple(int(p) if p.lstrip("-").isdigit() else p for p in s.split("."))
+                                  for s in paths]
+        self.learn = learn
+        self._learned: List[Path] = []
+        self._lock = threading.Lock()
+
+    def path(self, obj: Any) -> Optional[Path]:
+        if obj is None:
+            return None
+        for p in self.paths + self._learned:
+            if self.pred(walk(obj, p)):
+                return p
+        p = find_path(obj, self.pred)
+        if p is not None and self.learn:
+            with self._lock:
+                if p not in self._learned and p not in self.paths:
+                    self._learned = ([p] + self._learned)[:self.learn]
+        return p
+
+    def get(self, obj: Any) -> Any:
+        p = self.path(obj)
+        return None if p is None else walk(obj, p)
@@ -0,0 +1,275 @@
+# sites/utils_query.py
+# Dịch câu tìm kiếm tự do ("Bán nhà Quận 3, Hồ Chí Minh dưới 10 tỷ") -> bộ lọc có cấu trúc:
+# giao dịch, loại BĐS, tỉnh / quận (gazetteer) / phường, khoảng giá, khoảng diện tích.
+# - sites/<site>.py dựng URL trang tìm kiếm của chính site (search_url) từ đó
+# - search_aggregator / search_google lọc link + card TRƯỚC khi trích xuất (url_ok, listing_ok)
+#   và lọc tin SAU khi trích xuất theo giá / diện tích đã parse (listing_ok)
+from __future__ import annotations
+import re
+import unicodedata
+from dataclasses import dataclass
+from typing import Optional, Tuple
+from urllib.parse import urlsplit
+
+from .gazetteer import MAX_NAME_TOKENS, districts_of, lookup as lookup_district
+from .utils_values import area_to_m2, price_to_vnd, to_number
+
+# slug tỉnh/thành -> các cách viết thường gặp (đã bỏ dấu, viết thường)
+_PROVINCES = {
+    "ho-chi-minh": ("ho chi minh", "tp hcm", "tphcm", "hcm", "sai gon", "saigon"),
+    "ha-noi": ("ha noi", "hanoi"),
+    "da-nang": ("da nang",),
+    "hai-phong": ("hai phong",),
+    "can-tho": ("can tho",),
+    "binh-duong": ("binh duong",),
+    "dong-nai": ("dong nai",),
+    "khanh-hoa": ("khanh hoa", "nha trang"),
+    "ba-ria-vung-tau": ("ba ria vung tau", "vung tau"),
+    "long-an": ("long an",),
+    "quang-ninh": ("quang ninh", "ha long"),
+    "lam-dong": ("lam dong", "da lat"),
+    "bac-ninh": ("bac ninh",),
+}
+
+# loại BĐS (key dùng chung cho mọi site) -> regex trên chuỗi đã bỏ dấu; khớp theo thứ tự
+_KINDS = (
+    ("", r"\bnha dat\b|\bbat dong san\b|\bbds\b"),
+    ("can-ho", r"\bcan ho\b|\bchung cu\b|\bapartment\b"),
+    ("biet-thu", r"\bbiet thu\b|\blien ke\b"),
+    ("nha-mat-pho", r"\bmat pho\b|\bmat tien\b|\bnha pho\b"),
+    ("phong-tro", r"\bphong tro\b|\bnha tro\b"),
+    ("van-phong", r"\bvan phong\b"),
+    ("dat", r"\bdat nen\b|\blo dat\b|\bdat\b"),
+    ("nha", r"\bnha\b"),
+)
+
+_RENT_RE = re.compile(r"\b(?:cho thue|thue)\b")
+_STOP = r"(?=\s*(?:,|;|-|$|\b(?:tinh|thanh pho|tp|quan|huyen|phuong|duoi|tren|tu|gia|khoang|dien tich|dt|co|gan)\b))"
+_DISTRICT_RE = re.compile(r"\b(quan|huyen|thi xa|thanh pho|tp)\s*\.?\s*(\d{1,2}|[a-z]+(?: [a-z]+){0,2}?)" + _STOP)
+_SHORT_DISTRICT_RE = re.compile(r"\bq\s*\.?\s*(\d{1,2})\b")   # "q3", "q.3"
+_WARD_RE = re.compile(r"\b(phuong|(?<!thi )xa)\s*\.?\s*(\d{1,2}|[a-z]+(?: [a-z]+){0,2}?)" + _STOP)
+_SHORT_WARD_RE = re.compile(r"\bp\s*\.?\s*(\d{1,2})\b")       # "p.15"
+_PREFIX_SLUG = {"quan": "quan", "huyen": "huyen", "thi xa": "thi-xa", "thanh pho": "thanh-pho", "tp": "thanh-pho"}
+
+# ----- khoảng giá / diện tích (chạy trên chuỗi đã bỏ dấu, giữ nguyên độ dài để cắt khỏi câu gốc) -----
+_NUM = r"(\d+(?:[.,]\d+)?)"
+_PU = r"\s*(ty|ti|trieu|tr)\b"
+_AU = r"\s*(?:m2|m²|met vuong|m\b)"
+_LT = r"(?:duoi|nho hon|toi da|khong qua|re hon|<=?)"
+_GT = r"(?:tren|lon hon|tu|it nhat|>=?)"
+_TO = r"\s*(?:-|den|toi|~)\s*"
+_PRICE_MUL = {"ty": 1e9, "ti": 1e9, "trieu": 1e6, "tr": 1e6}
+APPROX = 0.15   # "khoảng 5 tỷ", "60m2" -> ±15%
+
+# (kind, regex): kind = "range" | "max" | "min" | "approx"; khớp "range" thì bỏ qua các dạng còn lại
+_AREA_PATTERNS = (
+    ("range", re.compile(rf"(?:dien tich\s*|dt\s*)?(?:tu\s*)?{_NUM}(?:{_AU})?{_TO}{_NUM}{_AU}")),
+    ("max", re.compile(rf"(?:dien tich\s*|dt\s*)?{_LT}\s*{_NUM}{_AU}")),
+    ("min", re.compile(rf"(?:dien tich\s*|dt\s*)?{_GT}\s*{_NUM}{_AU}")),
+    ("approx", re.compile(rf"(?:dien tich\s*|dt\s*)?:?\s*(?:khoang\s*|tam\s*)?{_NUM}{_AU}")),
+)
+_PRICE_PATTERNS = (
+    ("range", re.compile(rf"(?:gia\s*)?(?:tu\s*)?{_NUM}(?:{_PU})?{_TO}{_NUM}{_PU}")),
+    ("max", re.compile(rf"(?:gia\s*)?{_LT}\s*{_NUM}{_PU}")),
+    ("min", re.compile(rf"(?:gia\s*)?{_GT}\s*{_NUM}{_PU}")),
+    ("approx", re.compile(rf"(?:gia\s*)?(?:khoang\s*|tam\s*|chung\s*)?{_NUM}{_PU}")),
+)
+
+
+def strip_accents(s: str) -> str:
+    """'Bình Thạnh' -> 'Binh Thanh' (đ -> d)."""
+    s = (s or "").replace("đ", "d").replace("Đ", "D")
+    return "".join(c for c in unicodedata.normalize("NFD", s) if unicodedata.category(c) != "Mn")
+
+
+def _fold(s: str) -> str:
+    """Bỏ dấu từng ký tự, giữ nguyên độ dài (vị trí match trên chuỗi kết quả = vị trí trên chuỗi gốc NFC)."""
+    out = []
+    for c in s:
+        base = strip_accents(c)
+        out.append(base[0].lower() if len(base) >= 1 and len(base[0].lower()) == 1 else " ")
+    return "".join(out)
+
+
+def slugify(s: str) -> str:
+    """'Quận Bình Thạnh' -> 'quan-binh-thanh'"""
+    return re.sub(r"[^a-z0-9]+", "-", strip_accents(s).lower()).strip("-")
+
+
+def _plain(s: str) -> str:
+    return re.sub(r"\s+", " ", re.sub(r"[^a-z0-9,;\-. ]+", " ", strip_accents(s).lower())).strip()
+
+
+def _mentions(path: str, slug: str) -> bool:
+    forms = [slug] + (["tp-" + slug[len("thanh-pho-"):]] if slug.startswith("thanh-pho-") else [])
+    return any(re.search(rf"(?<![a-z0-9]){re.escape(f)}(?![a-z0-9])", path) for f in forms)
+
+
+@dataclass(frozen=True)
+class SearchQuery:
+    """
+    Câu tìm kiếm đã tách:
+    - transaction: "ban" | "thue"
+    - kind: "" (mọi loại) | "nha" | "can-ho" | "nha-mat-pho" | "biet-thu" | "dat" | "phong-tro" | "van-phong"
+    - province: slug tỉnh ("ho-chi-minh"); district: slug quận/huyện có tiền tố ("quan-3", "huyen-binh-chanh")
+    - district_name: tên quận (không dấu) làm từ khoá cho site tìm theo text; ward: slug phường/xã
+    - price_min/max (VND), area_min/max (m²): None = không giới hạn
+    - search_text: câu gốc đã bỏ phần giá / diện tích (gửi Google CSE)
+    """
+    text: str
+    transaction: str = "ban"
+    kind: str = ""
+    province: str = ""
+    district: str = ""
+    district_name: str = ""
+    ward: str = ""
+    price_min: Optional[float] = None
+    price_max: Optional[float] = None
+    area_min: Optional[float] = None
+    area_max: Optional[float] = None
+    search_text: str = ""
+
+    # ----- lọc -----
+    def url_ok(self, link: str) -> bool:
+        """Lọc trước khi tải: slug URL ghi rõ giao dịch ngược chiều / quận khác cùng tỉnh -> bỏ."""
+        try:
+            path = urlsplit(link).path.lower()
+        except ValueError:
+            return True
+        if self.transaction == "ban" and "cho-thue" in path:
+            return False
+        if self.transaction == "thue" and "cho-thue" not in path and re.search(r"(?:^|/)(?:can-)?ban-", path):
+            return False
+        if self.district and self.province and not _mentions(path, self.district):
+            if any(d.slug != self.district and _mentions(path, d.slug) for d in districts_of(self.province)):
+                return False
+        return True
+
+    def listing_ok(self, item) -> bool:
+        """Lọc theo giá / diện tích đã parse (card hoặc tin đã trích xuất). Không parse được -> giữ."""
+        if self.price_min is not None or self.price_max is not None:
+            v = price_to_vnd(item.get("price") or "")
+            if v is not None and not _within(v, self.price_min, self.price_max):
+                return False
+        if self.area_min is not None or self.area_max is not None:
+            v = area_to_m2(item.get("area") or "")
+            if v is not None and not _within(v, self.area_min, self.area_max):
+                return False
+        return True
+
+    @property
+    def has_numeric(self) -> bool:
+        return any(v is not None for v in (self.price_min, self.price_max, self.area_min, self.area_max))
+
+
+def _within(v: float, lo: Optional[float], hi: Optional[float]) -> bool:
+    return (lo is None or v >= lo) and (hi is None or v <= hi)
+
+
+def _ranges(folded: str, patterns, unit) -> Tuple[Optional[float], Optional[float], list]:
+    """(min, max, spans) theo bảng patterns; unit(match, idx) -> hệ số nhân của số thứ idx."""
+    lo = hi = None
+    spans = []
+    for kind, rx in patterns:
+        if kind == "range" and (lo is not None or hi is not None):
+            break
+        if kind == "approx" and (lo is not None or hi is not None):
+            break
+        if (kind == "max" and hi is not None) or (kind == "min" and lo is not None):
+            continue
+        m = rx.search(folded)
+        if not m:
+            continue
+        a = to_number(m.group(1))
+        if a is None:
+            continue
+        a *= unit(m, 1)
+        if kind == "range":
+            b = to_number(m.group(3) if m.re.groups >= 4 else m.group(2))
+            if b is None:
+                continue
+            b *= unit(m, 2)
+            lo, hi = min(a, b), max(a, b)
+        elif kind == "max":
+            hi = a
+        elif kind == "min":
+            lo = a
+        else:
+            lo, hi = a * (1 - APPROX), a * (1 + APPROX)
+        spans.append(m.span())
+        folded = folded[:m.start()] + " " * (m.end() - m.start()) + folded[m.end():]
+    return lo, hi, spans
+
+
+def _price_unit(m: re.Match, idx: int) -> float:
+    # range: groups (num1, unit1?, num2, unit2); các dạng khác: (num, unit)
+    if m.re.groups >= 4:
+        u = m.group(2) if idx == 1 and m.group(2) else m.group(4)
+    else:
+        u = m.group(2)
+    return _PRICE_MUL.get(u or "", 1.0)
+
+
+def parse_query(text: str) -> SearchQuery:
+    text = unicodedata.normalize("NFC", text or "")
+    folded = _fold(text)
+
+    area_lo, area_hi, spans = _ranges(folded, _AREA_PATTERNS, lambda m, i: 1.0)
+    for a, b in spans:
+        folded = folded[:a] + " " * (b - a) + folded[b:]
+    price_lo, price_hi, pspans = _ranges(folded, _PRICE_PATTERNS, _price_unit)
+    spans += pspans
+    search_text = text
+    for a, b in sorted(spans, reverse=True):
+        search_text = search_text[:a] + " " + search_text[b:]
+        folded = folded[:a] + "," + " " * (b - a - 1) + folded[b:]
+    search_text = re.sub(r"\s+", " ", search_text).strip(" ,;-")
+
+    t = _plain(folded)
+    transaction = "thue" if _RENT_RE.search(t) else "ban"
+
+    province = ""
+    for slug, names in _PROVINCES.items():
+        m = re.search(r"\b(?:tinh |thanh pho |tp\.? )?(?:" + "|".join(map(re.escape, names)) + r")\b", t)
+        if m:
+            province = slug
+            t = (t[:m.start()] + "," + t[m.end():]).strip()
+            break
+
+    ward = ""
+    m = _WARD_RE.search(t) or _SHORT_WARD_RE.search(t)
+    if m:
+        name = m.group(m.re.groups).strip()
+        ward = "phuong-" + slugify(name) if m.re is _SHORT_WARD_RE or m.group(1) == "phuong" else "xa-" + slugify(name)
+        t = (t[:m.start()] + "," + t[m.end():]).strip()
+
+    district = district_name = ""
+    m = _DISTRICT_RE.search(t)
+    if m and m.group(2).strip():
+        name = m.group(2).strip()
+        d = lookup_district(name, province)
+        district = d.slug if d else f"{_PREFIX_SLUG[m.group(1)]}-{slugify(name)}"
+        district_name = f"{m.group(1)} {name}"
+        province = province or (d.province if d else "")
+    elif _SHORT_DISTRICT_RE.search(t):
+        n = int(_SHORT_DISTRICT_RE.search(t).group(1))
+        district, district_name = f"quan-{n}", f"quan {n}"
+    else:
+        # tên quận không kèm "Quận"/"Huyện": dò n-gram dài nhất trong gazetteer ("Bình Thạnh", "Cầu Giấy")
+        words = re.findall(r"[a-z]+", t)
+        for n in range(min(MAX_NAME_TOKENS, len(words)), 1, -1):
+            d = next((d for i in range(len(words) - n + 1)
+                      if (d := lookup_district(" ".join(words[i:i + n]), province))), None)
+            if d:
+                district, district_name, province = d.slug, _plain(d.name), province or d.province
+                break
+
+    kind = ""
+    for key, rx in _KINDS:
+        if re.search(rx, t):
+            kind = key
+            break
+    return SearchQuery(text=text, transaction=transaction, kind=kind, province=province,
+                       district=district, district_name=district_name, ward=ward,
+                       price_min=price_lo, price_max=price_hi, area_min=area_lo, area_max=area_hi,
+                       search_text=search_text)
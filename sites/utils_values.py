@@ -0,0 +1,65 @@
+# sites/utils_values.py
+from __future__ import annotations
+import re
+from typing import Optional
+
+# Đơn vị giá -> hệ số VND
+_PRICE_UNITS = (
+    (re.compile(r"(\d+(?:[.,]\d+)?)\s*(?:tỷ|tỉ|ty\b)", re.I), 1_000_000_000),
+    (re.compile(r"(\d+(?:[.,]\d+)?)\s*(?:triệu|trieu|tr\b)", re.I), 1_000_000),
+    (re.compile(r"(\d+(?:[.,]\d+)?)\s*(?:nghìn|ngàn|ngan|nghin|k\b)", re.I), 1_000),
+)
+_THOUSANDS = re.compile(r"^\d{1,3}(?:[.,]\d{3})+$")
+_AREA_RE = re.compile(r"(\d+(?:[.,]\d+)?)\s*m(?:2|²)", re.I)
+_AREA_DIM_RE = re.compile(r"(\d+(?:[.,]\d+)?)\s*[x×]\s*(\d+(?:[.,]\d+)?)\s*m", re.I)
+
+
+def to_number(s: str) -> Optional[float]:
+    """'18,5' -> 18.5, '1.200.000' -> 1200000.0, '1.2' -> 1.2."""
+    s = (s or "").strip()
+    if not s:
+        return None
+    if _THOUSANDS.match(s):
+        s = re.sub(r"[.,]", "", s)
+    else:
+        s = s.replace(",", ".")
+    try:
+        return float(s)
+    except ValueError:
+        return None
+
+
+def price_to_vnd(text: str) -> Optional[float]:
+    """
+    '18 tỷ' -> 1.8e10, '2 tỷ 500 triệu' -> 2.5e9, '850 triệu' -> 8.5e8, '18000000000 VND' -> 1.8e10.
+    Giá theo m² ('35 triệu/m²') hoặc 'Thỏa thuận' -> None.
+    """
+    t = (text or "").lower()
+    if not t or re.search(r"/\s*m(?:2|²)", t):
+        return None
+    total, hit = 0.0, False
+    for rx, mul in _PRICE_UNITS:
+        for m in rx.finditer(t):
+            n = to_number(m.group(1))
+            if n is not None:
+                total += n * mul
+                hit = True
+    if hit:
+        return total
+    m = re.search(r"\d[\d.,]{5,}", t)  # số VND "trần" (>= 6 chữ số)
+    return to_number(m.group(0)) if m else None
+
+
+def area_to_m2(text: str) -> Optional[float]:
+    """'84 m²' -> 84.0, '84,5m2' -> 84.5, '6x14m2' -> 84.0; chuỗi chỉ có số -> số đó."""
+    t = text or ""
+    m = _AREA_DIM_RE.search(t)
+    if m:
+        a, b = to_number(m.group(1)), to_number(m.group(2))
+        if a is not None and b is not None:
+            return a * b
+    m = _AREA_RE.search(t)
+    if m:
+        return to_number(m.group(1))
+    m = re.fullmatch(r"\s*(\d+(?:[.,]\d+)?)\s*", t)
+    return to_number(m.group(1)) if m else None
@@ -2,36 +2,67 @@ import os
 import math
 import time
 import html
-import requests
 import streamlit as st
 from search_google import search_google
 
 # NEW: dùng fetchers + registry site để test 1 URL
-from fetchers import get_html
+from fetchers import get_html, ensure_chromium
 from sites import pick_site
-
-# ========= Đảm bảo Playwright Chromium có sẵn (cài 1 lần) =========
-try:
-    if "_pw_ready" not in st.session_state:
-        import subprocess, sys
-
-        if os.getenv("USE_PLAYWRIGHT", "1") != "0":
-            try:
-                subprocess.run(
-                    [sys.executable, "-m", "playwright", "install-deps", "chromium"],
-                    check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
-                )
-            except Exception as e:
-                st.warning(f"Install-deps Chromium thất bại (bỏ qua): {e}")
-
-            subprocess.run(
-                [sys.executable, "-m", "playwright", "install", "chromium"],
-                check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
-            )
-
-        st.session_state._pw_ready = True
-except Exception as e:
-    st.warning(f"Không cài được Playwright Chromium (sẽ dùng requests/cache nếu cần): {e}")
+from thumbs import get_thumb
+from browser_pool import get_pool
+from listing import parse_listing
+
+# ========= Đảm bảo Playwright Chromium có sẵn (probe 1 lần/process) =========
+@st.cache_resource(show_spinner=False)
+def _chromium_ready() -> bool:
+    # Chỉ chạy `playwright install` khi probe thư mục browser báo chưa có
+    return ensure_chromium(with_deps=True)
+
+# Pool Chromium dùng chung cho mọi session/rerun (browser_pool giữ browser sống giữa các lần fetch)
+@st.cache_resource(show_spinner=False)
+def _browser_pool(headless: bool):
+    return get_pool(headless)
+
+if os.getenv("USE_PLAYWRIGHT", "1") != "0":
+    try:
+        _chromium_ready()
+        _browser_pool(os.getenv("PLAYWRIGHT_HEADLESS", "1") == "1")
+    except Exception as e:
+        st.warning(f"Không cài được Playwright Chromium (sẽ dùng requests/cache nếu cần): {e}")
+
+# ========= Cache dùng chung giữa các session (rerun / nhiều user cùng query không tính lại) =========
+SEARCH_CACHE_TTL = int(os.getenv("SEARCH_CACHE_TTL", "900") or "900")
+URL_CACHE_TTL = int(os.getenv("URL_CACHE_TTL", "3600") or "3600")
+
+class _Truncated(Exception):
+    """Kết quả bị deadline cắt ngang: đi ra ngoài cache_data bằng exception để không bị cache."""
+
+    def __init__(self, items: list):
+        super().__init__("search truncated by deadline")
+        self.items = items
+
+@st.cache_data(ttl=SEARCH_CACHE_TTL, max_entries=200, show_spinner=False)
+def _cached_search(query: str, target_total: int, use_playwright: bool) -> list:
+    # use_playwright nằm trong key: checkbox đổi USE_PLAYWRIGHT (crawler đọc lúc gọi) -> kết quả khác
+    res = search_google(query, target_total=target_total)
+    if getattr(res, "truncated", False):
+        raise _Truncated(list(res))
+    return list(res)
+
+def cached_search(query: str, target_total: int, use_playwright: bool) -> list:
+    """Như search_google nhưng cache SEARCH_CACHE_TTL giây; kết quả thiếu vì hết time_budget thì không cache."""
+    try:
+        return _cached_search(query, target_total, use_playwright)
+    except _Truncated as t:
+        return t.items
+
+@st.cache_data(ttl=URL_CACHE_TTL, max_entries=500, show_spinner=False)
+def cached_test_url(url: str, strategy: str, use_playwright: bool) -> tuple:
+    """(data, html rút gọn, bị cắt?) cho form Test 1 URL; lỗi không được cache (exception đi thẳng ra ngoài)."""
+    parser, _ = pick_site(url)
+    html_text = get_html(url, strategy)
+    data = parse_listing(parser, url, html_text, source=strategy)
+    return data, html_text[:5000], len(html_text) > 5000
 
 # ========= Load secrets -> env (nếu có) =========
 for k in ("GOOGLE_API_KEY", "GOOGLE_CX", "PLAYWRIGHT_HEADLESS", "USE_PLAYWRIGHT"):
@@ -97,6 +128,7 @@ with st.sidebar:
             "num": 3,
             "hl": "vi",
         }
+        import requests
         try:
             r = requests.get("https://www.googleapis.com/customsearch/v1", params=params, timeout=15)
             st.write("HTTP:", r.status_code)
@@ -104,6 +136,22 @@ with st.sidebar:
         except Exception as e:
             st.error(f"Lỗi gọi Google API: {e}")
 
+    with st.expander("Trạng thái rate limit / circuit breaker"):
+        import throttle
+        st.json(throttle.state())
+        from hedging import LATENCY
+        st.caption("Độ trễ fetch (giây) theo domain/strategy")
+        st.json(LATENCY.snapshot())
+    with st.expander("Tỉ lệ fallback Google Cache"):
+        from crawler import FALLBACK
+        st.json(FALLBACK.stats())
+    with st.expander("Session đã qua CAPTCHA (storage_state)"):
+        from auth_states import default_pool as auth_pool
+        st.json(auth_pool().stats())
+        from browser_pool import warm_stats
+        st.caption("Context Playwright dùng lại theo domain (pages / contexts)")
+        st.json(warm_stats())
+
 # --- State ---
 if "query" not in st.session_state:
     st.session_state.query = ""
@@ -129,9 +177,10 @@ def render_card(item: dict):
         left, right = st.columns([1, 1.6], vertical_alignment="top")
         with left:
             if image:
-                # Ưu tiên server-side fetch để tránh bị chặn hotlink/referer
+                # Thumbnail từ cache đĩa (server tải + resize 1 lần) -> rerun không tải lại ảnh full-size
                 try:
-                    st.image(image, use_container_width=True)
+                    data, _ = get_thumb(image)
+                    st.image(data, use_container_width=True)
                 except Exception:
                     st.markdown(f'<img class="card-img" src="{html.escape(image)}">', unsafe_allow_html=True)
             else:
@@ -160,9 +209,7 @@ with st.form("search_form", clear_on_submit=False):
             st.session_state.batch = 1
             with st.spinner("Đang tìm kiếm và gom link…"):
                 try:
-                    res = search_google(st.session_state.query, target_total=TARGET_TOTAL)
-                except TypeError:
-                    res = search_google(st.session_state.query)
+                    res = cached_search(st.session_state.query, TARGET_TOTAL, not disable_pw)
                 except Exception as e:
                     st.error(f"Lỗi khi gọi search_google: {e}")
                     res = []
@@ -239,26 +286,18 @@ if submit:
         if not picked:
             st.error("❌ Domain này chưa được hỗ trợ trong 'sites/'.")
         else:
-            parser, default_strategy = picked
+            _, default_strategy = picked
             # Dùng default_strategy từ SITE_REGISTRY nếu user để 'auto'
             use_strategy = default_strategy if strategy == "auto" else strategy
             st.info(f"Site: **{host or 'n/a'}**, Strategy: **{use_strategy}**")
             try:
-                with st.spinner("Đang tải HTML…"):
-                    html_text = get_html(test_url, use_strategy)
-
-                from bs4 import BeautifulSoup
-                with st.spinner("Đang trích xuất…"):
-                    try:
-                        data = parser(test_url, html_text)
-                    except TypeError:
-                        data = parser(test_url, BeautifulSoup(html_text, "lxml"))
-                    data["_source"] = use_strategy
+                with st.spinner("Đang tải HTML và trích xuất…"):
+                    data, short, truncated = cached_test_url(test_url, use_strategy, not disable_pw)
 
                 render_card(data)
 
                 if show_raw:
-                    short = html_text[:5000] + ("… (truncated)" if len(html_text) > 5000 else "")
+                    short = short + ("… (truncated)" if truncated else "")
                     st.code(short, language="html")
             except Exception as e:
                 st.error(f"Lỗi test: {e}. Hãy thử strategy khác (cloudscraper/playwright).")
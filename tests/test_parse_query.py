@@ -0,0 +1,96 @@
+# tests/test_parse_query.py
+import os, sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from sites.utils_query import parse_query
+
+"""
+Usage:
+  python tests/test_parse_query.py
+Kiểm tra bảng câu tìm kiếm -> bộ lọc (sites/utils_query): parse_query, SearchQuery.url_ok, listing_ok.
+Bộ lọc quyết định link nào bị bỏ trước khi tải -> sửa regex / gazetteer thì chạy lại script này.
+"""
+
+TY = 1_000_000_000
+
+# câu tìm kiếm -> các trường mong đợi (trường không ghi thì không kiểm tra)
+QUERIES = [
+    ("Bán nhà Quận 3 dưới 10 tỷ",
+     dict(transaction="ban", kind="nha", province="ho-chi-minh", district="quan-3",
+          price_min=None, price_max=10 * TY, area_min=None, area_max=None, search_text="Bán nhà Quận 3")),
+    ("Cho thuê căn hộ Bình Thạnh 50-80m2",
+     dict(transaction="thue", kind="can-ho", province="ho-chi-minh", district="quan-binh-thanh",
+          price_min=None, price_max=None, area_min=50, area_max=80, search_text="Cho thuê căn hộ Bình Thạnh")),
+    # 1 mức giá -> khoảng ±15%
+    ("Bán nhà 3 tỷ",
+     dict(transaction="ban", kind="nha", province="", district="",
+          price_min=2.55 * TY, price_max=3.45 * TY, search_text="Bán nhà")),
+    ("Bán căn hộ q.7 từ 2 đến 4 tỷ",
+     dict(transaction="ban", kind="can-ho", district="quan-7", price_min=2 * TY, price_max=4 * TY)),
+    ("Cho thuê phòng trọ Cầu Giấy Hà Nội dưới 5 triệu",
+     dict(transaction="thue", kind="phong-tro", province="ha-noi", district="quan-cau-giay",
+          price_min=None, price_max=5_000_000)),
+    ("bán đất Thủ Đức trên 100m2",
+     dict(transaction="ban", kind="dat", district="thanh-pho-thu-duc", area_min=100, area_max=None)),
+]
+
+# (câu tìm kiếm, link, url_ok mong đợi)
+URLS = [
+    ("Bán nhà Quận 3 dưới 10 tỷ", "https://batdongsan.com.vn/ban-nha-rieng-duong-tran-quoc-thao-quan-3-pr123456", True),
+    ("Bán nhà Quận 3 dưới 10 tỷ", "https://batdongsan.com.vn/cho-thue-nha-rieng-quan-3-pr123456", False),
+    ("Bán nhà Quận 3 dưới 10 tỷ", "https://batdongsan.com.vn/ban-nha-rieng-duong-3-2-quan-10-pr123456", False),
+    ("Bán nhà Quận 3 dưới 10 tỷ", "https://www.nhatot.com/123456789.htm", True),   # slug không ghi quận -> giữ
+    ("Cho thuê căn hộ Bình Thạnh 50-80m2", "https://batdongsan.com.vn/cho-thue-can-ho-chung-cu-quan-binh-thanh-pr1", True),
+    ("Cho thuê căn hộ Bình Thạnh 50-80m2", "https://batdongsan.com.vn/ban-can-ho-chung-cu-quan-binh-thanh-pr1", False),
+    ("Cho thuê căn hộ Bình Thạnh 50-80m2", "https://batdongsan.com.vn/cho-thue-can-ho-chung-cu-quan-7-pr1", False),
+]
+
+# (câu tìm kiếm, tin đã parse, listing_ok mong đợi)
+ITEMS = [
+    ("Bán nhà Quận 3 dưới 10 tỷ", {"price": "9,5 tỷ"}, True),
+    ("Bán nhà Quận 3 dưới 10 tỷ", {"price": "12 tỷ"}, False),
+    ("Bán nhà Quận 3 dưới 10 tỷ", {"price": "Thỏa thuận"}, True),   # không parse được giá -> giữ
+    ("Cho thuê căn hộ Bình Thạnh 50-80m2", {"area": "65 m²"}, True),
+    ("Cho thuê căn hộ Bình Thạnh 50-80m2", {"area": "120 m²"}, False),
+    ("Bán nhà 3 tỷ", {"price": "3,2 tỷ"}, True),
+    ("Bán nhà 3 tỷ", {"price": "5 tỷ"}, False),
+]
+
+
+def _same(got, want) -> bool:
+    if isinstance(want, (int, float)) and isinstance(got, (int, float)):
+        return abs(got - want) <= 1e-6 * max(1.0, abs(want))
+    return got == want
+
+
+def check() -> list:
+    """Danh sách lỗi (rỗng = mọi case đều đúng)."""
+    errors = []
+    for text, want in QUERIES:
+        q = parse_query(text)
+        for field, value in want.items():
+            got = getattr(q, field)
+            if not _same(got, value):
+                errors.append(f"{text!r}: {field} = {got!r}, mong đợi {value!r}")
+    for text, link, want in URLS:
+        if parse_query(text).url_ok(link) != want:
+            errors.append(f"{text!r}: url_ok({link}) != {want}")
+    for text, item, want in ITEMS:
+        if parse_query(text).listing_ok(item) != want:
+            errors.append(f"{text!r}: listing_ok({item}) != {want}")
+    return errors
+
+
+def test_parse_query():
+    assert check() == []
+
+
+def main():
+    errors = check()
+    for e in errors:
+        print("❌", e)
+    total = sum(len(w) for _, w in QUERIES) + len(URLS) + len(ITEMS)
+    print(f"{total - len(errors)}/{total} kiểm tra đúng")
+    sys.exit(1 if errors else 0)
+
+if __name__ == "__main__":
+    main()
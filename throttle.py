@@ -0,0 +1,243 @@
+# throttle.py
+# Giới hạn tốc độ theo domain (token bucket) + circuit breaker theo (domain, strategy).
+# - acquire(domain): chờ tới khi có token (rate/burst lấy từ SiteSpec, mặc định DOMAIN_RATE req/s).
+# - Breaker: 1 strategy bị chặn (403/CAPTCHA) liên tiếp BREAKER_THRESHOLD lần thì "mở"
+#   trong BREAKER_COOLDOWN giây -> caller chuyển sang strategy khác / site khác.
+#   Hết cool-down -> half-open: cho 1 request thử, thành công thì đóng lại, bị chặn thì mở tiếp.
+from __future__ import annotations
+import os
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+from sites import SITES, normalize_host
+
+DEFAULT_RATE = float(os.getenv("DOMAIN_RATE", "1.0") or "1.0")  # req/s khi site không khai báo
+BREAKER_THRESHOLD = int(os.getenv("BREAKER_THRESHOLD", "3") or "3")
+BREAKER_COOLDOWN = float(os.getenv("BREAKER_COOLDOWN", "300") or "300")
+
+# Thứ tự chuyển strategy khi 1 strategy bị chặn
+STRATEGY_CHAIN = ("requests", "cloudscraper", "playwright")
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = max(0.01, float(rate))
+        self.burst = max(1, int(burst))
+        self._tokens = float(self.burst)
+        self._stamp = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.burst, self._tokens + (now - self._stamp) * self.rate)
+        self._stamp = now
+
+    def acquire(self, timeout: Optional[float] = None) -> bool:
+        """Lấy 1 token; chờ nếu hết. Trả False nếu quá timeout (giây) mà vẫn chưa có token."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return True
+                wait = (1 - self._tokens) / self.rate
+            if deadline is not None:
+                left = deadline - time.monotonic()
+                if left <= 0:
+                    return False
+                wait = min(wait, left)
+            time.sleep(wait)
+
+    def try_acquire(self) -> float:
+        """Không chờ: lấy được token -> 0.0; hết token -> số giây cần chờ (dùng cho code asyncio)."""
+        with self._lock:
+            self._refill(time.monotonic())
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0.0
+            return (1 - self._tokens) / self.rate
+
+    def tokens(self) -> float:
+        with self._lock:
+            self._refill(time.monotonic())
+            return self._tokens
+
+
+class CircuitBreaker:
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, threshold: int = BREAKER_THRESHOLD, cooldown: float = BREAKER_COOLDOWN):
+        self.threshold = max(1, int(threshold))
+        self.cooldown = float(cooldown)
+        self._failures = 0
+        self._opened_at = 0.0
+        self._state = self.CLOSED
+        self._probing = False
+        self._probe_at = 0.0
+        self._last_reason = ""
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.cooldown:
+                self._state = self.HALF_OPEN
+                self._probing = False
+            if self._state == self.HALF_OPEN:
+                now = time.monotonic()
+                # chỉ 1 request thử; request thử "mất tích" quá lâu thì cho thử lại
+                if not self._probing or now - self._probe_at >= 60:
+                    self._probing = True
+                    self._probe_at = now
+                    return True
+            return False
+
+    def peek(self) -> bool:
+        """Như allow() nhưng không chiếm lượt thử half-open (chỉ để kiểm tra trước)."""
+        with self._lock:
+            if self._state == self.CLOSED:
+                return True
+            now = time.monotonic()
+            if self._state == self.OPEN:
+                return now - self._opened_at >= self.cooldown
+            return not self._probing or now - self._probe_at >= 60
+
+    def is_open(self) -> bool:
+        with self._lock:
+            return self._state == self.OPEN and time.monotonic() - self._opened_at < self.cooldown
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._state = self.CLOSED
+            self._probing = False
+
+    def record_block(self, reason: str = "") -> None:
+        with self._lock:
+            self._failures += 1
+            self._last_reason = reason
+            if self._state == self.HALF_OPEN or self._failures >= self.threshold:
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+                self._probing = False
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            left = max(0.0, self.cooldown - (time.monotonic() - self._opened_at)) if self._state == self.OPEN else 0.0
+            return {
+                "state": self._state,
+                "failures": self._failures,
+                "cooldown_left": round(left, 1),
+                "last_reason": self._last_reason,
+            }
+
+
+class DomainThrottle:
+    def __init__(self):
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._breakers: Dict[Tuple[str, str], CircuitBreaker] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(domain: str) -> str:
+        # gom subdomain về domain đã đăng ký (m.batdongsan.com.vn -> batdongsan.com.vn)
+        host = normalize_host(domain)
+        spec = SITES.lookup_host(host)
+        return spec.domain if spec else host
+
+    def bucket(self, domain: str) -> TokenBucket:
+        key = self._key(domain)
+        with self._lock:
+            b = self._buckets.get(key)
+            if b is None:
+                spec = SITES.get(key)
+                b = TokenBucket(spec.rate if spec else DEFAULT_RATE, spec.burst if spec else 1)
+                self._buckets[key] = b
+            return b
+
+    def configure(self, domain: str, rate: float, burst: int = 1) -> TokenBucket:
+        """Đặt rate/burst riêng cho host không có SiteSpec (vd. API gateway của 1 site)."""
+        key = self._key(domain)
+        with self._lock:
+            b = self._buckets[key] = TokenBucket(rate, burst)
+            return b
+
+    def breaker(self, domain: str, strategy: str) -> CircuitBreaker:
+        key = (self._key(domain), strategy)
+        with self._lock:
+            br = self._breakers.get(key)
+            if br is None:
+                br = self._breakers[key] = CircuitBreaker()
+            return br
+
+    def acquire(self, domain: str, timeout: Optional[float] = None) -> bool:
+        return self.bucket(domain).acquire(timeout)
+
+    def try_acquire(self, domain: str) -> float:
+        return self.bucket(domain).try_acquire()
+
+    def allow(self, domain: str, strategy: str) -> bool:
+        return self.breaker(domain, strategy).allow()
+
+    def peek(self, domain: str, strategy: str) -> bool:
+        return self.breaker(domain, strategy).peek()
+
+    def pick_strategy(self, domain: str, preferred: str) -> Optional[str]:
+        """Strategy ưu tiên nếu breaker cho phép, nếu không thì strategy kế tiếp trong chuỗi; None nếu tất cả đang mở."""
+        order = [preferred] + [s for s in STRATEGY_CHAIN if s != preferred]
+        for s in order:
+            if self.allow(domain, s):
+                return s
+        return None
+
+    def peek_strategy(self, domain: str, preferred: str) -> Optional[str]:
+        """Strategy mà pick_strategy sẽ chọn, nhưng không chiếm lượt thử half-open của breaker nào."""
+        order = [preferred] + [s for s in STRATEGY_CHAIN if s != preferred]
+        for s in order:
+            if self.breaker(domain, s).peek():
+                return s
+        return None
+
+    def domain_blocked(self, domain: str) -> bool:
+        """True nếu mọi strategy đã dùng với domain đều đang bị breaker chặn (nên chuyển sang site khác)."""
+        key = self._key(domain)
+        with self._lock:
+            used = [br for (dom, _), br in self._breakers.items() if dom == key]
+        return bool(used) and all(br.is_open() for br in used)
+
+    def record_success(self, domain: str, strategy: str) -> None:
+        self.breaker(domain, strategy).record_success()
+
+    def record_block(self, domain: str, strategy: str, reason: str = "") -> None:
+        self.breaker(domain, strategy).record_block(reason)
+
+    def state(self) -> dict:
+        with self._lock:
+            buckets = dict(self._buckets)
+            breakers = dict(self._breakers)
+        out: dict = {}
+        for dom, b in buckets.items():
+            out.setdefault(dom, {})["tokens"] = round(b.tokens(), 2)
+            out[dom]["rate"] = b.rate
+        for (dom, strat), br in breakers.items():
+            out.setdefault(dom, {}).setdefault("breakers", {})[strat] = br.snapshot()
+        return out
+
+
+# Instance dùng chung cho cả process
+_THROTTLE = DomainThrottle()
+
+acquire = _THROTTLE.acquire
+configure = _THROTTLE.configure
+try_acquire = _THROTTLE.try_acquire
+allow = _THROTTLE.allow
+peek = _THROTTLE.peek
+pick_strategy = _THROTTLE.pick_strategy
+peek_strategy = _THROTTLE.peek_strategy
+domain_blocked = _THROTTLE.domain_blocked
+record_success = _THROTTLE.record_success
+record_block = _THROTTLE.record_block
+state = _THROTTLE.state
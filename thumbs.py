@@ -0,0 +1,250 @@
+# thumbs.py
+# Proxy ảnh + cache thumbnail trên đĩa cho card kết quả.
+# - Ảnh gốc (vài trăm KB - vài MB) chỉ tải 1 lần, resize về THUMB_WIDTH px, nén lại WebP (hoặc JPEG)
+#   -> card chỉ tốn vài KB/ảnh; rerun Streamlit / reload trang Flask đọc thẳng từ đĩa.
+# - Cache LRU theo mtime: vượt THUMB_CACHE_MB thì xoá file dùng lâu nhất.
+# - prefetch(): tải + resize song song ngay khi tin vừa được trích xuất (không chặn luồng crawl).
+# - URL proxy được ký HMAC (thumb_url/verify) -> endpoint /img không thành open proxy. Chưa đặt THUMB_SECRET /
+#   FLASK_SECRET_KEY (hoặc còn "dev-secret") -> không ký, không phục vụ: template dùng thẳng ảnh gốc.
+# - Chỉ tải từ host công khai: tên miền được resolve, mọi IP phải là IP global; redirect được kiểm tra lại từng bước.
+from __future__ import annotations
+import hashlib
+import hmac
+import io
+import ipaddress
+import os
+import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, Optional, Tuple
+from urllib.parse import quote, urljoin, urlparse
+
+import requests
+
+from fetchers import REQ_HEADERS
+from singleflight import SingleFlight
+
+THUMB_DIR = os.getenv("THUMB_DIR", ".thumbs")
+THUMB_WIDTH = int(os.getenv("THUMB_WIDTH", "480") or "480")
+THUMB_QUALITY = int(os.getenv("THUMB_QUALITY", "70") or "70")
+THUMB_CACHE_MB = int(os.getenv("THUMB_CACHE_MB", "200") or "200")
+THUMB_MAX_SRC_MB = int(os.getenv("THUMB_MAX_SRC_MB", "10") or "10")    # bỏ qua ảnh gốc lớn hơn
+THUMB_WORKERS = int(os.getenv("THUMB_WORKERS", "8") or "8")
+THUMB_PREFETCH = os.getenv("THUMB_PREFETCH", "1") != "0"
+THUMB_SECRET = (os.getenv("THUMB_SECRET") or os.getenv("FLASK_SECRET_KEY") or "").encode()
+THUMB_MAX_REDIRECTS = 3
+_WEAK_SECRETS = (b"", b"dev-secret")   # secret rỗng / mặc định công khai: ai cũng ký được URL
+
+_EXT_MIME = {".webp": "image/webp", ".jpg": "image/jpeg", ".img": "application/octet-stream"}
+
+_FLIGHT = SingleFlight()
+_POOL = ThreadPoolExecutor(max_workers=THUMB_WORKERS, thread_name_prefix="thumb")
+_lock = threading.Lock()
+_cache_bytes: Optional[int] = None   # tổng dung lượng cache (ước lượng, tính lại khi dọn)
+
+
+# ---------- URL ký ----------
+def signing_enabled() -> bool:
+    return THUMB_SECRET not in _WEAK_SECRETS
+
+
+def sign(url: str) -> str:
+    return hmac.new(THUMB_SECRET, url.encode("utf-8"), hashlib.sha256).hexdigest()[:20]
+
+
+def verify(url: str, sig: str) -> bool:
+    return signing_enabled() and bool(url) and hmac.compare_digest(sign(url), sig or "")
+
+
+def thumb_url(url: str, route: str = "/img") -> str:
+    """URL proxy (đã ký) cho ảnh gốc; ảnh rỗng -> chuỗi rỗng; chưa có secret -> chính URL ảnh gốc."""
+    if not url:
+        return ""
+    if not signing_enabled():
+        return url
+    return f"{route}?u={quote(url, safe='')}&s={sign(url)}"
+
+
+def _allowed(url: str, resolve: bool = False) -> bool:
+    """
+    Chỉ http(s) tới host công khai (chặn localhost / IP nội bộ).
+    resolve=True: resolve DNS, mọi địa chỉ của host phải là IP global (tên miền trỏ về 10.x / 127.x bị chặn).
+    """
+    p = urlparse(url)
+    if p.scheme not in ("http", "https") or not p.hostname:
+        return False
+    host = p.hostname.lower()
+    if host == "localhost" or host.endswith(".local"):
+        return False
+    try:
+        return ipaddress.ip_address(host).is_global
+    except ValueError:
+        pass
+    if not resolve:
+        return True
+    try:
+        infos = socket.getaddrinfo(host, p.port or (443 if p.scheme == "https" else 80), proto=socket.IPPROTO_TCP)
+    except (OSError, UnicodeError):
+        return False
+    ips = {info[4][0].split("%", 1)[0] for info in infos}
+    return bool(ips) and all(ipaddress.ip_address(ip).is_global for ip in ips)
+
+
+# ---------- Cache trên đĩa ----------
+def _base(url: str, width: int) -> str:
+    h = hashlib.sha1(f"{width}:{url}".encode("utf-8")).hexdigest()
+    return os.path.join(THUMB_DIR, h[:2], h)
+
+
+def _lookup(base: str) -> Optional[Tuple[bytes, str]]:
+    for ext, mime in _EXT_MIME.items():
+        path = base + ext
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except OSError:
+            continue
+        try:
+            os.utime(path)  # đánh dấu vừa dùng (LRU)
+        except OSError:
+            pass
+        return data, mime
+    return None
+
+
+def _store(base: str, ext: str, data: bytes) -> None:
+    global _cache_bytes
+    os.makedirs(os.path.dirname(base), exist_ok=True)
+    tmp = f"{base}.{threading.get_ident()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, base + ext)  # ghi nguyên tử: reader không bao giờ thấy file dở
+    with _lock:
+        if _cache_bytes is not None:
+            _cache_bytes += len(data)
+        over = _cache_bytes is None or _cache_bytes > THUMB_CACHE_MB * 1024 * 1024
+    if over:
+        _evict()
+
+
+def _evict() -> None:
+    """Tính lại dung lượng; vượt hạn mức thì xoá file cũ nhất (theo mtime) tới còn 90%."""
+    global _cache_bytes
+    files = []
+    for root, _, names in os.walk(THUMB_DIR):
+        for n in names:
+            if n.endswith(".tmp"):
+                continue
+            path = os.path.join(root, n)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            files.append((st.st_mtime, st.st_size, path))
+    total = sum(s for _, s, _ in files)
+    limit = THUMB_CACHE_MB * 1024 * 1024
+    if total > limit:
+        files.sort()
+        target = int(limit * 0.9)
+        for _, size, path in files:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+    with _lock:
+        _cache_bytes = total
+
+
+# ---------- Tải + resize ----------
+def _get(url: str) -> requests.Response:
+    """GET stream, tự theo redirect (tối đa THUMB_MAX_REDIRECTS) và kiểm tra lại host ở mỗi bước."""
+    for _ in range(THUMB_MAX_REDIRECTS + 1):
+        if not _allowed(url, resolve=True):
+            raise ValueError(f"URL ảnh không hợp lệ: {url}")
+        p = urlparse(url)
+        headers = dict(REQ_HEADERS)
+        headers["Referer"] = f"{p.scheme}://{p.netloc}/"  # nhiều CDN chặn hotlink theo Referer
+        headers["Accept"] = "image/avif,image/webp,image/*,*/*;q=0.8"
+        r = requests.get(url, headers=headers, timeout=20, stream=True, allow_redirects=False)
+        if not r.is_redirect:
+            return r
+        r.close()
+        url = urljoin(url, r.headers.get("Location", ""))
+    raise ValueError(f"quá nhiều redirect: {url}")
+
+
+def _download(url: str) -> bytes:
+    with _get(url) as r:
+        r.raise_for_status()
+        ctype = r.headers.get("Content-Type", "")
+        if ctype and not ctype.startswith("image/"):
+            raise ValueError(f"not an image: {ctype}")
+        limit = THUMB_MAX_SRC_MB * 1024 * 1024
+        buf = io.BytesIO()
+        for chunk in r.iter_content(64 * 1024):
+            buf.write(chunk)
+            if buf.tell() > limit:
+                raise ValueError("image too large")
+        return buf.getvalue()
+
+
+def _resize(data: bytes, width: int) -> Tuple[bytes, str]:
+    """Resize + nén lại. Không có Pillow -> giữ nguyên ảnh gốc (vẫn được cache)."""
+    try:
+        # pip install pillow
+        from PIL import Image
+    except ImportError:
+        return data, ".img"
+    with Image.open(io.BytesIO(data)) as im:
+        im.draft("RGB", (width, width))  # JPEG: giải mã thẳng ở độ phân giải thấp, nhanh hơn nhiều
+        im = im.convert("RGB")
+        if im.width > width:
+            im.thumbnail((width, width * 4))
+        out = io.BytesIO()
+        try:
+            im.save(out, "WEBP", quality=THUMB_QUALITY, method=4)
+            return out.getvalue(), ".webp"
+        except (OSError, KeyError):  # Pillow build thiếu libwebp
+            out = io.BytesIO()
+            im.save(out, "JPEG", quality=THUMB_QUALITY, optimize=True, progressive=True)
+            return out.getvalue(), ".jpg"
+
+
+def _make(url: str, width: int) -> Tuple[bytes, str]:
+    base = _base(url, width)
+    hit = _lookup(base)
+    if hit:
+        return hit
+    data, ext = _resize(_download(url), width)
+    _store(base, ext, data)
+    return data, _EXT_MIME[ext]
+
+
+def get_thumb(url: str, width: int = THUMB_WIDTH) -> Tuple[bytes, str]:
+    """(bytes, mime) của thumbnail; cache hit chỉ là 1 lần đọc file. Raise nếu URL không hợp lệ / tải lỗi."""
+    if not _allowed(url):
+        raise ValueError(f"URL ảnh không hợp lệ: {url}")
+    hit = _lookup(_base(url, width))
+    if hit:
+        return hit
+    # nhiều request cùng ảnh (vd. prefetch + render) -> chỉ tải 1 lần
+    return _FLIGHT.do((url, width), _make, url, width)
+
+
+def _prefetch_one(url: str, width: int) -> None:
+    try:
+        get_thumb(url, width)
+    except Exception:
+        pass  # prefetch chỉ là tối ưu; lỗi sẽ lộ ra lúc render
+
+
+def prefetch(urls: Iterable[str], width: int = THUMB_WIDTH) -> None:
+    """Tải + resize nền (không chờ). Gọi ngay khi có tin mới để lúc render ảnh đã nằm sẵn trong cache."""
+    if not THUMB_PREFETCH:
+        return
+    for url in urls:
+        if url and _allowed(url):
+            _POOL.submit(_prefetch_one, url, width)